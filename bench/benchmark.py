@@ -0,0 +1,292 @@
+# bench/benchmark.py
+"""
+性能計測用のベンチマーク集。リポジトリのルートで実行する。
+
+    python -m bench.benchmark            # すべて実行
+    python -m bench.benchmark dtype      # 指定したものだけ実行
+"""
+import sys
+import time
+import subprocess
+import random
+import copy
+import pickle
+import statistics
+import numpy as np
+
+from main import make_default_obj
+from neural.nntest1 import NeuralNetTest1
+from util.npjson import npobj2json
+from ea.sharedmem import SharedTestData, attach
+
+
+def make_population(ea, count, mutations=3, seed=0, density=None):
+    """
+    default_objを元に、突然変異を数回かけた個体を count 体作る (シード固定で毎回同じ)。
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    code = npobj2json(make_default_obj(ea.input_size, ea.output_size, density=density))
+    base = ea.get_worker()
+    base.set_code(code)
+    base.post_action()
+
+    workers = []
+    while len(workers) < count:
+        worker = copy.deepcopy(base)
+        for _ in range(random.randint(0, mutations)):
+            worker.mutation()
+        if worker.post_action():
+            workers.append(worker)
+    return workers
+
+
+def evaluate_all(ea, workers, input_list, seed=0):
+    """
+    全個体を同じテストデータで1回ずつ評価し、(スコアのリスト, 経過秒) を返す。
+    init_valueの乱数も個体ごとに同じシードから始める。
+    """
+    scores = []
+    start = time.perf_counter()
+    for index, worker in enumerate(workers):
+        np.random.seed(seed + index)
+        worker.reset_score()
+        worker.init_value()
+        with worker.numeric_scope():
+            ea.evaluation(worker, input_list)
+        scores.append(worker.score_history[-1])
+    return scores, time.perf_counter() - start
+
+
+def bench_dtype(sizes=((10, 3), (200, 50), (1000, 200)), workers_count=20, loops=50):
+    """
+    float64 と float32 で同じ個体・同じテストデータを評価し、
+    時間・変数の値のメモリ量・スコアのずれを比べる。
+    """
+    print("[dtype] float64 vs float32")
+    for input_size, output_size in sizes:
+        ea64 = NeuralNetTest1(loops=loops, input_size=input_size, output_size=output_size, dtype=np.float64)
+        ea32 = NeuralNetTest1(loops=loops, input_size=input_size, output_size=output_size, dtype=np.float32)
+
+        workers64 = make_population(ea64, workers_count)
+        workers32 = []
+        for worker in workers64:
+            clone = ea32.get_worker()
+            clone.set_code(copy.deepcopy(worker).get_code())
+            clone.post_action()
+            workers32.append(clone)
+
+        np.random.seed(1)
+        random.seed(1)
+        input64 = ea64.get_testdata_list()
+        input32 = [{'content': data['content'].astype(np.float32), 'valid': data['valid']} for data in input64]
+
+        scores64, time64 = evaluate_all(ea64, workers64, input64)
+        scores32, time32 = evaluate_all(ea32, workers32, input32)
+        bytes64 = sum(np.asarray(v['value']).nbytes for w in workers64 for v in w.variables.values())
+        bytes32 = sum(np.asarray(v['value']).nbytes for w in workers32 for v in w.variables.values())
+
+        diff = np.abs(np.array(scores64, dtype=np.float64) - np.array(scores32, dtype=np.float64))
+        scale = np.maximum(np.abs(np.array(scores64, dtype=np.float64)), 1)
+        print(f"  size={input_size}x{output_size} "
+              f"time64={time64:.3f}s time32={time32:.3f}s "
+              f"mem64={bytes64}B mem32={bytes32}B "
+              f"score_maxdiff={np.nanmax(diff):.4g} score_meanrel={np.nanmean(diff / scale):.3g} "
+              f"exact={int(np.count_nonzero(diff == 0))}/{len(diff)}")
+
+
+def value_nbytes(value, seen=None):
+    """
+    変数の値が実際に確保しているメモリ量。疎行列なら保持している配列の合計。
+    ビュー (broadcast_leaf など) は元の配列の大きさで数える (論理的な shape の大きさではなく)。
+    seen (set) を渡すと、記録済みの配列は数えない (個体間で共有している値を重複して数えないように)。
+    """
+    if hasattr(value, 'data') and hasattr(value, 'indices'):
+        arrays = [value.data, value.indices, value.indptr]
+    else:
+        arrays = [np.asarray(value)]
+    total = 0
+    for array in arrays:
+        while isinstance(array.base, np.ndarray):
+            array = array.base
+        if seen is not None:
+            if id(array) in seen:
+                continue
+            seen.add(id(array))
+        total += array.nbytes
+    return total
+
+
+def bench_sparse(sizes=((1000, 200), (3000, 1000)), densities=(None, 0.05, 0.01), workers_count=5, loops=5):
+    """
+    edge を密な行列で持つ場合と、密度 density の疎行列で持つ場合の時間・メモリ量を比べる。
+    メモリ量は評価後に全個体の変数の値が実際に確保している量 (共有している配列は1回だけ数える)。
+    (疎行列ではスコア自体が変わるので、スコアの比較は行わない)
+    """
+    print("[sparse] dense vs CSR edge")
+    for input_size, output_size in sizes:
+        for density in densities:
+            ea = NeuralNetTest1(loops=loops, input_size=input_size, output_size=output_size)
+            workers = make_population(ea, workers_count, density=density)
+            np.random.seed(1)
+            random.seed(1)
+            input_list = ea.get_testdata_list()
+            _, elapsed = evaluate_all(ea, workers, input_list)
+            seen = set()
+            nbytes = sum(value_nbytes(v['value'], seen) for w in workers for v in w.variables.values())
+            print(f"  size={input_size}x{output_size} density={density} sparse={workers[0].use_sparse} "
+                  f"time={elapsed:.3f}s mem={nbytes}B")
+
+
+def bench_shared(sizes=((10, 3), (200, 50)), loops=1000, workers_count=30, processes=2, repeat=5):
+    """
+    子プロセス評価でテストデータを毎回pickleで渡す場合と、共有メモリのハンドルだけを渡す場合を比べる。
+    1タスクあたりに送るバイト数・受け取り側の復元時間と、exec_epoch相当の評価全体の時間を計る。
+    評価全体の時間は差が小さくばらつきに埋もれやすいので、順番を入れ替えながら repeat 回ずつ計り中央値を出す。
+    """
+    print("[shared] pickle vs shared memory")
+    for input_size, output_size in sizes:
+        ea = NeuralNetTest1(loops=loops, input_size=input_size, output_size=output_size)
+        workers = make_population(ea, workers_count)
+        np.random.seed(1)
+        random.seed(1)
+        input_list = ea.get_testdata_list()
+
+        pickled = pickle.dumps(input_list)
+        start = time.perf_counter()
+        for _ in range(workers_count):
+            pickle.loads(pickle.dumps(input_list))
+        pickle_time = time.perf_counter() - start
+
+        with SharedTestData(input_list) as shared:
+            handle = pickle.dumps(shared.handle)
+            start = time.perf_counter()
+            for _ in range(workers_count):
+                attach(pickle.loads(handle))
+            shared_time = time.perf_counter() - start
+
+        elapsed = {False: [], True: []}
+        ea.processes = processes
+        ea.share_testdata_min_bytes = 0
+        ea.get_process_pool()  # プールの起動時間は含めない
+        for index in range(repeat):
+            for share in ((False, True) if index % 2 == 0 else (True, False)):
+                ea.share_testdata = share
+                targets = [copy.deepcopy(worker) for worker in workers]
+                for worker in targets:
+                    worker.reset_score()
+                    worker.init_value()
+                start = time.perf_counter()
+                ea.evaluate_parallel(targets, input_list)
+                elapsed[share].append(time.perf_counter() - start)
+        ea.close_process_pool()
+        elapsed = {share: statistics.median(times) for share, times in elapsed.items()}
+
+        print(f"  size={input_size}x{output_size} loops={loops} "
+              f"task_bytes pickle={len(pickled)}B shared={len(handle)}B "
+              f"decode x{workers_count} pickle={pickle_time:.3f}s shared={shared_time:.3f}s "
+              f"evaluate pickle={elapsed[False]:.3f}s shared={elapsed[True]:.3f}s")
+
+
+def bench_startup(workers_count=110, repeat=5):
+    """
+    main.py の import にかかる時間 (別プロセスで計測) と、初期集団の作成時間を計る。
+    初期集団は、全個体で set_code() する場合と init_workers() (コードごとに1回だけ解析) を比べる。
+    """
+    print("[startup] import and population initialization")
+    import_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import main'], check=True)
+        import_times.append(time.perf_counter() - start)
+
+    code = npobj2json(make_default_obj(10, 3))
+    ea = NeuralNetTest1(codelist=[code], default_code=code, workers_count=workers_count)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _ in range(workers_count):
+            ea.get_worker().set_code(code)
+    parse_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ea.init_workers()
+    init_time = (time.perf_counter() - start) / repeat
+
+    print(f"  import main={min(import_times):.3f}s (python起動を含む) "
+          f"workers={workers_count} set_code_each={parse_time:.4f}s init_workers={init_time:.4f}s")
+
+
+def bench_constopt(workers_count=5, loops=50):
+    """
+    定数の調整で、1秒あたりに評価できる候補数を比べる。
+    'random' は tuning() した子を1体ずつ評価、'batch' は optimize_constants() で候補を一括計算する。
+    """
+    print("[constopt] random tuning vs batched constant optimization")
+    ea = NeuralNetTest1(loops=loops)
+    winners = make_population(ea, workers_count)
+    np.random.seed(1)
+    random.seed(1)
+    input_list = ea.get_testdata_list()
+
+    candidates = 0
+    start = time.perf_counter()
+    for winner in winners:
+        for _ in range(ea.const_opt_population * ea.const_opt_generations):
+            child = copy.deepcopy(winner)
+            child.tuning()
+            child.post_action()
+            evaluate_all(ea, [child], input_list)
+            candidates += 1
+    random_rate = candidates / (time.perf_counter() - start)
+
+    ea.const_opt_stats = {'optimized': 0, 'improved': 0, 'candidates': 0}
+    start = time.perf_counter()
+    for winner in winners:
+        ea.optimize_constants(winner, input_list)
+    batch_rate = ea.const_opt_stats['candidates'] / (time.perf_counter() - start)
+
+    print(f"  candidates/s random={random_rate:.1f} batch={batch_rate:.1f} "
+          f"improved={ea.const_opt_stats['improved']}/{ea.const_opt_stats['optimized']}")
+
+
+def bench_compact(workers_count=10000):
+    """
+    1個体あたりのメモリ量 (変数の値を除く、tracemallocで計測) と clone() の時間を計る。
+    """
+    import tracemalloc
+    print("[compact] per-worker memory and clone time")
+    ea = NeuralNetTest1()
+    base = make_population(ea, 1)[0]
+    base.add_score(1.0)
+
+    start = time.perf_counter()
+    clones = [base.clone() for _ in range(workers_count)]
+    clone_time = time.perf_counter() - start
+    del clones
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    clones = [base.clone() for _ in range(workers_count)]
+    total = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    values = sum(value_nbytes(variable['value']) for variable in base.variables.values())
+
+    print(f"  workers={len(clones)} bytes/worker={total / workers_count:.0f} "
+          f"(values={values}) clone={clone_time / workers_count * 1e6:.1f}us/worker")
+
+
+BENCHMARKS = {
+    'dtype': bench_dtype,
+    'sparse': bench_sparse,
+    'shared': bench_shared,
+    'startup': bench_startup,
+    'constopt': bench_constopt,
+    'compact': bench_compact,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -2,17 +2,58 @@
 
 import copy
 import random
-import heapq
 import traceback
-from collections import defaultdict
+import numpy as np
 from datetime import datetime
 import string
+import atexit
+import hashlib
+import itertools
+import time
+
+from ea.leaderboard import Leaderboard
+from ea.surrogate import SurrogateModel
+from ea.testdata import iter_chunks
+from gp.population import PopulationEngine
+from gp.varpool import VariablePool
+from gp.subtree import SubtreeIndex
+from gp.profiler import OpProfiler
+from ea.scheduler import OperatorScheduler
+from gp import sparse
 
 CONST = 0
 VAR = 1
 FUNC = 2
 GVAL = 3
 
+# 評価プロセス側で使うEA (プロセス起動時に1回だけ受け取る)
+_process_ea = None
+
+
+def _init_process(ea):
+    global _process_ea
+    _process_ea = ea
+
+
+def _evaluate_in_process(worker, testdata):
+    """
+    評価プロセスで1個体を評価し、親プロセスに書き戻す結果 (評価にかかった時間を含む) を返す。
+    testdata は共有メモリのハンドル(dict)か、input_list そのもの(リスト)。
+    """
+    from ea.sharedmem import attach
+    input_list = attach(testdata) if isinstance(testdata, dict) else testdata
+    start = time.perf_counter()
+    try:
+        with worker.numeric_scope():
+            _process_ea.evaluation(worker, input_list)
+            worker.check_numeric()
+    except Exception:
+        return None, traceback.format_exc()
+    values = {key: variable['value'] for key, variable in worker.variables.items()}
+    return (worker.score_history, worker.progress, worker.numeric_valid, values,
+            time.perf_counter() - start), None
+
+
 class BaseEA():
     """
     遺伝的アルゴリズム(進化計算)を行うための基底クラス。
@@ -21,8 +62,19 @@ class BaseEA():
     def __init__(self, codelist=None, default_code="", diversity=5, attempts_count=10,
                  workers_count=10, shuffle_interval=10, loops=10):
         self.workers = []
-        self.crossover_ratio = 0.2
+        # 子の作り方の割合 (勝者以外の枠に対して)。残りは mutation で埋める
+        self.crossover_ratio = 0.2           # 変数の入れ替え
+        self.subtree_crossover_ratio = 0.0   # 部分木交叉
         self.tuning_ratio = 0.1
+
+        # 定数の調整方法: 'random' は tuning() (定数をランダムに置き換えた子を1体ずつ評価)、
+        # 'batch' は勝者ごとに定数をまとめたベクトルを (1+λ)-ES で最適化し、最良の定数を持つ子を作る
+        # (候補は同じ構造なので PopulationEngine で一括計算する)
+        self.tuning_mode = 'random'
+        self.const_opt_population = 16   # 1世代あたりの候補数 (λ)
+        self.const_opt_generations = 3
+        self.const_opt_sigma = 2.0       # 摂動の標準偏差の初期値
+        self.const_opt_stats = {'optimized': 0, 'improved': 0, 'candidates': 0}
         self.init_codelist = codelist
         self.default_code = default_code
         self.diversity = diversity
@@ -30,35 +82,164 @@ class BaseEA():
         self.workers_count = workers_count
         self.shuffle_interval = shuffle_interval
         self.loops = loops
+        # 系統ごとの最良個体を保持するランキング (スコア確定時に逐次更新)
+        self.leaderboard = Leaderboard()
+
+        # レーシング評価: 試行ごとに途中スコアを比べ、上位系統に入れない個体の評価を打ち切る
+        self.racing = False
+        self.racing_min_attempts = 2   # この試行回数までは打ち切らない
+        self.racing_z = 2.0            # 信頼区間の幅 (標準誤差の何倍か)
+        self.racing_stats = {'aborted': 0, 'saved_evals': 0}
+
+        # サロゲートによる事前選別: 子を多めに作り、予測スコア上位だけを評価に回す
+        self.use_surrogate = False
+        self.surrogate = None
+        self.surrogate_oversample = 2.0     # 生成する子の倍率 (勝者を除く部分)
+        self.surrogate_min_samples = 50     # 学習データがこれ未満の間は選別しない
+        self.surrogate_explore_ratio = 0.1  # 予測に関係なくランダムに残す割合
+        self.surrogate_stats = {'screened': 0}
+
+        # 勝者の選び方: 'top' (スコア順), 'lexicographic' (同点ならノード数が少ない方),
+        # 'double_tournament' (fitness→サイズの二段トーナメント)
+        self.selection = 'top'
+        self.parsimony_resolution = 1.0   # lexicographic で同点とみなすスコアの刻み
+        self.tournament_size = 3
+        self.parsimony_pressure = 0.7     # double_tournament で小さい方を選ぶ確率
+        self.size_stats = {'mean': 0, 'max': 0}
+
+        # 同じ構造の個体をまとめて一括計算する (PopulationEngine)
+        self.vectorize = False
+        self.population_engine = PopulationEngine()
+
+        # 評価中にNaN/infを出した個体に与えるスコア (個体ごとの例外処理はせず、世代の最後にまとめて付ける)
+        self.invalid_score = -1000000000
+        self.invalid_count = 0
+
+        # テストデータを stream_chunk_size 件ずつ取り出して評価する (Noneなら1試行分をまとめて評価)
+        # 有効にする場合は begin_evaluation / evaluate_chunk / end_evaluation を実装すること
+        self.stream_chunk_size = None
+
+        # processes > 0 なら、その数の子プロセスで個体を並列に評価する (vectorize/ストリーミングとは併用しない)
+        # share_testdata がTrueなら試行ごとのテストデータを共有メモリに1回だけ書き、ハンドルだけを渡す
+        # (テストデータが share_testdata_min_bytes 未満なら pickle で渡す方が速いので共有メモリは使わない)
+        self.processes = 0
+        self.share_testdata = False
+        self.share_testdata_min_bytes = 1 << 20
+        self.process_pool = None
+
+        # profile_ops がTrueなら全個体で1つの OpProfiler を共有し、演算ごとの回数・時間などを数える
+        # (世代ごとと全体の集計を、時間の長い順に表示する。vectorize/子プロセスで計算した分は含まない)
+        self.profile_ops = False
+        self.op_profiler = None
+
+        # 意味的な重複の除去: 評価の前に全個体を小さな固定のプローブ (probe_size 件) で計算し、
+        # SINK_VARIABLESの値を probe_decimals 桁に丸めたハッシュ (振る舞いハッシュ) が同じ個体は
+        # 最初の1体だけを評価して、残りはそのスコア・progressを引き継ぐ
+        self.semantic_dedupe = False
+        self.probe_size = 8
+        self.probe_decimals = 6
+        self.probe_seed = 0           # プローブでの init_value() の乱数 (全個体で同じ初期値にする)
+        self.probe_input_list = None  # プローブの入力 (最初に使うときに get_testdata_list() から作る)
+        self.dedupe_stats = {'inherited': 0}
+
+        # multi-fidelity: 子をまず小さい問題 (fidelity_levels の順) で安く評価し、上位 promote_ratio だけを
+        # 次の段階、最後は本来の設定での評価に進める。残りの子は評価せずに捨てる (その分、子を多めに作る)
+        # 各段階は {'settings': {...}, 'attempts': 1, 'promote_ratio': 0.5} の辞書。
+        # settings はその段階だけ上書きするEAの属性 ex) {'input_size': 4, 'output_size': 2, 'loops': 3}
+        # 個体は get_defined_shapes() のサイズに resize() した複製で評価する
+        self.fidelity_levels = []
+        self.fidelity_stats = []
+        self.winner_count = 0
+
+        # 評価の予算: 1世代で1個体の評価にかける時間(秒)の上限と、1サンプルあたりの見積もり演算量
+        # (GPBase.estimate_flops) の上限。Noneなら制限しない。超えた個体は評価を打ち切って
+        # budget_penalty_score (Noneなら invalid_score) を付け、fingerprint を隔離する
+        # (隔離した fingerprint の子は以降の世代で作らない。古いものから quarantine_size 件まで保持)
+        self.eval_time_budget = None
+        self.flop_budget = None
+        self.budget_penalty_score = None
+        self.quarantine = {}
+        self.quarantine_size = 10000
+        self.budget_stats = {'aborted': 0, 'rejected': 0}
+
+        # adaptive_operators がTrueなら、crossover_ratio/subtree_crossover_ratio/tuning_ratio を世代ごとに
+        # OperatorScheduler (改善量/CPU時間 のバンディット) の割合で置き換える (残りは mutation)
+        self.adaptive_operators = False
+        self.operator_scheduler = None
+        self.operator_ratios = {}
+        self.winner_ids = set()
 
     def get_worker(self, code=None, majorid=""):
         raise NotImplementedError()
 
     def get_testdata_list(self):
+        # 1試行分のテストデータ。リストのほか、ジェネレータなどのイテレータでもよい
         raise NotImplementedError()
 
     def evaluation(self, worker, input_list):
         raise NotImplementedError()
 
+    def begin_evaluation(self, worker, length):
+        # ストリーミング評価の開始。length件のテストデータを評価するための途中状態を返す
+        raise NotImplementedError()
+
+    def evaluate_chunk(self, worker, state, chunk):
+        # テストデータの一部 (chunk) を評価し、state を更新する
+        raise NotImplementedError()
+
+    def end_evaluation(self, worker, state):
+        # ストリーミング評価の終了。state からスコアを確定する
+        raise NotImplementedError()
+
+    def get_size_penalty(self, worker):
+        # 評価で1回ごとのスコアから引く、個体の大きさのペナルティ (振る舞いが同じ個体に結果を引き継ぐときに付け替える)
+        return 0
+
+    def get_defined_shapes(self):
+        # 個体の defined_shapes (multi-fidelity で段階ごとのサイズに resize() するときに使う)。Noneならresizeしない
+        return None
+
+    def get_input_values(self, data):
+        # テストデータ1件から、set_values() に渡す入力を作る
+        return {'input': data['content']}
+
     def get_children(self):
         # 優秀な個体(系統)を抽出し、Crossover/Tuning/Mutationで子を作る
-        def append_worker(w_list, new_worker):
+        def append_worker(w_list, new_worker, start=None):
+            # start: 子を作り始めた時刻 (perf_counter)。あれば作るのにかかった時間を操作ごとに記録する
             new_worker.common_mutation()
             action_result = new_worker.post_action()
+            if start is not None and self.operator_scheduler is not None:
+                self.operator_scheduler.add_cost(new_worker.origin, time.perf_counter() - start)
+            if action_result and new_worker.fingerprint in self.quarantine:
+                self.budget_stats['rejected'] += 1
+                return
             if action_result and not any(worker.fingerprint == new_worker.fingerprint for worker in w_list):
                 w_list.append(new_worker)
 
+        if self.adaptive_operators:
+            self.apply_operator_ratios()
         winner_list = self.get_winner_list()
+        self.winner_ids = set(id(winner) for winner in winner_list)
+
+        # サロゲートが使える状態なら、勝者以外の子を多めに作る
+        screening = (self.use_surrogate and self.surrogate is not None
+                     and len(self.surrogate) >= self.surrogate_min_samples)
+        # multi-fidelity の段階で絞り込む分も多めに作る
+        fidelity_oversample = 1.0
+        for level in self.fidelity_levels:
+            fidelity_oversample /= level['promote_ratio']
+        screened_count = len(winner_list) + int((self.workers_count - len(winner_list)) * fidelity_oversample)
+        children_count = screened_count
+        if screening:
+            children_count = len(winner_list) + int((screened_count - len(winner_list)) * self.surrogate_oversample)
+        self.winner_count = len(winner_list)
 
         children = []
-        all_variables = {}
         for winner in winner_list:
             append_worker(children, winner)
-            for name, variable in winner.variables.items():
-                if name not in all_variables:
-                    all_variables[name] = [variable]
-                else:
-                    all_variables[name].append(variable)
+        # 勝者の変数を内容ごとにまとめたプール (交叉の子は変数を深くコピーせずに共有する)
+        pool = VariablePool(winner_list)
 
         # Crossover
         fixed_var_names = []
@@ -66,33 +247,16 @@ class BaseEA():
             if var['fixed']:
                 fixed_var_names.append(name)
         
-        crossover_limit = int((self.workers_count - len(winner_list)) * self.crossover_ratio)
+        crossover_limit = int((children_count - len(winner_list)) * self.crossover_ratio)
         counter = 0
         while len(children) < (crossover_limit + len(winner_list)) and counter < 100:
             for winner in winner_list:
                 try:
-                    child = copy.deepcopy(winner)
-                    new_variables = {}
-                    for name in fixed_var_names:
-                        new_variables[name] = copy.deepcopy(random.choice(all_variables[name]))
-
-                    def dfs_add_missing_var(variables, node):
-                        if node['type'] == FUNC:
-                            for arg in node['args']:
-                                dfs_add_missing_var(variables, arg)
-                        elif node['type'] == VAR:
-                            var_name = node['content']
-                            if var_name not in variables:
-                                variables[var_name] = copy.deepcopy(random.choice(all_variables[var_name]))
-                                dfs_add_missing_var(variables, variables[var_name]['logic'])
-
-                    new_variables_temp = copy.deepcopy(new_variables)
-                    for nm, vr in new_variables_temp.items():
-                        if vr['logic']:
-                            dfs_add_missing_var(new_variables, vr['logic'])
-
-                    child.variables = new_variables
-                    append_worker(children, child)
+                    start = time.perf_counter()
+                    child = winner.clone(variables=pool.make_variables(pool.assemble(fixed_var_names)))
+                    child.origin = 'crossover'
+                    child.parent_score = winner.score
+                    append_worker(children, child, start)
                 except Exception as e:
                     print("small Mutation Error!")
                     print(e)
@@ -100,15 +264,63 @@ class BaseEA():
                     exit()
             counter += 1
 
+        # Subtree crossover
+        subtree_limit = int((children_count - len(winner_list)) * (self.crossover_ratio + self.subtree_crossover_ratio))
+        if len(children) < (subtree_limit + len(winner_list)):
+            # 勝者の部分木をshapeごとにまとめた索引 (donorの検索用)
+            subtree_index = SubtreeIndex(winner_list)
+        counter = 0
+        while len(children) < (subtree_limit + len(winner_list)) and counter < 100:
+            for winner in winner_list:
+                try:
+                    start = time.perf_counter()
+                    child = winner.clone()
+                    if not child.subtree_crossover(subtree_index):
+                        if self.operator_scheduler is not None:
+                            self.operator_scheduler.add_cost('subtree', time.perf_counter() - start)
+                        continue
+                    child.origin = 'subtree'
+                    child.parent_score = winner.score
+                    append_worker(children, child, start)
+                except Exception as e:
+                    print("Subtree Crossover Error!")
+                    print(e)
+                    traceback.print_exc()
+                    exit()
+            counter += 1
+
         # Tuning
-        tuning_limit = int((self.workers_count - len(winner_list)) * (self.crossover_ratio + self.tuning_ratio))
+        tuning_limit = int((children_count - len(winner_list))
+                           * (self.crossover_ratio + self.subtree_crossover_ratio + self.tuning_ratio))
+        if self.tuning_mode == 'batch':
+            # 勝者ごとに1体、定数を最適化した子を作る (改善しなかった勝者の分はMutationで埋まる)
+            self.const_opt_stats = {'optimized': 0, 'improved': 0, 'candidates': 0}
+            tuning_input = None
+            for winner in winner_list:
+                if len(children) >= (tuning_limit + len(winner_list)):
+                    break
+                if tuning_input is None:
+                    tuning_input = list(self.get_testdata_list())
+                try:
+                    start = time.perf_counter()
+                    child = self.optimize_constants(winner, tuning_input)
+                    if child is not None:
+                        append_worker(children, child, start)
+                except Exception as e:
+                    print("Tuning Error!")
+                    print(e)
+                    traceback.print_exc()
+                    exit()
         counter = 0
-        while len(children) < (tuning_limit + len(winner_list)) and counter < 100:
+        while self.tuning_mode != 'batch' and len(children) < (tuning_limit + len(winner_list)) and counter < 100:
             for winner in winner_list:
                 try:
-                    child = copy.deepcopy(winner)
+                    start = time.perf_counter()
+                    child = winner.clone()
                     child.tuning()
-                    append_worker(children, child)
+                    child.origin = 'tuning'
+                    child.parent_score = winner.score
+                    append_worker(children, child, start)
                 except Exception as e:
                     print("Tuning Error!")
                     print(e)
@@ -117,12 +329,15 @@ class BaseEA():
             counter += 1
 
         # Mutation
-        while len(children) < self.workers_count:
+        while len(children) < children_count:
             for winner in winner_list:
                 try:
-                    child = copy.deepcopy(winner)
+                    start = time.perf_counter()
+                    child = winner.clone()
                     child.mutation()
-                    append_worker(children, child)
+                    child.origin = 'mutation'
+                    child.parent_score = winner.score
+                    append_worker(children, child, start)
                 except Exception as e:
                     print("Major Mutation Error!")
                     print(e)
@@ -130,34 +345,336 @@ class BaseEA():
                     print(winner.variables)
                     exit()
 
+        if screening:
+            children = self.screen_children(children, len(winner_list), screened_count)
         return children
 
+    def quarantine_worker(self, worker):
+        """
+        予算を超えた個体の fingerprint を隔離する (同じ個体を子として作り直さないように)。
+        """
+        self.budget_stats['aborted'] += 1
+        self.quarantine.pop(worker.fingerprint, None)
+        self.quarantine[worker.fingerprint] = True
+        while len(self.quarantine) > self.quarantine_size:
+            self.quarantine.pop(next(iter(self.quarantine)))
+
+    def get_behavior_hash(self, worker):
+        """
+        プローブの入力で worker を計算し、SINK_VARIABLESの値を probe_decimals 桁に丸めてハッシュにする。
+        NaN/inf になった場合や計算できない場合はNone (重複とみなさない)。
+        乱数の状態はプローブの前後で元に戻すので、進化の乱数列には影響しない。
+        """
+        py_state = random.getstate()
+        np_state = np.random.get_state()
+        try:
+            if self.probe_input_list is None:
+                self.probe_input_list = [self.get_input_values(data) for data in
+                                         itertools.islice(self.get_testdata_list(), self.probe_size)]
+            np.random.seed(self.probe_seed)
+            worker.init_value()
+            m = hashlib.sha1()
+            with worker.numeric_scope():
+                for input_values in self.probe_input_list:
+                    worker.set_values(input_values)
+                    worker.exec_calc()
+                    for key in worker.SINK_VARIABLES:
+                        value = np.asarray(sparse.to_dense(worker.variables[key]['value']), dtype=np.float64)
+                        if not np.isfinite(value).all():
+                            return None
+                        # -0.0 と 0.0 を同じにするため 0.0 を足す
+                        m.update(str(value.shape).encode())
+                        m.update((np.round(value, self.probe_decimals) + 0.0).tobytes())
+            return m.hexdigest()
+        except Exception:
+            return None
+        finally:
+            worker.numeric_valid = True
+            random.setstate(py_state)
+            np.random.set_state(np_state)
+
+    def dedupe_by_behavior(self, workers):
+        """
+        振る舞いハッシュで workers をまとめ、評価する個体と、結果を引き継ぐ個体を分ける。
+
+        Returns:
+        --------
+        (list, list)
+            (評価する個体, [(引き継ぐ個体, 引き継ぎ元の個体), ...])
+        """
+        representatives = {}
+        evaluated = []
+        duplicates = []
+        for worker in workers:
+            behavior = self.get_behavior_hash(worker)
+            source = representatives.get(behavior) if behavior is not None else None
+            if source is None:
+                if behavior is not None:
+                    representatives[behavior] = worker
+                evaluated.append(worker)
+            else:
+                duplicates.append((worker, source))
+        self.dedupe_stats = {'inherited': len(duplicates)}
+        return evaluated, duplicates
+
+    def screen_by_fidelity(self, workers):
+        """
+        multi-fidelity の選別。fidelity_levels の段階ごとに、勝者以外の個体の複製を
+        その段階の設定 (settings・attempts) で評価し、平均スコアの上位 promote_ratio だけを次へ進める。
+        先頭 winner_count 個体(勝者)は必ず残す。段階ごとの評価数・通過数を fidelity_stats に記録する。
+        """
+        elites = workers[:self.winner_count]
+        candidates = workers[self.winner_count:]
+        slots = self.workers_count - len(elites)
+        self.fidelity_stats = []
+        for index, level in enumerate(self.fidelity_levels):
+            if index == len(self.fidelity_levels) - 1:
+                keep = slots
+            else:
+                keep = int(len(candidates) * level['promote_ratio'])
+            if len(candidates) <= keep:
+                self.fidelity_stats.append({'evaluated': 0, 'promoted': len(candidates)})
+                continue
+            scores = self.evaluate_fidelity(candidates, level)
+            order = np.argsort(-scores, kind='stable')[:keep]
+            self.fidelity_stats.append({'evaluated': len(candidates), 'promoted': len(order)})
+            candidates = [candidates[i] for i in sorted(order)]
+        return elites + candidates
+
+    def evaluate_fidelity(self, workers, level):
+        """
+        level の設定で workers を評価した平均スコアを返す (評価できなかった個体は -inf)。
+        個体は複製を get_defined_shapes() のサイズに resize() して評価するので、元の個体は変わらない。
+        選別のための評価は世代の集計に含めないので、PopulationEngine の stats は評価後に元に戻す。
+        """
+        saved = {name: getattr(self, name) for name in level.get('settings', {})}
+        saved_stats = dict(self.population_engine.stats)
+        for name, value in level.get('settings', {}).items():
+            setattr(self, name, value)
+        try:
+            defined_shapes = self.get_defined_shapes()
+            scores = np.full(len(workers), -np.inf)
+            reduced = {}
+            for index, worker in enumerate(workers):
+                copy_worker = worker.clone()
+                if defined_shapes is not None and defined_shapes != worker.defined_shapes:
+                    if not copy_worker.resize(defined_shapes):
+                        continue
+                copy_worker.reset_score()
+                copy_worker.reset_progress()
+                reduced[index] = copy_worker
+
+            active_workers = list(reduced.values())
+            for _ in range(level.get('attempts', 1)):
+                input_list = list(self.get_testdata_list())
+                for copy_worker in active_workers:
+                    copy_worker.init_value()
+                for copy_worker in self.evaluate_all(active_workers, input_list):
+                    active_workers.remove(copy_worker)
+
+            active_ids = set(id(copy_worker) for copy_worker in active_workers)
+            for index, copy_worker in reduced.items():
+                if id(copy_worker) in active_ids and copy_worker.numeric_valid:
+                    with copy_worker.numeric_scope():
+                        copy_worker.average_score()
+                    scores[index] = copy_worker.score
+            return scores
+        finally:
+            for name, value in saved.items():
+                setattr(self, name, value)
+            self.population_engine.stats = saved_stats
+
+    def apply_operator_ratios(self):
+        """
+        OperatorScheduler の割合を子の作り方の割合 (crossover_ratio など) に反映する。
+        前の世代までの記録から割合を決めてから、記録を減衰させる。
+        """
+        if self.operator_scheduler is None:
+            self.operator_scheduler = OperatorScheduler(['crossover', 'subtree', 'tuning', 'mutation'])
+        self.operator_ratios = self.operator_scheduler.ratios()
+        self.crossover_ratio = self.operator_ratios['crossover']
+        self.subtree_crossover_ratio = self.operator_ratios['subtree']
+        self.tuning_ratio = self.operator_ratios['tuning']
+        self.operator_scheduler.next_epoch()
+
+    def record_operator_results(self):
+        """
+        スコアが確定した子 (勝者を除く) の、親からの改善量と評価時間を OperatorScheduler に記録する。
+        """
+        for worker in self.workers:
+            if id(worker) in self.winner_ids:
+                continue
+            self.operator_scheduler.add_result(worker.origin, worker.score - worker.parent_score, worker.eval_time)
+
+    def optimize_constants(self, winner, input_list):
+        """
+        勝者の定数(CONST)をまとめたベクトルを (1+λ)-ES で最適化し、最良の定数を持つ子を返す。
+        定数が無ければNone。
+
+        - 候補は勝者と同じ構造なので、PopulationEngine で全候補を一括計算してから evaluation() で採点する
+        - 全候補を同じテストデータ・同じ init_value() の値で評価するので、スコアを直接比べられる
+        - 改善すれば摂動の幅(σ)を広げ、改善しなければ狭める
+        """
+        base = winner.clone()
+        vector = base.get_constants()
+        if len(vector) == 0:
+            return None
+        base.reset_score()
+        base.reset_progress()
+        base.init_value()
+        engine = PopulationEngine()
+        input_values_list = [self.get_input_values(data) for data in input_list]
+
+        def evaluate_vectors(vectors):
+            candidates = []
+            for candidate_vector in vectors:
+                candidate = base.clone_for_evaluation()
+                candidate.set_constants(candidate_vector)
+                candidates.append(candidate)
+            engine.prepare(candidates, input_values_list)
+            scores = np.full(len(candidates), -np.inf)
+            for index, candidate in enumerate(candidates):
+                try:
+                    with candidate.numeric_scope():
+                        self.evaluation(candidate, input_list)
+                    if candidate.check_numeric():
+                        scores[index] = candidate.score_history[-1]
+                except Exception:
+                    pass
+                candidate.replay = None
+            self.const_opt_stats['candidates'] += len(candidates)
+            return scores
+
+        best_score = evaluate_vectors([vector])[0]
+        initial_score = best_score
+        sigma = self.const_opt_sigma
+        for _ in range(self.const_opt_generations):
+            samples = vector + sigma * np.random.randn(self.const_opt_population, len(vector))
+            scores = evaluate_vectors(samples)
+            index = int(np.argmax(scores))
+            if scores[index] > best_score:
+                best_score = scores[index]
+                vector = samples[index]
+                sigma *= 1.5
+            else:
+                sigma *= 0.5
+
+        self.const_opt_stats['optimized'] += 1
+        if best_score > initial_score:
+            self.const_opt_stats['improved'] += 1
+        child = winner.clone()
+        child.set_constants(vector)
+        child.origin = 'tuning'
+        child.parent_score = winner.score
+        return child
+
+    def screen_children(self, children, elite_count, target_count=None):
+        """
+        サロゲートの予測スコアで子を選別し、target_count (省略時は workers_count) 個体に絞る。
+        先頭 elite_count 個体(勝者)は必ず残し、一部はランダムに残して探索性を保つ。
+        """
+        elites = children[:elite_count]
+        candidates = children[elite_count:]
+        slots = (target_count or self.workers_count) - len(elites)
+        if len(candidates) <= slots:
+            return children
+
+        predicted = self.surrogate.predict(candidates)
+        order = list(np.argsort(-predicted, kind='stable'))
+        explore_count = int(slots * self.surrogate_explore_ratio)
+        selected = order[:slots - explore_count]
+        rest = order[slots - explore_count:]
+        selected += random.sample(rest, explore_count)
+
+        self.surrogate_stats['screened'] = len(candidates) - slots
+        return elites + [candidates[i] for i in sorted(selected)]
+
+    def train_surrogate(self):
+        """
+        評価が終わった個体でサロゲートを学習し直す。
+        """
+        if self.surrogate is None:
+            self.surrogate = SurrogateModel(list(self.workers[0].FUNC_MASTER))
+        for worker in self.workers:
+            # 予算超過の個体のスコアはペナルティで、振る舞いの評価ではないので学習に使わない
+            if worker.numeric_valid and not worker.over_budget:
+                self.surrogate.add(worker)
+        self.surrogate.fit()
+
     def get_winner_list(self):
-        major_top_workers = defaultdict(list)
+        if self.selection != 'double_tournament':
+            # 系統ごとの最良個体をスコア順に上位diversity件
+            return self.leaderboard.top_k(self.diversity)
+
+        # 二段トーナメントで重複しない系統をdiversity件選ぶ。足りなければスコア順で補う
+        winner_count = min(self.diversity, len(self.leaderboard))
+        winner_list = []
+        majors = set()
+        for _ in range(winner_count * 10):
+            if len(winner_list) >= winner_count:
+                break
+            worker = self.leaderboard.double_tournament(self.tournament_size, self.parsimony_pressure)
+            if worker.majorid not in majors:
+                majors.add(worker.majorid)
+                winner_list.append(worker)
+        for worker in self.leaderboard.top_k(winner_count):
+            if len(winner_list) >= winner_count:
+                break
+            if worker.majorid not in majors:
+                majors.add(worker.majorid)
+                winner_list.append(worker)
+        return winner_list
+
+    def reset_leaderboard(self):
+        # ランキングを空にする (selectionの設定に合わせてparsimonyの有無も切り替える)
+        if self.selection == 'lexicographic':
+            self.leaderboard.parsimony_resolution = self.parsimony_resolution
+        else:
+            self.leaderboard.parsimony_resolution = None
+        self.leaderboard.clear()
+
+    def rebuild_leaderboard(self):
+        # 現在のworkersからランキングを作り直す (初期化時など、スコアを直接代入した場合に使う)
+        self.reset_leaderboard()
         for worker in self.workers:
-            heapq.heappush(major_top_workers[worker.majorid], (-worker.score, worker))
-        top_in_each_major = []
-        for _, w_heap in major_top_workers.items():
-            top_in_each_major.append(w_heap[0][1])
-        top_in_each_major.sort(key=lambda w: w.score, reverse=True)
-        return top_in_each_major[:self.diversity]
+            self.leaderboard.push(worker)
 
-    def exec(self, loop_count=100):
-        for _ in range(self.workers_count):
+    def init_workers(self):
+        """
+        初期集団を作る。先頭の個体から init_codelist のコードを順に使い、残りは default_code を使う。
+        同じコードは最初の1体でだけ set_code() (JSONの解析・bake・recalc_shape) を行い、
+        以降の個体はその個体をテンプレートにして copy_code() で複製する。
+        """
+        codelist = self.init_codelist or []
+        templates = {}
+        self.workers = []
+        self.op_profiler = OpProfiler() if self.profile_ops else None
+        for index in range(self.workers_count):
             worker = self.get_worker()
+            worker.profiler = self.op_profiler
+            if index < len(codelist):
+                code = codelist[index]
+                worker.score = 1
+            else:
+                code = self.default_code
+                worker.score = 0
+
+            template = templates.get(code)
+            if template is None:
+                worker.set_code(code)
+                if len(worker.variables) == 0:
+                    print("Empty variable!")
+                    exit()
+                templates[code] = worker
+            else:
+                worker.copy_code(template)
             self.workers.append(worker)
-            worker.set_code(self.default_code)
-            worker.score = 0
-
-        for index, code in enumerate(self.init_codelist):
-            if index < len(self.workers):
-                self.workers[index].set_code(code)
-                self.workers[index].score = 1
-
-        if len(self.workers[0].variables) == 0:
-            print("Empty variable!")
-            exit()
-            
+
+    def exec(self, loop_count=100):
+        self.init_workers()
+
+        self.rebuild_leaderboard()
+
         exec_id = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
         start_timestamp = datetime.now().strftime("%Y%m%d%H%M%S_")
         print("START: " + exec_id)
@@ -166,7 +683,7 @@ class BaseEA():
         for epoch in range(loop_count):
             try:
                 self.exec_epoch(epoch)
-                max_worker = max(self.workers, key=lambda worker: worker.score)
+                max_worker = self.leaderboard.best()
 
                 major_change = ""
                 if max_worker.majorid != prev_major:
@@ -176,18 +693,46 @@ class BaseEA():
                                f"PROGRESS={max_worker.get_prog_str()} "
                                f"SCORE={max_worker.score} "
                                f"NODE={max_worker.node_count} "
-                               f"MAJOR={max_worker.majorid}"
+                               f"MAJOR={max_worker.majorid} "
+                               f"SIZE={self.size_stats['mean']:.1f}/{self.size_stats['max']} "
+                               f"VARS={max_worker.live_var_count}/{max_worker.dead_var_count} "
+                               f"INVALID={self.invalid_count}"
                                f"{major_change}")
+                if self.racing:
+                    file_output += (f" RACED={self.racing_stats['aborted']}"
+                                    f" SAVED={self.racing_stats['saved_evals']}")
+                if self.use_surrogate:
+                    file_output += f" SCREENED={self.surrogate_stats['screened']}"
+                if self.tuning_mode == 'batch':
+                    file_output += (f" CONSTOPT={self.const_opt_stats['improved']}"
+                                    f"/{self.const_opt_stats['optimized']}")
+                if self.fidelity_stats:
+                    file_output += " FIDELITY=" + ">".join(
+                        f"{stats['promoted']}/{stats['evaluated']}" for stats in self.fidelity_stats)
+                if self.eval_time_budget is not None or self.flop_budget is not None:
+                    file_output += (f" OVERBUDGET={self.budget_stats['aborted']}"
+                                    f" QUARANTINED={len(self.quarantine)}"
+                                    f" REJECTED={self.budget_stats['rejected']}")
+                if self.adaptive_operators:
+                    file_output += " OPS=" + "/".join(
+                        f"{op[:2]}:{ratio:.2f}" for op, ratio in self.operator_ratios.items())
+                if self.semantic_dedupe:
+                    file_output += f" DEDUPED={self.dedupe_stats['inherited']}"
+                if self.vectorize:
+                    file_output += (f" VEC={self.population_engine.stats['grouped']}"
+                                    f"/{self.population_engine.stats['total']}")
                 with open("logs/" + start_timestamp + exec_id + '.txt', 'a') as file:
                     file.write(file_output + "\r\n")
                 print(file_output)
+                if self.op_profiler is not None:
+                    print(self.op_profiler.report('epoch'))
                 prev_major = max_worker.majorid
 
                 if epoch % self.shuffle_interval == 0:
                     winner_list = self.get_winner_list()
                     content = (f"[TIME={datetime.now().strftime('%Y/%m/%d %H:%M:%S')} "
                                f"EXEC_ID={exec_id} EPOCH={epoch}]\r\n\r\n")
-                    for idx_w in range(self.diversity):
+                    for idx_w in range(len(winner_list)):
                         content += (f"DIV={idx_w} SCORE={winner_list[idx_w].score} "
                                     f"NODE={winner_list[idx_w].node_count} "
                                     f"MAJOR={winner_list[idx_w].majorid} =======================\r\n\r\n")
@@ -203,31 +748,251 @@ class BaseEA():
                 print(max_worker.get_code())
                 exit()
 
+        self.close_process_pool()
+        if self.op_profiler is not None:
+            print(self.op_profiler.report('total'))
         print(max_worker.node_count)
         print(max_worker.variables)
         print(max_worker.get_code())
 
+    def get_racing_losers(self, workers):
+        """
+        途中までのscore_historyから平均の信頼区間を求め、勝ち残れない個体を返す。
+        winner_listに入るには「自系統の最良」かつ「上位diversity系統」である必要があるので、
+        信頼区間の上限が 自系統の下限の最大値 または 上位diversity番目の系統の下限 を
+        下回る個体は打ち切り対象になる。
+        標準偏差は個体ごとの値と集団全体のプール値の大きい方を使う(保守的に判定)。
+        """
+        histories = [np.asarray(w.score_history, dtype=np.float64) for w in workers]
+        if len(histories) == 0 or len(histories[0]) < max(2, self.racing_min_attempts):
+            return []
+        n = len(histories[0])
+        means = np.array([h.mean() for h in histories])
+        stds = np.array([h.std(ddof=1) for h in histories])
+        pooled = np.sqrt(np.mean(stds ** 2))
+        margin = self.racing_z * np.maximum(stds, pooled) / np.sqrt(n)
+        lower = means - margin
+        upper = means + margin
+
+        major_lower = {}
+        for worker, value in zip(workers, lower):
+            if worker.majorid not in major_lower or value > major_lower[worker.majorid]:
+                major_lower[worker.majorid] = value
+        bar = -np.inf
+        if len(major_lower) > self.diversity:
+            bar = sorted(major_lower.values(), reverse=True)[self.diversity - 1]
+
+        return [worker for worker, value in zip(workers, upper)
+                if value < max(bar, major_lower[worker.majorid])]
+
+    def evaluate_all(self, workers, input_list):
+        """
+        1試行分のテストデータをまとめて各個体を評価する。例外を出した個体のリストを返す。
+        """
+        failed = []
+        if self.vectorize:
+            self.population_engine.prepare(workers, [self.get_input_values(data) for data in input_list])
+        for worker in workers:
+            start = time.perf_counter()
+            try:
+                with worker.numeric_scope():
+                    self.evaluation(worker, input_list)
+                    worker.check_numeric()
+            except Exception as e:
+                print("Execution error!")
+                traceback.print_exc()
+                failed.append(worker)
+            worker.eval_time += time.perf_counter() - start
+            worker.replay = None
+        return failed
+
+    def evaluate_streaming(self, workers, source):
+        """
+        テストデータを stream_chunk_size 件ずつ取り出し、同じチャンクを全個体で評価してから次に進む。
+        個体の値はチャンクをまたいで引き継がれるので、まとめて評価した場合と同じ計算になる。
+        例外を出した個体は以降のチャンクを評価せず、リストにして返す。
+        評価時間が eval_time_budget を超えた個体は、チャンクの区切りで打ち切る (over_budget をTrueにする)。
+        """
+        failed = []
+        running = list(workers)
+        states = {id(worker): self.begin_evaluation(worker, self.loops) for worker in workers}
+        for chunk in iter_chunks(source, self.stream_chunk_size):
+            if self.vectorize:
+                self.population_engine.prepare(running, [self.get_input_values(data) for data in chunk])
+            for worker in list(running):
+                start = time.perf_counter()
+                try:
+                    with worker.numeric_scope():
+                        self.evaluate_chunk(worker, states[id(worker)], chunk)
+                        worker.check_numeric()
+                except Exception as e:
+                    print("Execution error!")
+                    traceback.print_exc()
+                    failed.append(worker)
+                    running.remove(worker)
+                worker.eval_time += time.perf_counter() - start
+                worker.replay = None
+                if (worker in running and self.eval_time_budget is not None
+                        and worker.eval_time > self.eval_time_budget):
+                    worker.over_budget = True
+                    running.remove(worker)
+        for worker in running:
+            self.end_evaluation(worker, states[id(worker)])
+        return failed
+
+    def get_process_pool(self):
+        """
+        評価用のプロセスプールを返す (初回に作成)。子プロセスには個体を持たないEAのコピーを1回だけ渡す。
+        """
+        if self.process_pool is None:
+            # 並列評価を使うときだけ読み込む (起動を速くするため)
+            import multiprocessing
+            from multiprocessing import resource_tracker
+            template = copy.copy(self)
+            template.workers = []
+            template.leaderboard = Leaderboard()
+            template.surrogate = None
+            template.process_pool = None
+            # 子プロセスが共有メモリの登録先として親と同じresource_trackerを使うように、先に起動しておく
+            # (子ごとに別のtrackerができると、親が削除したブロックを子のtrackerが漏れとして警告する)
+            resource_tracker.ensure_running()
+            self.process_pool = multiprocessing.Pool(self.processes, initializer=_init_process,
+                                                     initargs=(template,))
+            atexit.register(self.close_process_pool)
+        return self.process_pool
+
+    def close_process_pool(self):
+        if self.process_pool is not None:
+            self.process_pool.terminate()
+            self.process_pool.join()
+            self.process_pool = None
+
+    def evaluate_parallel(self, workers, input_list):
+        """
+        子プロセスで各個体を評価し、スコア・progress・NaN/infの判定・変数の値を書き戻す。例外を出した個体のリストを返す。
+        init_value() は親プロセスで済ませておく (乱数の使い方を1プロセスの場合と揃えるため)。
+        """
+        from ea.sharedmem import SharedTestData
+        pool = self.get_process_pool()
+        failed = []
+        nbytes = sum(np.asarray(value).nbytes for data in input_list for value in data.values())
+        if self.share_testdata and nbytes >= self.share_testdata_min_bytes:
+            shared = SharedTestData(input_list)
+            testdata = shared.handle
+        else:
+            shared = None
+            testdata = input_list
+        try:
+            results = pool.starmap(_evaluate_in_process, [(worker, testdata) for worker in workers])
+        finally:
+            if shared is not None:
+                shared.close()
+
+        for worker, (result, error) in zip(workers, results):
+            if error is not None:
+                print("Execution error!")
+                print(error)
+                failed.append(worker)
+                continue
+            worker.score_history, worker.progress, worker.numeric_valid, values, elapsed = result
+            worker.eval_time += elapsed
+            # 試行をまたいで値を引き継ぐ変数があるので、最後の値も書き戻す
+            for key, value in values.items():
+                worker.variables[key]['value'] = value
+        return failed
+
     def exec_epoch(self, epoch):
+        self.surrogate_stats = {'screened': 0}
+        self.budget_stats = {'aborted': 0, 'rejected': 0}
+        if self.op_profiler is not None:
+            self.op_profiler.reset_epoch()
+        self.population_engine.reset_stats()
         self.workers = self.get_children()
         for worker in self.workers:
             worker.reset_score()
             worker.reset_progress()
+        if self.fidelity_levels:
+            self.workers = self.screen_by_fidelity(self.workers)
 
-        for _ in range(self.attempts_count):
+        self.racing_stats = {'aborted': 0, 'saved_evals': 0}
+        duplicates = []
+        if self.semantic_dedupe:
+            active_workers, duplicates = self.dedupe_by_behavior(self.workers)
+        else:
+            active_workers = list(self.workers)
+        if self.flop_budget is not None:
+            # 見積もり演算量が予算を超える個体は評価しない
+            for worker in list(active_workers):
+                if worker.estimate_flops() > self.flop_budget:
+                    worker.over_budget = True
+                    active_workers.remove(worker)
+        for attempt in range(self.attempts_count):
             input_list = self.get_testdata_list()
-            to_remove = []
-            for worker in self.workers:
+            if not self.stream_chunk_size:
+                input_list = list(input_list)
+            for worker in active_workers:
                 worker.init_value()
-                try:
-                    self.evaluation(worker, input_list)
-                except Exception as e:
-                    print("Execution error!")
-                    traceback.print_exc()
-                    to_remove.append(worker)
+            if self.processes:
+                to_remove = self.evaluate_parallel(active_workers, list(input_list))
+            elif self.stream_chunk_size:
+                to_remove = self.evaluate_streaming(active_workers, input_list)
+            else:
+                to_remove = self.evaluate_all(active_workers, input_list)
             for worker in to_remove:
                 self.workers.remove(worker)
+                active_workers.remove(worker)
+            # 評価時間が予算を超えた個体は残りの試行を評価しない
+            for worker in list(active_workers):
+                if worker.over_budget or (self.eval_time_budget is not None
+                                          and worker.eval_time > self.eval_time_budget):
+                    worker.over_budget = True
+                    active_workers.remove(worker)
+
+            if self.racing and attempt < self.attempts_count - 1:
+                losers = self.get_racing_losers(active_workers)
+                remaining = self.attempts_count - attempt - 1
+                for worker in losers:
+                    active_workers.remove(worker)
+                self.racing_stats['aborted'] += len(losers)
+                self.racing_stats['saved_evals'] += len(losers) * remaining * self.loops
+
+        # 振る舞いが同じ個体は評価した個体の結果を引き継ぐ (評価中に除外された個体の重複は除外する)
+        remaining_ids = set(id(worker) for worker in self.workers)
+        for worker, source in duplicates:
+            if id(source) in remaining_ids:
+                # 引き継ぐのは振る舞いのスコアだけで、大きさのペナルティは個体自身のものにする
+                shift = self.get_size_penalty(source) - self.get_size_penalty(worker)
+                worker.score_history = source.score_history + shift
+                worker.progress = source.progress.copy()
+                worker.numeric_valid = source.numeric_valid
+                worker.over_budget = source.over_budget
+            else:
+                self.workers.remove(worker)
 
         for worker in self.workers:
-            worker.resize_progress(self.attempts_count * self.loops)
-        for worker in self.workers:
-            worker.average_score()
+            # 予算超過で1回も評価しなかった個体は progress が0のまま
+            if len(worker.score_history):
+                worker.resize_progress(len(worker.score_history) * self.loops)
+        # NaN/infを出した個体はまとめてペナルティ
+        valid = np.array([worker.numeric_valid for worker in self.workers], dtype=bool)
+        self.invalid_count = int(np.count_nonzero(~valid))
+        self.reset_leaderboard()
+        for worker, is_valid in zip(self.workers, valid):
+            with worker.numeric_scope():
+                worker.average_score()
+            if not is_valid:
+                worker.score = self.invalid_score
+            if worker.over_budget:
+                worker.score = self.invalid_score if self.budget_penalty_score is None else self.budget_penalty_score
+                self.quarantine_worker(worker)
+            self.leaderboard.push(worker)
+
+        if self.operator_scheduler is not None:
+            self.record_operator_results()
+
+        # 世代ごとの木のサイズ (評価コストの目安)
+        node_counts = [worker.node_count for worker in self.workers]
+        if node_counts:
+            self.size_stats = {'mean': sum(node_counts) / len(node_counts), 'max': max(node_counts)}
+        if self.use_surrogate and self.workers:
+            self.train_surrogate()
@@ -0,0 +1,102 @@
+# ea/leaderboard.py
+
+import bisect
+import random
+
+
+class Leaderboard():
+    """
+    系統(majorid)ごとの最良個体を保持するランキング表。
+
+    - スコアが確定した個体を push() で逐次登録し、系統ごとの最良個体だけを残す
+    - 系統の並びは (-score, node_count, 登録順) をキーとしたソート済みリストで保持するので、
+      同点の場合は先に登録された個体が常に上位になる(比較でMatrixGP同士を比べない)
+    - best() は O(1)、top_k() は O(k)、tournament() は O(tournament_size) で応答する
+    - parsimony_resolution を指定すると、スコアをその刻みで丸めて同点扱いにし、
+      同点ならnode_countの小さい個体を上位にする (lexicographic parsimony)
+    """
+
+    def __init__(self, parsimony_resolution=None):
+        self.parsimony_resolution = parsimony_resolution
+        self.clear()
+
+    def clear(self):
+        """
+        登録済みの系統をすべて消去する。世代交代のたびに呼ぶ。
+        """
+        self._keys = []     # ソート済みの (-score, node_count, seq) のリスト
+        self._workers = []  # _keys と同じ並びの個体リスト
+        self._entries = {}  # majorid -> その系統の最良個体のキー
+        self._seq = 0       # 登録順カウンタ (同点時の決定的な順序付けに使う)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def push(self, worker):
+        """
+        スコアが確定した個体を登録する。
+        既に同じ系統があれば、スコアが真に上回った場合のみ置き換える。
+
+        Returns:
+        --------
+        bool
+            個体が系統の最良として登録されたらTrue
+        """
+        if self.parsimony_resolution:
+            key = (-(worker.score // self.parsimony_resolution), worker.node_count, self._seq)
+        else:
+            key = (-worker.score, 0, self._seq)
+        self._seq += 1
+
+        old_key = self._entries.get(worker.majorid)
+        if old_key is not None:
+            if old_key[:2] <= key[:2]:
+                return False
+            index = bisect.bisect_left(self._keys, old_key)
+            self._keys.pop(index)
+            self._workers.pop(index)
+
+        index = bisect.bisect_left(self._keys, key)
+        self._keys.insert(index, key)
+        self._workers.insert(index, worker)
+        self._entries[worker.majorid] = key
+        return True
+
+    def best(self):
+        """
+        全系統の中で最もスコアの高い個体を返す。空ならNone。
+        """
+        if not self._workers:
+            return None
+        return self._workers[0]
+
+    def top_k(self, k):
+        """
+        スコア上位k系統の最良個体をスコア降順で返す。
+        """
+        return self._workers[:k]
+
+    def tournament(self, tournament_size, rng=random):
+        """
+        ランダムに選んだ tournament_size 系統の中で最良の個体を返す。
+        リストはソート済みなので、引いた中で最小のインデックスが勝者になる。
+        """
+        if not self._workers:
+            return None
+        size = min(tournament_size, len(self._workers))
+        index = min(rng.sample(range(len(self._workers)), size))
+        return self._workers[index]
+
+    def double_tournament(self, tournament_size, parsimony_pressure, rng=random):
+        """
+        double tournament (fitnessトーナメントの勝者2体で、サイズのトーナメントを行う)。
+        parsimony_pressure の確率で node_count の小さい方、それ以外はスコアの高い方を返す。
+        """
+        first = self.tournament(tournament_size, rng)
+        second = self.tournament(tournament_size, rng)
+        if first is None:
+            return None
+        smaller, _ = sorted([first, second], key=lambda w: w.node_count)
+        if rng.random() < parsimony_pressure:
+            return smaller
+        return first if self._entries[first.majorid] <= self._entries[second.majorid] else second
@@ -0,0 +1,60 @@
+# ea/scheduler.py
+
+
+class OperatorScheduler():
+    """
+    子の作り方 (crossover/subtree/tuning/mutation) の割合を、CPU時間あたりの改善量で調整するバンディット。
+
+    - 操作ごとに「親からのスコアの改善量 (負なら0)」の合計と、
+      「子を作る時間 + 子を評価した時間」の合計を記録する
+    - 世代ごとに過去の記録を decay 倍して、最近の世代を重く見る
+    - ratios() は改善量/時間 に比例した割合を返す (probability matching)。
+      どの操作も min_ratio は残して探索を続け、まだ試していない操作は最も良い操作と同じ扱いにする
+    """
+
+    def __init__(self, operators, min_ratio=0.05, decay=0.8):
+        self.operators = list(operators)
+        self.min_ratio = min_ratio
+        self.decay = decay
+        self.gain = {op: 0.0 for op in self.operators}
+        self.cost = {op: 0.0 for op in self.operators}
+        self.count = {op: 0.0 for op in self.operators}
+
+    def next_epoch(self):
+        for op in self.operators:
+            self.gain[op] *= self.decay
+            self.cost[op] *= self.decay
+            self.count[op] *= self.decay
+
+    def add_cost(self, op, seconds):
+        # 子を作るのにかかった時間 (重複などで捨てた子の分も含める)
+        if op in self.cost:
+            self.cost[op] += seconds
+
+    def add_result(self, op, gain, seconds):
+        # 評価が終わった子1体分の改善量と評価時間
+        if op in self.gain:
+            self.gain[op] += max(0.0, gain)
+            self.cost[op] += seconds
+            self.count[op] += 1
+
+    def rates(self):
+        """
+        操作ごとの 改善量/時間(秒)。まだ試していない操作はNone。
+        """
+        return {op: (self.gain[op] / self.cost[op] if self.count[op] > 0 and self.cost[op] > 0 else None)
+                for op in self.operators}
+
+    def ratios(self):
+        """
+        操作ごとの割合 (合計1) を返す。
+        """
+        rates = self.rates()
+        known = [rate for rate in rates.values() if rate is not None]
+        best = max(known) if known else 1.0
+        weights = {op: (best if rate is None else rate) for op, rate in rates.items()}
+        total = sum(weights.values())
+        free = 1.0 - self.min_ratio * len(self.operators)
+        if total <= 0:
+            return {op: 1.0 / len(self.operators) for op in self.operators}
+        return {op: self.min_ratio + free * weights[op] / total for op in self.operators}
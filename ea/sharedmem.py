@@ -0,0 +1,107 @@
+# ea/sharedmem.py
+"""
+複数プロセスで評価するときに、テストデータを共有メモリ経由で渡すための補助。
+
+- 試行ごとの input_list (辞書のリスト) をキーごとに1つの配列へ積み上げ、
+  1つの SharedMemory ブロックに1回だけ書き込む
+- 評価プロセスには名前・シェイプ・dtype だけの小さなハンドルを渡し、
+  評価側は attach() でコピーせずに配列のビューとして読む
+- 作成したブロックはこのモジュールで管理し、例外や exit() で終了した場合も atexit で解放する
+"""
+import atexit
+import numpy as np
+from multiprocessing import shared_memory
+
+# 各配列の先頭位置の揃え (キャッシュライン単位)
+ALIGNMENT = 64
+
+# このプロセスで作成し、まだ解放していないブロック (異常終了時の後始末用)
+_created = {}
+# 評価プロセス側で開いているブロック (同じ試行の個体ごとに開き直さないように保持する)
+_attached = {}
+
+
+class SharedTestData():
+    """
+    1試行分のテストデータを共有メモリに置く。with文で使うと抜けたときに解放する。
+
+    Parameters:
+    ----------
+    input_list : list of dict
+        get_testdata_list() の結果 ex) [{'content': array, 'valid': bool}, ...]
+        すべての辞書が同じキーを持ち、キーごとに値のシェイプが揃っていること
+    """
+
+    def __init__(self, input_list):
+        arrays = {key: np.asarray([data[key] for data in input_list]) for key in input_list[0]}
+        layout = []
+        offset = 0
+        for key, array in arrays.items():
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            layout.append((key, offset, array.shape, array.dtype.str))
+            offset += array.nbytes
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        _created[self.shm.name] = self.shm
+        for key, array_offset, shape, dtype in layout:
+            view = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=array_offset)
+            view[...] = arrays[key]
+            del view
+        self.handle = {'name': self.shm.name, 'length': len(input_list), 'layout': layout}
+
+    def close(self):
+        """
+        ブロックを閉じて削除する。何度呼んでもよい。
+        """
+        if self.shm is None:
+            return
+        _created.pop(self.shm.name, None)
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+
+def attach(handle):
+    """
+    ハンドルから共有メモリを開き、input_list と同じ形のリストを返す (各値は共有メモリ上のビュー)。
+    前の試行のブロックは、このとき閉じる。
+    """
+    shm = _attached.get(handle['name'])
+    if shm is None:
+        _close_attached()
+        shm = shared_memory.SharedMemory(name=handle['name'])
+        _attached[handle['name']] = shm
+
+    arrays = {key: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+              for key, offset, shape, dtype in handle['layout']}
+    return [{key: array[index] for key, array in arrays.items()} for index in range(handle['length'])]
+
+
+def _close_attached():
+    for name in list(_attached):
+        try:
+            _attached.pop(name).close()
+        except BufferError:
+            # まだビューが残っている場合はプロセス終了時の解放に任せる
+            pass
+
+
+def _cleanup():
+    _close_attached()
+    for shm in list(_created.values()):
+        try:
+            shm.close()
+            shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
+    _created.clear()
+
+
+atexit.register(_cleanup)
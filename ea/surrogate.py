@@ -0,0 +1,84 @@
+# ea/surrogate.py
+
+import numpy as np
+
+# 子を生成した操作の種類 (GPBase.origin の値)
+ORIGIN_LIST = ['init', 'crossover', 'subtree', 'tuning', 'mutation']
+
+
+class SurrogateModel():
+    """
+    子個体の評価前にスコアを予測する簡易サロゲートモデル (NumPyのみ、オフライン動作)。
+
+    特徴量:
+    - node_count
+    - 演算ごとの使用回数 (FUNC_MASTERのキー別ヒストグラム)
+    - 親のスコア (parent_score)
+    - 生成方法 (origin) のone-hot
+
+    これまでに評価した (特徴量, スコア) を蓄積し、リッジ回帰で線形モデルを学習し直す。
+    """
+
+    def __init__(self, op_names, ridge=1.0, max_samples=5000):
+        self.op_names = [name for name in op_names if name != 'root']
+        self.op_index = {name: i for i, name in enumerate(self.op_names)}
+        self.ridge = ridge
+        self.max_samples = max_samples
+        self.samples_x = []
+        self.samples_y = []
+        self.weights = None
+        self.mean = None
+        self.std = None
+
+    def __len__(self):
+        return len(self.samples_y)
+
+    def features(self, worker):
+        """
+        個体から特徴量ベクトルを作る。
+        """
+        x = np.zeros(2 + len(self.op_names) + len(ORIGIN_LIST))
+        x[0] = worker.node_count
+        x[1] = worker.parent_score
+        for op, count in worker.count_ops().items():
+            if op in self.op_index:
+                x[2 + self.op_index[op]] = count
+        if worker.origin in ORIGIN_LIST:
+            x[2 + len(self.op_names) + ORIGIN_LIST.index(worker.origin)] = 1
+        return x
+
+    def add(self, worker):
+        """
+        評価済みの個体を学習データに追加する。古いものから捨てる。
+        """
+        self.samples_x.append(self.features(worker))
+        self.samples_y.append(worker.score)
+        if len(self.samples_y) > self.max_samples:
+            self.samples_x.pop(0)
+            self.samples_y.pop(0)
+
+    def fit(self):
+        """
+        蓄積したデータでリッジ回帰を解き直す。
+        """
+        if not self.samples_y:
+            return
+        x = np.array(self.samples_x)
+        y = np.array(self.samples_y, dtype=np.float64)
+        self.mean = x.mean(axis=0)
+        self.std = x.std(axis=0)
+        self.std[self.std == 0] = 1
+        xs = np.hstack([(x - self.mean) / self.std, np.ones((len(x), 1))])
+        reg = self.ridge * np.eye(xs.shape[1])
+        reg[-1, -1] = 0  # バイアス項は正則化しない
+        self.weights = np.linalg.solve(xs.T @ xs + reg, xs.T @ y)
+
+    def predict(self, workers):
+        """
+        個体リストの予測スコアを返す。未学習なら全て0。
+        """
+        if self.weights is None:
+            return np.zeros(len(workers))
+        x = np.array([self.features(w) for w in workers])
+        xs = np.hstack([(x - self.mean) / self.std, np.ones((len(x), 1))])
+        return xs @ self.weights
@@ -0,0 +1,65 @@
+# ea/testdata.py
+"""
+テストデータを逐次(ストリーミング)で扱うための補助。
+
+- get_testdata_list() はリストの代わりにジェネレータ等のイテレータを返してもよい
+- BaseEA.stream_chunk_size を指定すると、iter_chunks() で数件ずつ取り出し、
+  同じチャンクを全個体で使い回しながら評価する (1試行分を丸ごとメモリに持たない)
+- RecordedSequence は記録済みのシーケンス(.npy)をメモリマップで読み、必要な行だけを取り出す
+"""
+import itertools
+import numpy as np
+
+
+def iter_chunks(source, chunk_size):
+    """
+    イテラブルな source から chunk_size 件ずつのリストを順に返す。
+    """
+    iterator = iter(source)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class RecordedSequence():
+    """
+    記録済みのテストデータ(.npy)をメモリマップで読み込むデータ源。
+
+    Parameters:
+    ----------
+    content_path : str
+        (サンプル数, ...) の入力を保存した .npy ファイル
+    valid_path : str or None
+        (サンプル数,) の valid フラグを保存した .npy ファイル。省略時はすべてFalse
+    dtype : numpy.dtype or None
+        取り出した入力を変換する型。Noneならファイルの型のまま
+    """
+
+    def __init__(self, content_path, valid_path=None, dtype=None):
+        self.content = np.load(content_path, mmap_mode='r')
+        self.valid = np.load(valid_path, mmap_mode='r') if valid_path is not None else None
+        self.dtype = dtype
+
+    def __len__(self):
+        return len(self.content)
+
+    def iter_window(self, length, start=None):
+        """
+        start 行目から length 件を {'content': ..., 'valid': ...} として順に返す。
+        start を省略すると、収まる範囲でランダムな位置から始める。
+        ファイルは読み込んだ行の分だけページインされる。
+        評価側は1試行を length 件 (loops) として採点するので、記録が足りない場合は短く切らずに ValueError にする。
+        """
+        if start is None:
+            start = np.random.randint(0, max(len(self.content) - length, 0) + 1)
+        if start < 0 or start + length > len(self.content):
+            raise ValueError(f"(E) RECORDED SEQUENCE TOO SHORT! {start}+{length} > {len(self.content)}")
+        return self._iter_rows(start, length)
+
+    def _iter_rows(self, start, length):
+        for index in range(start, start + length):
+            content = np.array(self.content[index], dtype=self.dtype)
+            valid = bool(self.valid[index]) if self.valid is not None else False
+            yield {'content': content, 'valid': valid}
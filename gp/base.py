@@ -7,6 +7,7 @@ import hashlib
 import time
 
 from util.npjson import npobj2json, json2npobj
+from gp import sparse
 
 # 定数識別用の定義
 CONST = 0  # 定数ノード
@@ -31,6 +32,31 @@ VARIABLE_TEMPLATE = {
     'unused_count': 0,      # 使われていない期間をカウント (一定以上で削除)
 }
 
+# CONST/GVAL の葉の値の置き場。(値, shape, dtype) ごとに読み取り専用のブロードキャストビューを1つだけ作り、
+# 全個体・全サンプルで使い回す (shapeいっぱいの配列を毎回作らない)
+_leaf_cache = {}
+LEAF_CACHE_SIZE = 4096
+
+
+def broadcast_leaf(value, shape, dtype):
+    """
+    value を shape に広げた読み取り専用のビューを返す (実体は0次元の配列1つ)。
+    演算はブロードキャストでそのまま受け取れる。書き換えが必要な場合は np.array() でコピーすること。
+    """
+    key = (value, tuple(shape), dtype)
+    try:
+        leaf = _leaf_cache.get(key)
+    except TypeError:
+        # 値が配列などでハッシュできない場合は使い回さない
+        return np.broadcast_to(np.asarray(value, dtype=dtype), tuple(shape))
+    if leaf is None:
+        if len(_leaf_cache) >= LEAF_CACHE_SIZE:
+            _leaf_cache.clear()
+        leaf = np.broadcast_to(np.asarray(value, dtype=dtype), tuple(shape))
+        _leaf_cache[key] = leaf
+    return leaf
+
+
 class GPBase():
     """
     行列演算をベースとしたGP(遺伝的プログラミング)の基底クラス。
@@ -40,13 +66,31 @@ class GPBase():
     - exec_calc() を実行すると、ツリーを再帰的に辿って value を計算し、self.variables[key]['value'] に格納
     - 遺伝的プログラミングに必要な mutation や crossover(一部)などの仕組みを提供
     """
+    __slots__ = (
+        'majorid', 'variables', '_scores', '_score_count', 'score', 'node_count', 'tree_depth',
+        'live_var_count', 'dead_var_count', 'shared_variables', 'replay', 'numeric_valid', 'eval_time',
+        'over_budget', 'use_sparse', 'shapes_verified', 'exec_schedule', 'back_edges', 'variable_cycles',
+        'profiler', 'fingerprint', 'origin', 'parent_score', 'use_gval', 'dtype', 'defined_shapes', 'gval',
+        'gval_list', 'progress',
+        'VAR_CREATION_RATE', 'MAKE_CONST_RATE', 'MUTATION_STRENGTH', 'TUNING_STRENGTH', 'SUBTREE_MATCH_OP',
+        'SUBTREE_DONOR_TRIES', 'UNUSED_VAR_TTL', 'SINK_VARIABLES', 'PRUNE_DEAD_VARIABLES', 'NUMPY_ERRSTATE',
+        'SPARSE_DENSITY_THRESHOLD', 'SPARSE_DEFAULT_DENSITY', 'MAX_TREE_DEPTH', 'MAX_NODE_COUNT', 'MAX_VARIABLES',
+    )
+
+    # 派生クラスで上書きする演算マップ(FUNC_MASTER)。クラスで1つだけ持ち、個体ごとには作らない・複製しない
+    FUNC_MASTER = {}
+    # 個体軸(先頭の次元)付きの配列をまとめて計算する演算マップ (PopulationEngine用)
+    BATCH_FUNC_MASTER = {}
+    # 評価レポート用のprogressの指標の数
+    PROGRESS_SIZE = 6
 
     def __init__(
         self, 
         majorid="",
         gval_list=[],
         defined_shapes={},
-        use_gval=False
+        use_gval=False,
+        dtype=np.float64
     ):
         """
         コンストラクタ
@@ -61,14 +105,34 @@ class GPBase():
             {'input_size': 3, 'output_size': 2} といった形で明示的に定義されたシェイプのセット
         use_gval : bool
             GVAL(グローバル変数ノード)を使用するかどうか
+        dtype : numpy dtype
+            変数の値・定数・入力を保持する浮動小数点の型 (np.float32 にするとメモリと帯域が半分)
         """
         self.majorid = majorid  # 個体を識別するID (8文字の乱数など)
         self.variables = [{}]   # キー: 変数名, 値: 変数の辞書 (logic, shape, valueなど)
-        self.score_history = [] # 評価の履歴を記録
+        self._scores = np.zeros(4)  # 評価の履歴 (score_history) の領域。足りなくなったら倍に広げる
+        self._score_count = 0
         self.score = 0          # 平均スコアなど最終的に格納
         self.node_count = 0     # ロジック上のノード数 (複雑度を表す)
+        self.tree_depth = 0     # ロジック木の深さの最大値
+        self.live_var_count = 0 # SINK_VARIABLESから到達できる変数の数
+        self.dead_var_count = 0 # 到達できない変数の数
+        self.shared_variables = set()  # clone()で親と共有したままの未使用変数名 (変更前に own_variable する)
+        self.replay = None      # PopulationEngineが一括計算した各サンプルの値 (exec_calcが順に取り出す)
+        self.numeric_valid = True  # 評価中にSINK_VARIABLESの値がNaN/infにならなかったか
+        self.eval_time = 0.0       # この世代の評価にかかった時間(秒)
+        self.over_budget = False   # 評価の予算 (時間・演算量) を超えて打ち切られたか
+        self.use_sparse = False    # 疎行列の変数を持つか (Trueなら疎行列対応の演算をbakeする)
+        self.shapes_verified = False  # verify_shapes() で全ノードのシェイプを確認済みか (Trueなら実行時の確認を省く)
+        self.exec_schedule = None     # exec_calc() で計算する変数の順 (build_schedule()。Noneなら次の計算時に作る)
+        self.back_edges = []          # 循環の中で前のステップの値を読む参照 (参照元, 参照先)
+        self.variable_cycles = []     # 循環している変数のまとまり (強連結成分)
+        self.profiler = None          # 演算ごとの計測 (gp.profiler.OpProfiler)。Noneなら計測しない
         self.fingerprint = ""   # 個体の「指紋」(重複チェック用ハッシュ)
+        self.origin = 'init'    # この個体を生成した操作 ('init', 'crossover', 'tuning', 'mutation')
+        self.parent_score = 0   # 生成元(親)のスコア
         self.use_gval = use_gval
+        self.dtype = np.dtype(dtype)
 
         # シェイプ衝突チェック (同じ名前で違う数値が割り当たっていないか)
         self.defined_shapes = defined_shapes
@@ -87,15 +151,25 @@ class GPBase():
         self.MAKE_CONST_RATE = 0.3     # 定数化の確率
         self.MUTATION_STRENGTH = 10
         self.TUNING_STRENGTH = 10
+        self.SUBTREE_MATCH_OP = False  # 部分木交叉で演算の種類も同じdonorに限る (typed GP)
+        self.SUBTREE_DONOR_TRIES = 5   # 変数の参照が合うdonorを探す回数
         self.UNUSED_VAR_TTL = 100      # 使われないまま何世代(TTL)を超えた変数を削除
-
-        # 派生クラスで上書きする演算マップ(FUNC_MASTER)
-        self.FUNC_MASTER = {}
-
-        # 評価レポート用のprogress (任意の6つの指標を保持)
-        self.progress = {}
-        for i in range(1, 7):
-            self.progress[i] = 0
+        self.SINK_VARIABLES = ['output']  # 到達可能性解析の起点となる変数 (ここから辿れない変数は未使用)
+        # Trueなら未使用(到達不能)変数を複製・保存・初期化の対象から外す (TTLまでは個体内に保持)
+        self.PRUNE_DEAD_VARIABLES = False
+        # 評価中の浮動小数点エラーの扱い (np.errstateの引数)。演算ごとには例外処理をせず、
+        # NaN/infは出力で検出して numeric_valid を落とす
+        self.NUMPY_ERRSTATE = {'all': 'ignore'}
+        # 'density' がこの値未満の2次元変数 (または init_policy 'sparse' の変数) は値をCSR行列で持つ
+        self.SPARSE_DENSITY_THRESHOLD = 0.1
+        self.SPARSE_DEFAULT_DENSITY = 0.01  # init_policy 'sparse' で density 未指定のときの密度
+        # 肥大化(bloat)対策の上限。Noneなら制限しない
+        self.MAX_TREE_DEPTH = 12       # 1変数のロジック木の深さの上限
+        self.MAX_NODE_COUNT = 500      # 個体全体のノード数の上限
+        self.MAX_VARIABLES = 50        # 変数の数の上限
+
+        # 評価レポート用のprogress (任意の6つの指標を保持。progress[0]〜progress[5])
+        self.progress = np.zeros(self.PROGRESS_SIZE)
 
     def root(self, a, shape=None):
         """
@@ -115,8 +189,7 @@ class GPBase():
             ex. "SABC.." のような進捗指標文字列
         """
         result_list = []
-        for key in self.progress.keys():
-            prog = self.progress[key]
+        for prog in self.progress:
             if prog > 0.99:
                 result_list.append('S')
             elif prog > 0.8:
@@ -156,11 +229,19 @@ class GPBase():
         logic['ref'] にバインドする。
 
         * JSON読み込み直後は 'ref' が空なので、ここで改めて紐付けを行う。
+        * use_sparse なら疎行列対応版 ('sparse_func') があればそちらを紐付ける。
+        * profiler があれば計測付きの関数で包んで紐付ける (無ければ元の関数のまま)。
         """
         if logic is None:
             return
         if logic['type'] == FUNC:
-            logic['ref'] = self.FUNC_MASTER[logic['content']]['func']
+            entry = self.FUNC_MASTER[logic['content']]
+            if self.use_sparse and 'sparse_func' in entry:
+                logic['ref'] = entry['sparse_func']
+            else:
+                logic['ref'] = entry['func']
+            if self.profiler is not None:
+                logic['ref'] = self.profiler.wrap(logic['content'], logic['ref'])
             for arg in logic['args']:
                 self.bake_logic(arg)
 
@@ -183,12 +264,16 @@ class GPBase():
         """
         現在の self.variables を、JSON文字列に変換して返す。
         その前に unbake_logic() をして、参照を削除しておく。
+        PRUNE_DEAD_VARIABLES がTrueなら未使用変数(fixedを除く)は出力しない。
         """
-        for key in self.variables:
+        variables = self.variables
+        if self.PRUNE_DEAD_VARIABLES:
+            variables = {k: v for k, v in self.variables.items() if v.get('used', True) or v['fixed']}
+        for key in variables:
             # 一旦中身のvalueを0で埋める (実際の値は保存不要)
-            self.variables[key]['value'] = np.tile(0, self.variables[key]['shape'])
-            self.unbake_logic(self.variables[key]['logic'])
-        return npobj2json(self.variables)
+            variables[key]['value'] = broadcast_leaf(0, variables[key]['shape'], self.dtype)
+            self.unbake_logic(variables[key]['logic'])
+        return npobj2json(variables)
 
     def set_code(self, json_str):
         """
@@ -198,10 +283,28 @@ class GPBase():
         """
         variables_dict = json2npobj(json_str)
         self.variables = variables_dict
+        self.update_sparse_mode()
         for key in variables_dict:
             if self.variables[key]['logic']:
                 self.bake_logic(self.variables[key]['logic'])
         self.recalc_shape()
+        if not self.verify_shapes(self.variables):
+            raise ValueError("(E) SHAPE MISMATCH!")
+        self.build_schedule()
+
+    def copy_code(self, template):
+        """
+        set_code() 済みの template と同じ変数を持たせる (JSONの解析・bake・recalc_shape を省く)。
+        logic/value は template と共有し、変数の辞書だけを複製する。
+        共有中の変数は shared_variables に記録し、変更する前に own_variable() でコピーする。
+        """
+        self.variables = {key: dict(variable) for key, variable in template.variables.items()}
+        self.shared_variables = set(self.variables)
+        self.use_sparse = template.use_sparse
+        self.shapes_verified = template.shapes_verified
+        self.exec_schedule = template.exec_schedule
+        self.back_edges = template.back_edges
+        self.variable_cycles = template.variable_cycles
 
     def recalc_shape(self):
         """
@@ -246,35 +349,159 @@ class GPBase():
                 dfs_recalc_shape(var['logic'], replace_table1)
                 dfs_recalc_shape(var['logic'], replace_table2)
 
+        # 変数自体のシェイプも同じ表で置き換える (ロジックの無い 'input' なども含む)
+        for key in self.variables:
+            var = self.variables[key]
+            shape = tuple(replace_table2.get(replace_table1.get(dim, dim), dim) for dim in var['shape'])
+            var['shape'] = shape
+
+    def resize(self, defined_shapes):
+        """
+        defined_shapes を差し替えて、同じロジックを別のサイズの問題で計算できるようにする
+        (小さいサイズで安く評価する multi-fidelity 用)。clone() した個体に対して使うこと。
+        シェイプが変わった変数の value は np.resize で新しいシェイプに合わせる
+        (init_policy が 'zero'/'one'/'random' なら init_value() で作り直される)。
+        recalc_shape() はロジック木のシェイプを書き換えるので、親と共有中の変数は先に own_variable() する。
+
+        Returns:
+        --------
+        bool
+            静的なシェイプ検査 (verify_shapes) に通ればTrue
+        """
+        self.defined_shapes = dict(defined_shapes)
+        for key in list(self.shared_variables):
+            self.own_variable(key)
+        self.recalc_shape()
+        for variable in self.variables.values():
+            value = sparse.to_dense(variable['value'])
+            if np.shape(value) != tuple(variable['shape']):
+                variable['value'] = np.resize(np.asarray(value, dtype=self.dtype), variable['shape'])
+        return self.verify_shapes(self.variables)
+
+    def verify_shapes(self, keys):
+        """
+        静的なシェイプ検査。keys の変数のロジック木について、葉から順に FUNC_MASTER の 'shapeInfer'
+        (引数のシェイプ → 結果のシェイプ) で各ノードの結果のシェイプを求め、
+        ノードの shape・変数の shape と一致するかを確かめる。VARノードは参照先の変数の shape を使う。
+
+        すべて一致すれば shapes_verified をTrueにし、exec_calc() ではノードごとのシェイプ確認を省く。
+        'shapeInfer' の無い演算を含む場合は検査できないので、shapes_verified をFalseにして
+        従来どおり実行時に確認する (この場合もTrueを返す)。
+
+        Returns:
+        --------
+        bool
+            シェイプが食い違うノードがあればFalse
+        """
+        unknown = []
+
+        def dfs_infer(node):
+            if node['type'] == FUNC:
+                arg_shapes = [dfs_infer(arg) for arg in node['args']]
+                if any(shape is None for shape in arg_shapes):
+                    return None
+                infer = self.FUNC_MASTER[node['content']].get('shapeInfer')
+                if infer is None:
+                    unknown.append(node['content'])
+                    return tuple(node['shape'])
+                result = infer(*arg_shapes)
+            elif node['type'] == VAR:
+                if node['content'] not in self.variables:
+                    return None
+                result = tuple(self.variables[node['content']]['shape'])
+            else:
+                result = tuple(node['shape'])
+            if result != tuple(node['shape']):
+                return None
+            return result
+
+        for key in keys:
+            logic = self.variables[key]['logic']
+            if logic is None:
+                continue
+            if dfs_infer(logic) != tuple(self.variables[key]['shape']):
+                self.shapes_verified = False
+                return False
+        self.shapes_verified = not unknown
+        return True
+
+    def is_sparse_variable(self, variable):
+        """
+        この変数の値をCSR行列で持つべきならTrue (2次元で、init_policyが'sparse'かdensityが閾値未満)。
+        scipyが無ければ常にFalse。
+        """
+        if len(variable['shape']) != 2:
+            return False
+        if variable.get('init_policy') != 'sparse' and variable.get('density', 1) >= self.SPARSE_DENSITY_THRESHOLD:
+            return False
+        return sparse.available()
+
+    def update_sparse_mode(self):
+        """
+        疎行列の変数があるかどうかで use_sparse を切り替える。
+        """
+        self.use_sparse = any(self.is_sparse_variable(v) for v in self.variables.values())
+
     def reset_score(self):
         """
         評価履歴をクリアし、スコアを0に戻す。
         """
-        self.score_history = []
+        self._score_count = 0
         self.score = 0
+        self.numeric_valid = True
+        self.eval_time = 0.0
+        self.over_budget = False
+
+    @property
+    def score_history(self):
+        """
+        評価の履歴 (1回の evaluation ごとのスコア) の配列。記録は add_score() で行う。
+        """
+        return self._scores[:self._score_count]
+
+    @score_history.setter
+    def score_history(self, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        self._scores = np.array(scores, copy=True) if len(scores) else np.zeros(4)
+        self._score_count = len(scores)
+
+    def add_score(self, score):
+        """
+        評価1回分のスコアを score_history に追加する。
+        """
+        if self._score_count == len(self._scores):
+            self._scores = np.concatenate([self._scores, np.zeros(max(len(self._scores), 4))])
+        self._scores[self._score_count] = score
+        self._score_count += 1
+
+    def numeric_scope(self):
+        """
+        評価1回分を囲む浮動小数点エラーの設定 (NUMPY_ERRSTATE) を返す。
+        ex) with worker.numeric_scope(): ...
+        """
+        return np.errstate(**self.NUMPY_ERRSTATE)
 
     def reset_progress(self):
         """
         progress配列をすべて0に初期化。
         """
-        for key in self.progress:
-            self.progress[key] = 0
+        self.progress[:] = 0
 
     def resize_progress(self, attempts_count):
         """
         progressの値を試行回数に応じて正規化。
         (累計でカウントしているため、最終的に平均的な値にしておく)
         """
-        for key in self.progress:
-            self.progress[key] /= attempts_count
+        self.progress /= attempts_count
 
     def set_values(self, inputs_array):
         """
         外部から入力を受け取り、self.variables[input_key]['value'] に代入。
         ex) inputs_array = {'input': np.array([...])}
+        型が self.dtype と違う場合だけ変換する。
         """
         for input_key in inputs_array:
-            self.variables[input_key]['value'] = inputs_array[input_key]
+            self.variables[input_key]['value'] = np.asarray(inputs_array[input_key], dtype=self.dtype)
 
     def get_values(self):
         """
@@ -293,101 +520,184 @@ class GPBase():
         """
         self.score_history に記録されたスコアの平均を self.score に格納。
         """
-        if len(self.score_history) != 0:
-            try:
-                self.score = sum(self.score_history)/len(self.score_history)
-            except FloatingPointError:
-                print("FloatingPointError in score_history")
-                self.score = 0
+        if self._score_count != 0:
+            self.score = sum(self.score_history.tolist())/self._score_count
         else:
             self.score = 0
 
+    def build_schedule(self):
+        """
+        変数の依存グラフから exec_calc() の計算順 (exec_schedule) を作る。ゲノムが変わったときだけ呼ぶ。
+
+        - SINK_VARIABLES (output等) から順に、ロジック木の中のVAR参照を木の行きがけ順に辿る深さ優先探索 (Tarjan法) で
+          強連結成分 (互いに参照し合う変数のまとまり) を求める
+        - 計算順は探索を抜けた順 (帰りがけ順)。循環が無ければ参照先は必ず参照元より先に計算される
+        - 循環がある場合、探索中 (再帰の途中) の変数への参照 (後退辺) は、その変数がまだこのステップで
+          計算されていないので前のステップの値を読む。後退辺は back_edges に (参照元, 参照先) で記録する
+          (同じ強連結成分でも、探索を抜けて計算順に入った変数への参照はこのステップの値を読むので含めない)
+        - 'input' と logic の無い変数は計算しない (外から与えられた値・前の値をそのまま使う)
+        """
+        def collect_refs(node, result):
+            if node['type'] == VAR:
+                result.append(node['content'])
+            elif node['type'] == FUNC:
+                for arg in node['args']:
+                    collect_refs(arg, result)
+            return result
+
+        schedule = []
+        back_edges = []
+        cycles = []
+        order = {}      # 変数名 -> 探索した順番
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        visiting = set()  # 再帰の途中 (まだ計算順に入っていない) の変数
+
+        def visit(key):
+            order[key] = lowlink[key] = len(order)
+            stack.append(key)
+            on_stack.add(key)
+            visiting.add(key)
+            for dep in collect_refs(self.variables[key]['logic'], []):
+                if dep == 'input' or self.variables.get(dep, {}).get('logic') is None:
+                    continue
+                if dep not in order:
+                    visit(dep)
+                    lowlink[key] = min(lowlink[key], lowlink[dep])
+                elif dep in on_stack:
+                    if dep in visiting:
+                        back_edges.append((key, dep))
+                    lowlink[key] = min(lowlink[key], order[dep])
+            visiting.discard(key)
+            schedule.append(key)
+
+            if lowlink[key] == order[key]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == key:
+                        break
+                if len(component) > 1 or (key, key) in back_edges:
+                    cycles.append(component)
+
+        for sink in self.SINK_VARIABLES:
+            if sink not in order and self.variables.get(sink, {}).get('logic') is not None:
+                visit(sink)
+        self.exec_schedule = schedule
+        self.back_edges = back_edges
+        self.variable_cycles = cycles
+
     def exec_calc(self):
         """
-        変数のlogicを再帰的に評価して、valueを更新する処理。
-        まず各変数に対し 'updated'フラグをリセットし、
-        'output' の更新を呼び出すことで、必要な変数を再帰的にupdateしていく。
+        変数のlogicを計算して、valueを更新する処理。
+        build_schedule() で求めた順 (exec_schedule) に、SINK_VARIABLES (output等) の計算に必要な変数を1回ずつ計算する。
+        VARノードは参照先の変数の現在の値を読む (循環の後退辺では前のステップの値になる)。
+        PopulationEngineで計算済み(replayがある)ならその値を取り出すだけ。
+        浮動小数点エラーは numeric_scope() の設定に従う。NaN/infの検出はサンプルごとには行わず、
+        評価の最後に check_numeric() で1回だけ行う。
         """
-        def update_variable(variable, var_chain):
-            """
-            ある変数がまだ updated でなければ、そのlogicを再帰計算して value を更新。
-            """
-            if variable['logic'] is not None:
-                temp = dfs_exec_calc(variable['logic'], var_chain)
-                variable['value'] = temp
-                variable['updated'] = True
+        if self.replay:
+            for key, value in self.replay.popleft().items():
+                self.variables[key]['value'] = value
+            return
+
+        if self.exec_schedule is None:
+            self.build_schedule()
+        check_shape = not self.shapes_verified
+        variables = self.variables
 
-        def dfs_exec_calc(node, var_chain):
+        def dfs_exec_calc(node):
             """
             実際にロジックを深く辿って計算する本体の関数。
             """
             _content = node['content']
             if node['type'] == FUNC:
                 # 子ノードを先に計算し、その結果を関数に渡す
-                child_args = [dfs_exec_calc(arg, var_chain) for arg in node['args']]
+                child_args = [dfs_exec_calc(arg) for arg in node['args']]
                 result = node['ref'](*child_args, shape=node['shape'])
 
-                # シェイプが合っているか最終チェック
-                if np.shape(result) != node['shape']:
+                # シェイプが合っているか最終チェック (verify_shapes() で確認済みなら省く)
+                if check_shape and np.shape(result) != node['shape']:
                     print("(E) SHAPE MISMATCH!")
                     print(node)
                     raise Exception("(E) SHAPE MISMATCH!")
                 return result
 
             elif node['type'] == CONST:
-                # 定数ノード → shapeいっぱいに敷き詰めたndarrayを返す
-                return np.tile(_content, node['shape'])
+                # 定数ノード → shapeに広げた読み取り専用のビュー (配列は作らない)
+                return broadcast_leaf(_content, node['shape'], self.dtype)
 
             elif node['type'] == VAR:
-                # 変数ノード → 変数名(_content)を参照
-                target_var = self.variables[_content]
-                if target_var['updated']:
-                    # 既に更新済みならそのまま
-                    return target_var['value']
-                else:
-                    # 無限ループ防止: 同じ変数を2度辿るときは更新を諦めて現在のvalue
-                    if _content in var_chain:
-                        target_var['updated'] = True
-                        return target_var['value']
-
-                    var_chain.append(_content)
-                    update_variable(target_var, var_chain)
-                    return target_var['value']
+                # 変数ノード → 計算順で先に計算済みの値 (後退辺なら前のステップの値)
+                return variables[_content]['value']
 
             elif node['type'] == GVAL:
-                # グローバル変数ノード(GVAL) → shapeぶんタイルして返す
-                return np.tile(self.get_gval(_content), node['shape'])
+                # グローバル変数ノード(GVAL) → 定数ノードと同じく読み取り専用のビュー
+                return broadcast_leaf(self.get_gval(_content), node['shape'], self.dtype)
 
-        # 全変数の 'updated' フラグをリセット
-        for key in self.variables:
-            if self.variables[key].get('logic') is not None:
-                self.variables[key]['updated'] = False
+        for key in self.exec_schedule:
+            variable = variables[key]
+            variable['value'] = dfs_exec_calc(variable['logic'])
 
-        # 'input' は外部から値が与えられているものなので updated = True にしておく
-        self.variables['input']['updated'] = True
+    def check_numeric(self):
+        """
+        SINK_VARIABLESの現在の値にNaN/infがあれば numeric_valid をFalseにする。評価1回の最後に呼ぶ。
+        循環で次のステップに引き継がれる値はNaN/infも引き継ぐので、最後の値を見れば足りる
+        (途中のサンプルだけで出たNaN/infは、採点の側でスコアに反映する)。
+        """
+        for key in self.SINK_VARIABLES:
+            value = self.variables[key]['value']
+            if self.use_sparse:
+                value = sparse.stored_values(value)
+            if not np.isfinite(value).all():
+                self.numeric_valid = False
+        return self.numeric_valid
+
+    def estimate_flops(self):
+        """
+        exec_calc() 1回 (1サンプル) の演算量を、ノードの静的なシェイプから見積もる。
+        FUNC_MASTER に 'flopsInfer' (引数のシェイプ, 結果のシェイプ → 演算量) があればそれを使い、
+        無ければ結果と引数の要素数の大きい方を1要素1演算として数える。
+        """
+        if self.exec_schedule is None:
+            self.build_schedule()
+
+        def dfs_flops(node):
+            if node['type'] != FUNC:
+                return 0
+            arg_shapes = [tuple(arg['shape']) for arg in node['args']]
+            infer = self.FUNC_MASTER[node['content']].get('flopsInfer')
+            if infer is not None:
+                flops = infer(*arg_shapes, tuple(node['shape']))
+            else:
+                flops = max(int(np.prod(shape)) for shape in arg_shapes + [tuple(node['shape'])])
+            return flops + sum(dfs_flops(arg) for arg in node['args'])
 
-        # 出力変数の更新を呼び出せば、必要に応じて再帰的にすべて計算される
-        update_variable(self.variables['output'], ['output'])
+        return sum(dfs_flops(self.variables[key]['logic']) for key in self.exec_schedule)
 
     def post_action(self):
         """
         進化世代ごとなどで呼ばれる後処理:
         1) ノード数(node_count)のカウント
         2) fingerprint(指紋)の計算
-        3) 未使用変数のunused_countを進め、TTLを越えたら削除
+        3) SINK_VARIABLES(output等)から辿れる変数を「使用中」とする到達可能性解析
+        4) 未使用変数のunused_countを進め、TTLを越えたら削除
 
         Returns:
         --------
         bool
-            shape計算やロジックが破綻していないならTrue
+            shape計算やロジックが破綻しておらず、ノード数・深さが上限以内ならTrue
         """
         def dfs_post_action(logic, variable_usage, counter=0, content_str=""):
             """
             ロジック木を深く探索し、ノードをカウント。
             fingerprint作成用の文字列 (typeやcontent) を連結する。
 
-            variable_usage: dict
-                変数の使用状況を記録する
+            variable_usage: set
+                このロジックが参照している変数名を記録する
             counter: int
                 ノードの累計数
             content_str: str
@@ -407,19 +717,18 @@ class GPBase():
 
             elif logic['type'] == VAR:
                 # 使用した変数名を記録
-                variable_usage[logic['content']] = True
+                variable_usage.add(logic['content'])
                 return True, counter, content_str + cs
 
             elif logic['type'] == GVAL:
-                # グローバル変数を使っていることを記録
-                variable_usage[logic['content']] = True
                 return True, counter, content_str + cs
 
         # まず全変数をbakeしておく(関数参照を準備)
+        self.update_sparse_mode()
         variable_usage = {}
         for key in self.variables:
             self.bake_logic(self.variables[key]['logic'])
-            variable_usage[key] = False
+            variable_usage[key] = set()
 
         self.node_count = 0
         content_str = ""
@@ -427,37 +736,205 @@ class GPBase():
         for key in self.variables:
             var = self.variables[key]
             if var['logic']:
-                _, counter, content_str = dfs_post_action(var['logic'], variable_usage, content_str=content_str)
+                _, counter, content_str = dfs_post_action(var['logic'], variable_usage[key], content_str=content_str)
                 if counter is None:
                     return False
                 self.node_count += counter
 
+        # 肥大化した個体は不正として扱う
+        self.tree_depth = max([self.get_depth(self.variables[key]['logic']) for key in self.variables] + [0])
+        if self.MAX_NODE_COUNT is not None and self.node_count > self.MAX_NODE_COUNT:
+            return False
+        if self.MAX_TREE_DEPTH is not None and self.tree_depth > self.MAX_TREE_DEPTH:
+            return False
+
         # fingerprint計算 (content_str をSHA256でハッシュ)
         m = hashlib.sha256()
         m.update(content_str.encode())
         self.fingerprint = m.hexdigest()
 
+        # SINK_VARIABLES から参照を辿って到達できる変数だけが計算に関わる(生きている)
+        live_keys = set()
+        stack = [key for key in self.SINK_VARIABLES if key in self.variables]
+        while stack:
+            key = stack.pop()
+            if key in live_keys or key not in self.variables:
+                continue
+            live_keys.add(key)
+            stack.extend(variable_usage[key])
+        self.live_var_count = len(live_keys)
+        self.dead_var_count = len(self.variables) - len(live_keys)
+
+        # 計算に関わる変数のシェイプを静的に検査し、食い違う個体は評価する前に不正として扱う
+        if not self.verify_shapes(live_keys):
+            return False
+
         # 未使用変数の削除チェック
-        delete_variable_keys = []
+        delete_variable_keys = set()
         for key in self.variables:
-            if key in variable_usage and variable_usage[key]:
+            if key in live_keys:
                 # 使われている
                 self.variables[key]['used'] = True
                 self.variables[key]['unused_count'] = 0
             else:
                 # 未使用
                 self.variables[key]['used'] = False
-                self.variables[key]['unused_count'] += 1
+                self.variables[key]['unused_count'] = self.variables[key].get('unused_count', 0) + 1
 
                 # TTLを超えたら削除
                 if self.variables[key]['unused_count'] > self.UNUSED_VAR_TTL and (not self.variables[key]['fixed']):
-                    delete_variable_keys.append(key)
+                    delete_variable_keys.add(key)
+
+        # 削除する変数を参照している未使用変数も、壊れた参照を残さないよう一緒に削除
+        changed = bool(delete_variable_keys)
+        while changed:
+            changed = False
+            for key in self.variables:
+                if (key not in live_keys and key not in delete_variable_keys and not self.variables[key]['fixed']
+                        and variable_usage[key] & delete_variable_keys):
+                    delete_variable_keys.add(key)
+                    changed = True
 
         for key in delete_variable_keys:
             self.variables.pop(key)
+            self.shared_variables.discard(key)
 
+        # 変数の参照関係が変わっているかもしれないので、計算順を作り直す
+        self.build_schedule()
         return True
 
+    def clone(self, variables=None):
+        """
+        個体を複製する。
+        PRUNE_DEAD_VARIABLES がTrueなら、未使用変数の logic/value は親と共有したままにする
+        (深いコピーをしない)。共有中の変数名は shared_variables に記録し、
+        変更する前に own_variable() で自分専用のコピーを作る。
+        variables を渡すと、親の変数はコピーせずにその辞書を子の variables にする
+        (交叉で VariablePool から組み立てた変数を使う場合。すべて共有中として扱う)。
+        読み取り専用の値 (broadcast_leaf のビュー) は常に共有する。
+        """
+        memo = {}
+        shared_keys = set()
+        # 読み取り専用のビュー (broadcast_leaf など) は書き換えられないので、複製せずに共有する
+        # (深いコピーをすると shape いっぱいの配列が作られる)
+        for variable in self.variables.values():
+            value = variable['value']
+            if isinstance(value, np.ndarray) and not value.flags.writeable:
+                memo[id(value)] = value
+        if variables is not None:
+            memo[id(self.variables)] = variables
+            shared_keys = set(variables)
+        elif self.PRUNE_DEAD_VARIABLES:
+            for key, variable in self.variables.items():
+                if not variable.get('used', True):
+                    shared_keys.add(key)
+                    memo[id(variable['logic'])] = variable['logic']
+                    memo[id(variable['value'])] = variable['value']
+        child = copy.deepcopy(self, memo)
+        child.shared_variables = shared_keys
+        return child
+
+    def clone_for_evaluation(self):
+        """
+        評価にだけ使う軽い複製 (定数の最適化の候補など)。属性は浅くコピーし、変数は copy_code() と同じく
+        logic/value を共有する。変数を書き換える前に own_variable() すること (set_constants() は自分で行う)。
+        """
+        child = copy.copy(self)
+        child.copy_code(self)
+        child.score_history = []
+        child.progress = self.progress.copy()
+        child.replay = None
+        return child
+
+    def own_variable(self, key):
+        """
+        clone()で共有している変数なら、ロジックを深くコピーして自分専用にする。
+        """
+        if key in self.shared_variables:
+            self.variables[key]['logic'] = copy.deepcopy(self.variables[key]['logic'])
+            self.shared_variables.discard(key)
+
+    def get_depth(self, logic):
+        """
+        ロジック木の深さを返す (葉だけなら1、logicがNoneなら0)。
+        """
+        if logic is None:
+            return 0
+        if logic['type'] == FUNC and 'args' in logic:
+            return 1 + max([self.get_depth(arg) for arg in logic['args']] + [0])
+        return 1
+
+    def get_node_depth(self, logic, target):
+        """
+        ロジック木の中で target ノードがある深さ(根が0)を返す。見つからなければNone。
+        """
+        if logic is target:
+            return 0
+        if logic['type'] == FUNC and 'args' in logic:
+            for arg in logic['args']:
+                depth = self.get_node_depth(arg, target)
+                if depth is not None:
+                    return depth + 1
+        return None
+
+    def can_add_variable(self):
+        """
+        変数の数が上限に達していなければTrue。
+        """
+        return self.MAX_VARIABLES is None or len(self.variables) < self.MAX_VARIABLES
+
+    def get_structure_key(self):
+        """
+        定数(CONST)とグローバル変数(GVAL)の中身を除いた構造の文字列を返す。
+        これが一致する個体同士は同じ手順で計算できるので、PopulationEngineでまとめて評価する。
+        BATCH_FUNC_MASTERに無い演算を含む場合や、疎行列の変数を持つ場合はNone。
+        """
+        if self.use_sparse:
+            return None
+        def dfs_structure(node, result):
+            if node['type'] == FUNC:
+                if node['content'] not in self.BATCH_FUNC_MASTER:
+                    return False
+                result.append('F' + node['content'] + str(tuple(node['shape'])) + '(')
+                for arg in node['args']:
+                    if not dfs_structure(arg, result):
+                        return False
+                result.append(')')
+            elif node['type'] == VAR:
+                result.append('V' + node['content'] + str(tuple(node['shape'])))
+            else:
+                result.append(str(node['type']) + str(tuple(node['shape'])))
+            return True
+
+        result = []
+        for key in sorted(self.variables):
+            variable = self.variables[key]
+            result.append('|' + key + str(np.shape(variable['value'])) + ':')
+            if variable['logic'] is not None and not dfs_structure(variable['logic'], result):
+                return None
+        return "".join(result)
+
+    def count_ops(self):
+        """
+        全変数のロジックに含まれるFUNCノードを演算名ごとに数える。
+
+        Returns:
+        --------
+        dict
+            ex) {'root': 5, 'mul': 2, 'dot': 1}
+        """
+        def dfs_count_ops(node, result):
+            if node['type'] == FUNC:
+                result[node['content']] = result.get(node['content'], 0) + 1
+                for arg in node['args']:
+                    dfs_count_ops(arg, result)
+
+        result = {}
+        for key in self.variables:
+            if self.variables[key]['logic']:
+                dfs_count_ops(self.variables[key]['logic'], result)
+        return result
+
     def select_random_node(self, logic, types=[FUNC, VAR, CONST, GVAL]):
         """
         ロジック木を深く探索し、指定した type (FUNC,VAR,CONST,GVALなど) のノード候補を集める。
@@ -498,7 +975,7 @@ class GPBase():
         全個体共通の基本的な突然変異。
         一定確率 (VAR_CREATION_RATE) で新しい変数を作るなど。
         """
-        if random.random() < self.VAR_CREATION_RATE:
+        if random.random() < self.VAR_CREATION_RATE and self.can_add_variable():
             self.make_variable()
 
     def tuning(self):
@@ -514,10 +991,82 @@ class GPBase():
             if not keys_with_logic:
                 break
             target_key = random.choice(keys_with_logic)
+            self.own_variable(target_key)
             _, node = self.select_random_node(self.variables[target_key]['logic'], [CONST])
             if node:
                 node['content'] = self.seed_const()
 
+    def get_const_nodes(self):
+        """
+        使用中の変数のロジックにあるCONSTノードを、変数の順・木の行きがけ順で返す。
+        """
+        def dfs_collect_const(node, result):
+            if node['type'] == CONST:
+                result.append(node)
+            elif node['type'] == FUNC:
+                for arg in node['args']:
+                    dfs_collect_const(arg, result)
+            return result
+
+        result = []
+        for variable in self.variables.values():
+            if variable['logic'] is not None and variable.get('used', True):
+                dfs_collect_const(variable['logic'], result)
+        return result
+
+    def get_constants(self):
+        """
+        定数の最適化用に、get_const_nodes() の値を並べたベクトルを返す。
+        """
+        return np.array([node['content'] for node in self.get_const_nodes()], dtype=np.float64)
+
+    def set_constants(self, vector):
+        """
+        get_constants() と同じ並びのベクトルで、CONSTノードの値を書き換える。
+        """
+        for key, variable in self.variables.items():
+            if variable['logic'] is not None and variable.get('used', True):
+                self.own_variable(key)
+        for node, value in zip(self.get_const_nodes(), vector):
+            node['content'] = float(value)
+
+    def subtree_crossover(self, subtree_index):
+        """
+        部分木交叉: 自分の木からノードを1つ選び、勝者の木にある同じshapeの部分木 (gp.subtree.SubtreeIndex)
+        のコピーで置き換える。donor が参照する変数を自分が同じshapeで持っていなければ、別のdonorを探す。
+
+        Returns:
+        --------
+        bool
+            置き換えができたらTrue
+        """
+        keys_with_logic = [
+            k for k,v in self.variables.items()
+            if v['logic'] is not None and v['used']
+        ]
+        if not keys_with_logic:
+            return False
+
+        target_key = random.choice(keys_with_logic)
+        self.own_variable(target_key)
+        _, node = self.select_random_node(self.variables[target_key]['logic'])
+        if node is None:
+            return False
+
+        op = node['content'] if self.SUBTREE_MATCH_OP and node['type'] == FUNC else None
+        for _ in range(self.SUBTREE_DONOR_TRIES):
+            donor, refs = subtree_index.lookup(node['shape'], op)
+            if donor is None:
+                return False
+            if all(key in self.variables and tuple(self.variables[key]['shape']) == shape
+                   for key, shape in refs.items()):
+                replacement = copy.deepcopy(donor)
+                node.clear()
+                node.update(replacement)
+                self.exec_schedule = None
+                return True
+        return False
+
     def mutation(self):
         """
         突然変異:
@@ -525,17 +1074,21 @@ class GPBase():
         2) 追加でmutation3(ノードを変数化)することも
         """
         def exec_mutation(var_name):
+            logic = self.variables[var_name]['logic']
+            _, node = self.select_random_node(logic)
+            # 木の深さが上限に近いときは包み込み(mutation2)をせず、残りの深さの範囲で再生成する
+            room = None
+            if self.MAX_TREE_DEPTH is not None and node:
+                room = self.MAX_TREE_DEPTH - self.get_node_depth(logic, node) - 1
             # 50%でmutation1, 50%でmutation2
-            if random.random() < 0.5:
-                _, node = self.select_random_node(self.variables[var_name]['logic'])
-                self.mutation1(node)
+            if random.random() < 0.5 or (room is not None and self.get_depth(logic) >= self.MAX_TREE_DEPTH):
+                self.mutation1(node, max_depth=room)
             else:
-                _, node = self.select_random_node(self.variables[var_name]['logic'])
-                self.mutation2(node)
+                self.mutation2(node, max_depth=room)
 
             # さらに50%の確率でmutation3
-            if random.random() < 0.5:
-                index, node = self.select_random_node(self.variables[var_name]['logic'], [FUNC])
+            if random.random() < 0.5 and self.can_add_variable():
+                index, node = self.select_random_node(logic, [FUNC])
                 if node:
                     self.mutation3(node, index)
 
@@ -547,14 +1100,18 @@ class GPBase():
             return
 
         target_key = random.choice(keys_with_logic)
+        self.own_variable(target_key)
         exec_mutation(target_key)
+        # 変数の参照が変わるので、計算順は次の post_action() / exec_calc() で作り直す
+        self.exec_schedule = None
 
-    def dfs_mutation1(self, node, depth=0):
+    def dfs_mutation1(self, node, depth=0, max_depth=None):
         """
         ノードをまるごと別の内容に再帰的に置き換える。
 
         depthが深い場合は定数や変数を優先し、浅い場合は関数を含むより大きなツリーを生成する可能性を上げる。
         use_gvalがTrueの場合はGVALも候補に含める。
+        max_depth が指定されていれば、このノードから下の深さをその値以内に抑える。
         """
         if self.use_gval:
             choice_list = [CONST, VAR, FUNC, GVAL]
@@ -562,7 +1119,7 @@ class GPBase():
             choice_list = [CONST, VAR, FUNC]
 
         # 深いところでは定数/変数だけにすることが多い(大きくしすぎない工夫)
-        if depth >= 2:
+        if depth >= 2 or (max_depth is not None and depth + 1 >= max_depth):
             if self.use_gval:
                 choice_list = [CONST, VAR, GVAL]
             else:
@@ -637,62 +1194,60 @@ class GPBase():
                     'shape': cs,
                     'id': new_id
                 }
-                self.dfs_mutation1(new_node, depth+1)
+                self.dfs_mutation1(new_node, depth+1, max_depth)
                 node['args'].append(new_node)
 
-    def mutation1(self, node):
+    def mutation1(self, node, max_depth=None):
         """
         mutation1: dfs_mutation1を実行し、ノードを大きく再生成する。
         """
         if node:
-            self.dfs_mutation1(node)
+            self.dfs_mutation1(node, max_depth=max_depth)
 
-    def mutation2(self, node):
+    def mutation2(self, node, max_depth=None):
         """
         mutation2: すでにあるノードを「別の関数」で包み込むなどの操作(関数挿入)を行う。
+        node の中身を新しいFUNCノードの子として退避し、node 自体を包み込むFUNCノードに書き換える。
+        (親ノードを探さずにその場で差し替えるので、node自身が子に入る循環参照も起きない)
+        max_depth が指定されていれば、他の引数を埋める部分木の深さを包み込むノードから数えてその値以内に抑える。
         """
-        def dfs_mutation2(target_node_id, cur_node):
-            if cur_node['type'] == FUNC and 'args' in cur_node:
-                for i, arg in enumerate(cur_node['args']):
-                    if arg['id'] == target_node_id:
-                        keys_list = list(self.FUNC_MASTER)
-                        if 'root' in keys_list:
-                            keys_list.remove('root')
-                        if not keys_list:
-                            return False
-
-                        func_name = random.choice(keys_list)
-                        insert_position = random.randint(0, self.FUNC_MASTER[func_name]['arg_count'] - 1)
-                        pinned_shape = [None]*self.FUNC_MASTER[func_name]['arg_count']
-                        pinned_shape[insert_position] = arg['shape']
-                        input_lineups = [self.variables[k]['shape'] for k in self.variables]
-                        child_shapes = self.FUNC_MASTER[func_name]['shapeRef'](arg['shape'], input_lineups, pinned_shape=pinned_shape)
-
-                        # arg 自体を新しいFUNCノードの中に再配置
-                        arg['id'] = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-                        arg['type'] = FUNC
-                        arg['content'] = func_name
-                        arg['args'] = [None]*self.FUNC_MASTER[func_name]['arg_count']
-                        arg['args'][insert_position] = arg
-
-                        # 他の引数スロットを埋める
-                        for idx, shape_ in enumerate(child_shapes):
-                            if idx == insert_position:
-                                continue
-                            new_id = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-                            new_node = {'shape': shape_, 'id': new_id}
-                            # ここでは mutation1 相当の操作を行って子ノードを生成
-                            self.mutation1(new_node)
-                            arg['args'][idx] = new_node
-                        return True
-
-                    # 再帰探索
-                    if dfs_mutation2(target_node_id, arg):
-                        return True
+        if not node or 'shape' not in node:
+            return False
+
+        keys_list = list(self.FUNC_MASTER)
+        if 'root' in keys_list:
+            keys_list.remove('root')
+        if not keys_list:
             return False
 
-        if node and 'id' in node:
-            dfs_mutation2(node['id'], node)
+        func_name = random.choice(keys_list)
+        insert_position = random.randint(0, self.FUNC_MASTER[func_name]['arg_count'] - 1)
+        pinned_shape = [None]*self.FUNC_MASTER[func_name]['arg_count']
+        pinned_shape[insert_position] = node['shape']
+        input_lineups = [self.variables[k]['shape'] for k in self.variables]
+        child_shapes = self.FUNC_MASTER[func_name]['shapeRef'](node['shape'], input_lineups, pinned_shape=pinned_shape)
+        if child_shapes is None:
+            return False
+
+        inner = dict(node)
+        node.clear()
+        node['id'] = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+        node['type'] = FUNC
+        node['content'] = func_name
+        node['shape'] = inner['shape']
+        node['args'] = [None]*self.FUNC_MASTER[func_name]['arg_count']
+        node['args'][insert_position] = inner
+
+        # 他の引数スロットを埋める
+        for idx, shape_ in enumerate(child_shapes):
+            if idx == insert_position:
+                continue
+            new_id = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+            new_node = {'shape': shape_, 'id': new_id}
+            # ここでは mutation1 相当の操作を行って子ノードを生成
+            self.mutation1(new_node, max_depth=None if max_depth is None else max_depth - 1)
+            node['args'][idx] = new_node
+        return True
 
     def mutation3(self, node, index):
         """
@@ -700,50 +1255,28 @@ class GPBase():
         その変数の中に旧nodeを root とする logic を持たせる操作。
 
         つまり 「一部のノードを変数化し、あとで再利用可能にする」 仕組み。
+        node はその場でVAR参照に書き換えるので、新しい変数は元の木から参照され続ける。
         """
-        import copy
-
-        def dfs_replace_object(cur_node, target_index, current_idx, replacement):
-            """
-            ツリーをDFSし、target_index番目のノードを replacement で置き換える。
-            """
-            if current_idx == target_index:
-                # 目指す場所にきたら replacement を返す
-                return replacement, current_idx + 1
-            updated_node = copy.deepcopy(cur_node)
-
-            # 子ノード(args)があれば再帰
-            if 'args' in cur_node:
-                updated_args = []
-                for arg in cur_node['args']:
-                    updated_arg, new_idx = dfs_replace_object(arg, target_index, current_idx, replacement)
-                    updated_args.append(updated_arg)
-                    current_idx = new_idx
-                updated_node['args'] = updated_args
-
-            return updated_node, current_idx
-
         random_string = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-        # この変数に置き換える
-        replacement = {
-            'type': VAR,
-            'content': random_string,
-            'shape': node['shape']
-        }
-        # 置き換え実行
-        _, _ = dfs_replace_object(node, index, 0, replacement)
+        # node の中身を新しい変数へ移し、node 自体はその変数への参照にする
+        inner = dict(node)
+        node.clear()
+        node['id'] = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+        node['type'] = VAR
+        node['content'] = random_string
+        node['shape'] = inner['shape']
 
         # 置き換え元のnodeを root として保持する変数を新規作成
         self.variables[random_string] = {
-            'value': np.tile(0, node['shape']),
+            'value': broadcast_leaf(0, inner['shape'], self.dtype),
             'logic': {
                 'type': FUNC,
                 'content': 'root',
-                'shape': node['shape'],
+                'shape': inner['shape'],
                 'ref': None,
-                'args': [node]
+                'args': [inner]
             },
-            'shape': node['shape'],
+            'shape': inner['shape'],
             'init_policy': random.choice(['random', 'zero', 'one']),
             'fixed': False,
             'used': True,
@@ -780,7 +1313,7 @@ class GPBase():
 
         # 上記のノードを rootとする新しい変数を作成
         new_variable = {
-            'value': np.tile(0, shape_for_new),
+            'value': broadcast_leaf(0, shape_for_new, self.dtype),
             'logic': {
                 'type': FUNC,
                 'content': 'root',
@@ -799,13 +1332,28 @@ class GPBase():
     def init_value(self):
         """
         変数の init_policy に従い、valueを初期化する。
-        'zero'→np.zeros, 'one'→np.ones, 'random'→np.random.rand
+        'zero'/'one'→0/1 を広げた読み取り専用のビュー (broadcast_leaf。配列は作らない)、
+        'random'→np.random.rand (いずれも self.dtype)。
+        疎行列の変数は 'zero' なら空のCSR行列、'random' なら密度 density の乱数のCSR行列にする
+        ('one' は疎にならないので、他の変数と同じビューのまま演算に渡す)。
+        それ以外の init_policy なら現在の値を self.dtype に揃えるだけ。
+        PRUNE_DEAD_VARIABLES がTrueなら未使用変数は初期化しない (計算でも参照されないため)。
         """
         for key in self.variables:
             variable = self.variables[key]
-            if variable['init_policy'] == 'zero':
-                variable['value'] = np.zeros(variable['shape'])
+            if self.PRUNE_DEAD_VARIABLES and not variable.get('used', True):
+                continue
+            if self.use_sparse and self.is_sparse_variable(variable) and variable['init_policy'] != 'one':
+                if variable['init_policy'] == 'zero':
+                    variable['value'] = sparse.zero_matrix(variable['shape'], self.dtype)
+                else:
+                    density = variable.get('density', self.SPARSE_DEFAULT_DENSITY)
+                    variable['value'] = sparse.random_matrix(variable['shape'], density, self.dtype)
+            elif variable['init_policy'] == 'zero':
+                variable['value'] = broadcast_leaf(0, variable['shape'], self.dtype)
             elif variable['init_policy'] == 'one':
-                variable['value'] = np.ones(variable['shape'])
+                variable['value'] = broadcast_leaf(1, variable['shape'], self.dtype)
             elif variable['init_policy'] == 'random':
-                variable['value'] = np.random.rand(*variable['shape'])
+                variable['value'] = np.asarray(np.random.rand(*variable['shape']), dtype=self.dtype)
+            else:
+                variable['value'] = np.asarray(variable['value'], dtype=self.dtype)
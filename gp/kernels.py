@@ -0,0 +1,144 @@
+# gp/kernels.py
+"""
+MatrixGP の演算本体 (カーネル)。
+
+- 小さな配列が多いので、Pythonレベルの処理(コピーや例外処理)を最小限にして
+  ufuncの out= / where= で中間配列を作らずに計算する
+- 浮動小数点エラーの扱いは呼び出し側(GPBase.exec_calc)の np.errstate に任せ、
+  ここでは try/except を行わない
+- 個体軸付きの配列を渡しても同じように動く (PopulationEngine からも使う)
+"""
+import numpy as np
+
+# add/mul の結果を丸める上下限 (util.filter の cap/threshold と同じ値)
+VALUE_CAP = 1000000
+VALUE_FLOOR = -10000000
+
+
+def clip_value(value):
+    """
+    VALUE_FLOOR 未満を VALUE_FLOOR に、VALUE_CAP 超を VALUE_CAP にする。NaNはそのまま。
+    ndarrayならその場で書き換える。
+    """
+    if isinstance(value, np.ndarray):
+        np.minimum(value, VALUE_CAP, out=value)
+        return np.maximum(value, VALUE_FLOOR, out=value)
+    return np.maximum(np.minimum(value, VALUE_CAP), VALUE_FLOOR)
+
+
+def root(a, shape=None):
+    return a
+
+
+def add(a, b, shape=None):
+    return clip_value(np.add(a, b))
+
+
+def multiple(a, b, shape=None):
+    return clip_value(np.multiply(a, b))
+
+
+def devide(a, b, shape=None):
+    # 0で割る要素は1で割る (=aのまま)。bそのものは書き換えない
+    return np.true_divide(a, np.where(b == 0, 1, b))
+
+
+def dot(a, b, shape=None):
+    return np.dot(a, b)
+
+
+def normalize(data, shape=None):
+    centered = np.asarray(data - np.mean(data))
+    std = np.std(data)
+    return np.divide(centered, std, out=centered, where=std != 0)
+
+
+def clip_min(a, threshold_value, shape=None):
+    return np.maximum(a, threshold_value)
+
+
+def clip_max(a, threshold_value, shape=None):
+    return np.minimum(a, threshold_value)
+
+
+def binarize(a, shape=None):
+    # 結果を a と同じdtypeにする (int64 になると以降の計算が float64 に昇格してしまう)
+    a = np.asarray(a)
+    return (a != 0).astype(a.dtype)
+
+
+def sum_0(input_array, shape=None):
+    return np.sum(input_array, axis=0)
+
+
+def sum_1(input_array, shape=None):
+    result = np.sum(input_array, axis=1)
+    if np.shape(result) == (1,):
+        return result[0]
+    return result
+
+
+# 以下、個体軸付きの演算 (各引数は (個体数, *元のshape) の配列。PopulationEngine用)
+def align(*arrays):
+    """
+    個体軸の直後に長さ1の次元を足して次元数を揃え、個体ごとのブロードキャストと同じ結果にする。
+    """
+    ndim = max(np.ndim(a) for a in arrays)
+    return [np.reshape(a, (np.shape(a)[0],) + (1,) * (ndim - np.ndim(a)) + np.shape(a)[1:]) for a in arrays]
+
+
+def batch_add(a, b, shape=None):
+    a, b = align(a, b)
+    return add(a, b)
+
+
+def batch_multiple(a, b, shape=None):
+    a, b = align(a, b)
+    return multiple(a, b)
+
+
+def batch_devide(a, b, shape=None):
+    a, b = align(a, b)
+    return devide(a, b)
+
+
+def batch_dot(a, b, shape=None):
+    if np.ndim(a) == 1 or np.ndim(b) == 1:
+        # どちらかが個体ごとにスカラーなら、np.dotは単なる積になる
+        a, b = align(a, b)
+        return a * b
+    subscripts = {
+        (2, 2): 'pi,pi->p',
+        (2, 3): 'pi,pij->pj',
+        (3, 2): 'pij,pj->pi',
+        (3, 3): 'pij,pjk->pik',
+    }
+    return np.einsum(subscripts[(np.ndim(a), np.ndim(b))], a, b)
+
+
+def batch_normalize(data, shape=None):
+    axes = tuple(range(1, np.ndim(data)))
+    centered = data - np.mean(data, axis=axes, keepdims=True)
+    std = np.std(data, axis=axes, keepdims=True)
+    return np.divide(centered, std, out=centered, where=std != 0)
+
+
+def batch_clip_min(a, threshold_value, shape=None):
+    a, threshold_value = align(a, threshold_value)
+    return np.maximum(a, threshold_value)
+
+
+def batch_clip_max(a, threshold_value, shape=None):
+    a, threshold_value = align(a, threshold_value)
+    return np.minimum(a, threshold_value)
+
+
+def batch_sum_0(input_array, shape=None):
+    return np.sum(input_array, axis=1)
+
+
+def batch_sum_1(input_array, shape=None):
+    result = np.sum(input_array, axis=2)
+    if np.shape(result)[1:] == (1,):
+        return result[:, 0]
+    return result
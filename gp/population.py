@@ -0,0 +1,146 @@
+# gp/population.py
+import time
+import numpy as np
+from collections import deque
+
+from gp.base import CONST, VAR, FUNC, GVAL
+
+
+class PopulationEngine():
+    """
+    同じ構造(定数の値だけが違う)の個体をまとめて、1回の演算で評価するエンジン。
+
+    - 各個体の get_structure_key() が一致するものをグループ化する
+    - グループ内の変数の値を先頭に個体軸(P)を足した配列に積み上げ、
+      BATCH_FUNC_MASTER の演算をグループ全体に1回だけ適用する
+    - 計算結果は各個体の replay に積んでおき、evaluation() 側の exec_calc() はそれを順に取り出すだけになる
+    - グループにできない個体や、一括計算に失敗したグループは従来どおり個体ごとに計算する
+    - グループの計算時間はメンバーで等分して各個体の eval_time に加える (評価の予算の判定に使う)
+    """
+
+    def __init__(self, min_group_size=2):
+        self.min_group_size = min_group_size
+        self.reset_stats()
+
+    def reset_stats(self):
+        # prepare() の集計 (一括計算できた個体数・対象の個体数・グループ数)。世代の始めに呼ぶ
+        self.stats = {'grouped': 0, 'total': 0, 'groups': 0}
+
+    def group_workers(self, workers):
+        """
+        構造キーごとに個体をまとめる。
+        """
+        groups = {}
+        for worker in workers:
+            key = worker.get_structure_key()
+            if key is None:
+                continue
+            groups.setdefault(key, []).append(worker)
+        return list(groups.values())
+
+    def prepare(self, workers, input_values_list):
+        """
+        init_value() 済みの個体について、input_values_list の全サンプルを一括計算し、
+        結果を各個体の replay に積む。
+
+        Parameters:
+        ----------
+        workers : list of GPBase
+        input_values_list : list of dict
+            サンプルごとの set_values() に渡す値 ex) [{'input': array}, ...]
+
+        stats は reset_stats() まで呼び出しをまたいで積算する。
+        """
+        self.stats['total'] += len(workers)
+        for group in self.group_workers(workers):
+            if len(group) < self.min_group_size:
+                continue
+            start = time.perf_counter()
+            try:
+                with group[0].numeric_scope():
+                    replays = self.run_group(group, input_values_list)
+            except Exception:
+                # 一括計算できないグループは個体ごとの計算に任せる (エラーもそちらで扱う)
+                replays = None
+            share = (time.perf_counter() - start) / len(group)
+            for worker in group:
+                worker.eval_time += share
+            if replays is None:
+                continue
+            for worker, replay in zip(group, replays):
+                worker.replay = deque(replay)
+            self.stats['grouped'] += len(group)
+            self.stats['groups'] += 1
+
+    def run_group(self, group, input_values_list):
+        """
+        グループ全体を個体軸付きの配列で計算し、個体ごとの各サンプルの値のリストを返す。
+        計算手順は GPBase.exec_calc と同じ (テンプレート個体の exec_schedule の順に変数を計算する)。
+        """
+        template = group[0]
+        count = len(group)
+        if template.exec_schedule is None:
+            template.build_schedule()
+        schedule = template.exec_schedule
+        batch_master = template.BATCH_FUNC_MASTER
+
+        # 変数の値を個体軸方向に積み上げる
+        values = {}
+        for key in template.variables:
+            values[key] = np.stack([np.asarray(w.variables[key]['value']) for w in group])
+
+        # 同じ位置にあるノードの定数を個体ごとに集めておく (ノードの並び順は全個体で同じ)
+        def dfs_collect(node, path, result, worker):
+            if node['type'] == CONST:
+                result.setdefault(path, []).append(node['content'])
+            elif node['type'] == GVAL:
+                result.setdefault(path, []).append(worker.get_gval(node['content']))
+            elif node['type'] == FUNC:
+                for i, arg in enumerate(node['args']):
+                    dfs_collect(arg, path + (i,), result, worker)
+
+        leaves = {}
+        for worker in group:
+            for key in template.variables:
+                if worker.variables[key]['logic'] is not None:
+                    dfs_collect(worker.variables[key]['logic'], (key,), leaves, worker)
+        leaves = {path: np.array(contents, dtype=template.dtype) for path, contents in leaves.items()}
+
+        def dfs_exec_calc(node, path):
+            if node['type'] == FUNC:
+                child_args = [dfs_exec_calc(arg, path + (i,)) for i, arg in enumerate(node['args'])]
+                result = batch_master[node['content']](*child_args, shape=node['shape'])
+                if np.shape(result) != (count,) + tuple(node['shape']):
+                    raise Exception("(E) SHAPE MISMATCH!")
+                return result
+
+            elif node['type'] in (CONST, GVAL):
+                # 個体ごとの値を広げた読み取り専用のビュー (個体数 x shape の配列は作らない)
+                leaf = leaves[path].reshape((count,) + (1,) * len(node['shape']))
+                return np.broadcast_to(leaf, (count,) + tuple(node['shape']))
+
+            elif node['type'] == VAR:
+                return values[node['content']]
+
+        replays = [[] for _ in group]
+        valid = np.ones(count, dtype=bool)
+        for input_values in input_values_list:
+            for key, value in input_values.items():
+                values[key] = np.broadcast_to(np.asarray(value, dtype=template.dtype),
+                                              (count,) + np.shape(value)).copy()
+
+            for key in schedule:
+                values[key] = dfs_exec_calc(template.variables[key]['logic'], (key,))
+            for key in template.SINK_VARIABLES:
+                valid &= np.isfinite(values[key]).reshape(count, -1).all(axis=1)
+
+            for index in range(count):
+                replays[index].append({key: value[index] for key, value in values.items()})
+
+        # 最後の値とNaN/infの検出結果を各個体に書き戻しておく
+        for index, worker in enumerate(group):
+            for key, value in values.items():
+                worker.variables[key]['value'] = value[index].copy()
+            if not valid[index]:
+                worker.numeric_valid = False
+        return replays
@@ -0,0 +1,104 @@
+# gp/profiler.py
+"""
+FUNC_MASTER の演算ごとの呼び出し回数・時間・入力シェイプ・例外/NaN発生を数えるプロファイラ。
+
+- GPBase.profiler に OpProfiler を設定すると、bake_logic() が演算を ProfiledOp で包んで紐付ける
+- profiler が None (既定) なら元の関数をそのまま紐付けるので、計測しないときの負担は無い
+- 集計は世代ごと (epoch) と全体 (total) の2つ。複数の個体で同じ OpProfiler を共有して集団全体を数える
+- PopulationEngine でまとめて計算した分 (BATCH_FUNC_MASTER) と、子プロセスで評価した分は数えない
+"""
+import time
+import numpy as np
+from collections import Counter
+
+from gp import sparse
+
+
+def _new_stats():
+    return {'calls': 0, 'time': 0.0, 'errors': 0, 'nonfinite': 0, 'shapes': Counter()}
+
+
+class OpProfiler():
+    """
+    演算名ごとの計測結果を保持する。
+
+    - calls: 呼び出し回数、time: 累積時間(秒)
+    - errors: 例外で終わった回数 (NUMPY_ERRSTATE で 'raise' にした場合の FloatingPointError など)
+    - nonfinite: 結果に NaN/inf を含んだ回数 (errstate 'ignore' での浮動小数点エラーに相当)
+    - shapes: 引数のシェイプの組ごとの回数
+    """
+
+    def __init__(self):
+        self.epoch = {}
+        self.total = {}
+        self._ops = {}
+
+    def __deepcopy__(self, memo):
+        # 個体を複製しても同じプロファイラで数え続ける
+        return self
+
+    def wrap(self, name, func):
+        """
+        func を計測付きの ProfiledOp にして返す (同じ name, func の組には同じものを返す)。
+        """
+        key = (name, func)
+        if key not in self._ops:
+            self._ops[key] = ProfiledOp(self, name, func)
+        return self._ops[key]
+
+    def record(self, name, elapsed, args, result=None, error=False):
+        shapes = tuple(np.shape(arg) for arg in args)
+        for table in (self.epoch, self.total):
+            stats = table.get(name)
+            if stats is None:
+                stats = table[name] = _new_stats()
+            stats['calls'] += 1
+            stats['time'] += elapsed
+            stats['shapes'][shapes] += 1
+            if error:
+                stats['errors'] += 1
+        if not error and not np.isfinite(sparse.stored_values(result)).all():
+            self.epoch[name]['nonfinite'] += 1
+            self.total[name]['nonfinite'] += 1
+
+    def reset_epoch(self):
+        self.epoch = {}
+
+    def report(self, scope='epoch', shape_count=3):
+        """
+        集計結果を時間の長い順に並べた文字列を返す。scope は 'epoch' か 'total'。
+        """
+        table = self.epoch if scope == 'epoch' else self.total
+        total_time = sum(stats['time'] for stats in table.values()) or 1
+        lines = [f"[OP PROFILE {scope}]"]
+        for name, stats in sorted(table.items(), key=lambda item: item[1]['time'], reverse=True):
+            shapes = ", ".join(f"{list(shape)}x{count}" for shape, count in stats['shapes'].most_common(shape_count))
+            lines.append(f"  {name:<5} calls={stats['calls']} time={stats['time']:.4f}s "
+                         f"({stats['time'] / total_time * 100:.1f}%) "
+                         f"per_call={stats['time'] / stats['calls'] * 1e6:.1f}us "
+                         f"errors={stats['errors']} nonfinite={stats['nonfinite']} shapes={shapes}")
+        return "\n".join(lines)
+
+
+class ProfiledOp():
+    """
+    FUNC_MASTER の関数を包んで、呼び出しごとに OpProfiler へ記録する。
+    """
+
+    def __init__(self, profiler, name, func):
+        self.profiler = profiler
+        self.name = name
+        self.func = func
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __call__(self, *args, shape=None):
+        start = time.perf_counter()
+        try:
+            result = self.func(*args, shape=shape)
+        except Exception:
+            self.profiler.record(self.name, time.perf_counter() - start, args, error=True)
+            raise
+        self.profiler.record(self.name, time.perf_counter() - start, args, result=result)
+        return result
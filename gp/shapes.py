@@ -0,0 +1,143 @@
+# gp/shapes.py
+"""
+MatrixGP の演算のシェイプ規則。
+
+- shape_*: 結果のシェイプから引数のシェイプの組を選ぶ (変異でノードを作るときの 'shapeRef')
+- infer_*: 引数のシェイプから結果のシェイプを求める (静的なシェイプ検査の 'shapeInfer')
+- *_flops: 引数と結果のシェイプから演算量を見積もる ('flopsInfer')
+- 個体の状態を使わない関数なので、FUNC_MASTER はクラスで1つだけ持てる
+"""
+import random
+import numpy as np
+
+
+def filter_pin(valid_combinations, pinned_shape):
+    filtered_combinations = []
+    for combo in valid_combinations:
+        matched = True
+        for idx, ps in enumerate(pinned_shape):
+            if ps is not None and np.shape(combo[idx]) != ps:
+                matched = False
+                break
+        if matched:
+            filtered_combinations.append(combo)
+    if filtered_combinations:
+        return random.choice(filtered_combinations)
+    else:
+        return None
+
+
+# 以下シェイプ判定用
+def shape_root(output_shape, input_lineups, pinned_shape=[None]):
+    return filter_pin([[output_shape]], pinned_shape)
+
+
+def shape_clip(output_shape, input_lineups, pinned_shape=[None, None]):
+    valid_combinations = [[output_shape, ()]]
+    return filter_pin(valid_combinations, pinned_shape)
+
+
+def shape_add(output_shape, input_lineups, pinned_shape=[None, None]):
+    if len(np.shape(output_shape)) == 0:
+        return [(), ()]
+    variables = []
+    if len(np.shape(output_shape)) == 2:
+        variables.append((np.shape(output_shape)[0], 1))
+        variables.append((np.shape(output_shape)[1],))
+    variables.append(())
+    variables.append(output_shape)
+
+    valid_combinations = [
+        [output_shape, random.choice(variables)],
+        [random.choice(variables), output_shape],
+    ]
+    return filter_pin(valid_combinations, pinned_shape)
+
+
+def shape_dot(output_shape, input_lineups, pinned_shape=[None, None]):
+    valid_combinations = []
+    for i in range(len(input_lineups)):
+        for j in range(len(input_lineups)):
+            if i != j and dot_shape(input_lineups[i], input_lineups[j]) == output_shape:
+                valid_combinations.append((input_lineups[i], input_lineups[j]))
+    return filter_pin(valid_combinations, pinned_shape)
+
+
+def dot_shape(shape_a, shape_b):
+    """
+    np.dot(a, b) の結果のシェイプを、配列を作らずにシェイプだけから求める。計算できない組み合わせはNone。
+    (大きな入力サイズで np.zeros を作って試すとメモリと時間がかかるため)
+    """
+    shape_a = tuple(shape_a)
+    shape_b = tuple(shape_b)
+    if len(shape_a) == 0:
+        return shape_b
+    if len(shape_b) == 0:
+        return shape_a
+    if len(shape_a) > 2 or len(shape_b) > 2:
+        return None
+    inner_b = shape_b[0] if len(shape_b) == 1 else shape_b[-2]
+    if shape_a[-1] != inner_b:
+        return None
+    return shape_a[:-1] + shape_b[:-2] + shape_b[-1:] if len(shape_b) == 2 else shape_a[:-1]
+
+
+def shape_sum0(output_shape, input_lineups, pinned_shape=[None]):
+    valid_combinations = []
+    if len(output_shape) > 1:
+        return None
+
+    if len(output_shape) == 0:
+        for item in input_lineups:
+            if len(item) == 1:
+                valid_combinations.append([item])
+    elif len(output_shape) == 1:
+        for item in input_lineups:
+            if len(item) == 2 and output_shape[0] == item[1]:
+                valid_combinations.append([item])
+    return filter_pin(valid_combinations, pinned_shape)
+
+
+def shape_sum1(output_shape, input_lineups, pinned_shape=[None]):
+    valid_combinations = []
+    if len(output_shape) == 1:
+        for item in input_lineups:
+            if len(item) == 2 and item[0] == output_shape[0]:
+                valid_combinations.append([item])
+    return filter_pin(valid_combinations, pinned_shape)
+
+
+# 以下、引数のシェイプから結果のシェイプを求める関数 (静的なシェイプ検査用。FUNC_MASTERの'shapeInfer')
+# 実際の演算 (gp.kernels) と同じ規則で求め、計算できない組み合わせならNoneを返す
+def infer_same(shape_a):
+    return tuple(shape_a)
+
+
+def infer_broadcast(shape_a, shape_b):
+    try:
+        return tuple(np.broadcast_shapes(tuple(shape_a), tuple(shape_b)))
+    except ValueError:
+        return None
+
+
+def infer_sum0(shape_a):
+    if len(shape_a) == 0:
+        return None
+    return tuple(shape_a[1:])
+
+
+def infer_sum1(shape_a):
+    if len(shape_a) < 2:
+        return None
+    result = tuple(shape_a[:1]) + tuple(shape_a[2:])
+    if result == (1,):
+        return ()
+    return result
+
+
+# 以下、引数と結果のシェイプから演算量を見積もる関数 (FUNC_MASTERの'flopsInfer'。無い演算は要素数で見積もる)
+def dot_flops(shape_a, shape_b, shape_result):
+    # 結果の1要素あたり、内積の長さぶんの積和 (スカラーとの積なら要素数ぶんの積)
+    if len(shape_a) == 0 or len(shape_b) == 0:
+        return int(np.prod(shape_result))
+    return 2 * int(shape_a[-1]) * int(np.prod(shape_result))
@@ -0,0 +1,182 @@
+# gp/sparse.py
+"""
+疎行列(CSR)の値を扱える MatrixGP の演算 (scipy.sparse があるときだけ有効)。
+
+- 変数に 'density' (非ゼロ要素の割合) が指定され、SPARSE_DENSITY_THRESHOLD 未満なら
+  その変数の値を CSR 行列で持つ (2次元の変数のみ)。init_policy 'sparse' でも同様
+- dot, mul, sm0, sm1, clm, clx, bin は疎のまま(または非ゼロ要素だけで)計算する
+- 疎のままにできない演算 (密な値との add, 疎でない側で割る dev, nrm など) は密な配列に戻してから
+  gp.kernels で計算する。その結果は密な配列なので、それ以降の演算も密になり、メモリも要素数に比例する
+- init_policy 'zero'/'one' の相手 (更新量など) は読み取り専用のブロードキャスト表示で持つので、
+  要素数分のメモリは確保しない。疎行列との mul はその表示のまま非ゼロ要素にだけ掛ける
+- 疎行列を使わない個体ではこのモジュールの関数はbakeされないので、密な計算の速度は変わらない
+- scipy は疎行列の変数が現れるまで読み込まない (起動を速くするため)
+"""
+import numpy as np
+
+from gp import kernels
+
+# scipy.sparse は読み込みに時間がかかるので、疎行列の変数が初めて現れたとき (available()) に読み込む。
+# 読み込む前は疎行列の値は存在しないので、is_sparse() などは常にFalseになる
+sp = None
+_loaded = False
+
+
+def available():
+    """
+    scipy.sparse を (まだなら) 読み込み、使えるならTrueを返す。scipyが無い環境では疎行列は使わない。
+    """
+    global sp, _loaded
+    if not _loaded:
+        _loaded = True
+        try:
+            import scipy.sparse as sp
+        except ImportError:
+            sp = None
+    return sp is not None
+
+
+def is_sparse(value):
+    return sp is not None and sp.issparse(value)
+
+
+def to_dense(value):
+    """
+    疎行列なら密なndarrayに、それ以外はそのまま返す。
+    """
+    if is_sparse(value):
+        return value.toarray()
+    return value
+
+
+def stored_values(value):
+    """
+    NaN/infチェック用に、実際に保持している値を返す (疎行列なら非ゼロ要素のみ)。
+    """
+    if is_sparse(value):
+        return value.data
+    return value
+
+
+def random_matrix(shape, density, dtype):
+    """
+    init_policy 'random' の疎版。非ゼロ要素は np.random.rand と同じ一様乱数。
+    位置は重複ありで引いて重複を除く (sp.random の非復元抽出は大きな行列だと遅いため)。
+    非ゼロ要素の数は density * 要素数 より少し少なくなることがある。
+    """
+    rows, cols = shape
+    count = int(round(density * rows * cols))
+    flat = np.unique(np.random.randint(0, rows * cols, size=count))
+    data = np.asarray(np.random.rand(len(flat)), dtype=dtype)
+    return sp.csr_matrix((data, (flat // cols, flat % cols)), shape=(rows, cols), dtype=dtype)
+
+
+def zero_matrix(shape, dtype):
+    return sp.csr_matrix(shape, dtype=dtype)
+
+
+def _with_data(matrix, data):
+    """
+    疎行列の非ゼロパターンはそのままで、値だけを差し替えた新しいCSR行列を返す。
+    """
+    result = matrix.tocsr(copy=True)
+    result.data = data
+    return result
+
+
+def _as_sparse_operand(a, b):
+    """
+    要素ごとの演算で、どちらか一方が疎行列なら (疎行列, もう一方) の順で返す。
+    """
+    if is_sparse(a):
+        return a, b
+    return b, a
+
+
+def root(a, shape=None):
+    return a
+
+
+def add(a, b, shape=None):
+    if is_sparse(a) and is_sparse(b):
+        result = (a + b).tocsr()
+        result.data = kernels.clip_value(result.data)
+        return result
+    return kernels.add(to_dense(a), to_dense(b))
+
+
+def multiple(a, b, shape=None):
+    if not (is_sparse(a) or is_sparse(b)):
+        return kernels.multiple(a, b)
+    matrix, other = _as_sparse_operand(a, b)
+    if is_sparse(other):
+        result = matrix.multiply(other).tocsr()
+    else:
+        # 疎行列の非ゼロ要素にだけ掛ける (暗黙の0はそのまま0)
+        result = sp.csr_matrix(matrix.multiply(np.asarray(other)))
+    result.data = kernels.clip_value(result.data)
+    return result
+
+
+def devide(a, b, shape=None):
+    if is_sparse(a) and not is_sparse(b):
+        # 0の要素は割っても0なので、非ゼロパターンを保ったまま逆数を掛ける
+        return sp.csr_matrix(a.multiply(1 / np.where(b == 0, 1, b)))
+    return kernels.devide(to_dense(a), to_dense(b))
+
+
+def dot(a, b, shape=None):
+    if not (is_sparse(a) or is_sparse(b)):
+        return kernels.dot(a, b)
+    if np.ndim(a) == 0 or np.ndim(b) == 0:
+        return multiple(a, b)
+    if is_sparse(b) and np.ndim(a) == 1:
+        # (n,) x (n,m): 転置して疎行列側から掛ける
+        return np.asarray(b.T.dot(a)).ravel()
+    result = a.dot(b) if is_sparse(a) else b.T.dot(a.T).T
+    if is_sparse(result):
+        return result.tocsr()
+    result = np.asarray(result)
+    if np.ndim(b) == 1:
+        return result.ravel()
+    return result
+
+
+def normalize(data, shape=None):
+    return kernels.normalize(to_dense(data))
+
+
+def clip_min(a, threshold_value, shape=None):
+    if is_sparse(a) and np.all(threshold_value <= 0):
+        # 閾値が0以下なら暗黙の0は変わらないので、非ゼロ要素だけ処理すればよい
+        return _with_data(a, np.maximum(a.data, threshold_value))
+    return kernels.clip_min(to_dense(a), threshold_value)
+
+
+def clip_max(a, threshold_value, shape=None):
+    if is_sparse(a) and np.all(threshold_value >= 0):
+        return _with_data(a, np.minimum(a.data, threshold_value))
+    return kernels.clip_max(to_dense(a), threshold_value)
+
+
+def binarize(a, shape=None):
+    if is_sparse(a):
+        result = _with_data(a, (a.data != 0).astype(a.dtype))
+        result.eliminate_zeros()
+        return result
+    return kernels.binarize(a)
+
+
+def sum_0(input_array, shape=None):
+    if is_sparse(input_array):
+        return np.asarray(input_array.sum(axis=0)).ravel()
+    return kernels.sum_0(input_array)
+
+
+def sum_1(input_array, shape=None):
+    if is_sparse(input_array):
+        result = np.asarray(input_array.sum(axis=1)).ravel()
+        if np.shape(result) == (1,):
+            return result[0]
+        return result
+    return kernels.sum_1(input_array)
@@ -0,0 +1,64 @@
+# gp/subtree.py
+import random
+
+from gp.base import VAR, FUNC
+
+
+class SubtreeIndex():
+    """
+    部分木交叉用の索引。世代ごとに勝者の木から作る。
+
+    - 勝者の使用中の変数にある部分木 (各ロジックの最上位ノードを除く) を shape ごとにまとめる
+    - FUNCノードは (shape, 演算名) ごとにもまとめる (演算の種類を揃える typed GP 用)
+    - lookup() は該当するまとまりからランダムに1つ返すだけなので O(1)
+    - 索引のノードは勝者の木そのもの。使う側で深くコピーしてから組み込むこと
+    """
+
+    def __init__(self, workers=()):
+        self.by_shape = {}  # shape -> [(ノード, 参照する変数名 -> shape), ...]
+        self.by_op = {}     # (shape, 演算名) -> 同上
+        for worker in workers:
+            self.add_worker(worker)
+
+    def add_worker(self, worker):
+        for variable in worker.variables.values():
+            if variable['logic'] is not None and variable.get('used', True):
+                self.add_logic(variable['logic'])
+
+    def add_logic(self, logic):
+        """
+        ロジック木の部分木を索引に加え、木全体が参照する変数名 -> shape を返す。
+        """
+        def dfs_add(node, depth):
+            refs = {}
+            if node['type'] == VAR:
+                refs[node['content']] = tuple(node['shape'])
+            elif node['type'] == FUNC:
+                for arg in node['args']:
+                    refs.update(dfs_add(arg, depth + 1))
+            if depth != 0:
+                shape = tuple(node['shape'])
+                entry = (node, refs)
+                self.by_shape.setdefault(shape, []).append(entry)
+                if node['type'] == FUNC:
+                    self.by_op.setdefault((shape, node['content']), []).append(entry)
+            return refs
+
+        return dfs_add(logic, 0)
+
+    def lookup(self, shape, op=None, rng=random):
+        """
+        shape (と op) が一致する部分木をランダムに1つ返す。無ければ (None, None)。
+
+        Returns:
+        --------
+        (dict, dict) or (None, None)
+            (部分木の根ノード, 参照する変数名 -> shape)
+        """
+        if op is None:
+            bucket = self.by_shape.get(tuple(shape))
+        else:
+            bucket = self.by_op.get((tuple(shape), op))
+        if not bucket:
+            return None, None
+        return rng.choice(bucket)
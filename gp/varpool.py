@@ -0,0 +1,110 @@
+# gp/varpool.py
+import hashlib
+import random
+import numpy as np
+
+from gp.base import VAR, FUNC
+from gp import sparse
+
+# init_value() で値を作り直す init_policy。これ以外の変数は値 (前の試行からの状態) を持ち越すので内容に含める
+RESET_POLICIES = ('zero', 'one', 'random')
+
+
+class VariablePool():
+    """
+    交叉(変数の入れ替え)用の変数プール。世代ごとに勝者の変数から作る。
+
+    - 変数を内容 (ロジックの構造・shape・init_policy・fixed) のハッシュで intern し、
+      同じ内容の変数は1つの実体にまとめる。init_policy が RESET_POLICIES 以外の変数は
+      値も内容に含める (勝者ごとに違う状態を、どの勝者から選んだかに関わらず1つにまとめないため)
+    - 実体ごとに、ロジックが参照している変数名を木を辿った順に索引しておく (依存索引)。
+      足りない変数の補完は、木を辿らずにこの索引を引くだけで行う
+    - 子の変数は実体の logic/value を共有したまま参照する (深いコピーをしない)。
+      変更する前に GPBase.own_variable() で自分専用のコピーを作る
+    - 勝者の変数はプールに入れた後も書き換えないこと (実体として子と共有される)
+    """
+
+    def __init__(self, workers=()):
+        self.entries = {}     # 内容のハッシュ -> 変数の実体
+        self.deps = {}        # 内容のハッシュ -> ロジックが参照する変数名 (行きがけ順)
+        self.candidates = {}  # 変数名 -> 内容のハッシュのリスト (勝者ごとに1つ。重複は選ばれやすさとして残す)
+        for worker in workers:
+            self.add_worker(worker)
+
+    def add_worker(self, worker):
+        for name, variable in worker.variables.items():
+            self.candidates.setdefault(name, []).append(self.intern(name, variable))
+
+    def intern(self, name, variable):
+        """
+        変数をプールに登録し、内容のハッシュを返す。同じ内容の変数が既にあればそれを使う。
+        """
+        parts = [name, str(tuple(variable['shape'])), str(variable['init_policy']), str(variable['fixed'])]
+        deps = []
+        if variable['logic'] is not None:
+            stack = [variable['logic']]
+            while stack:
+                node = stack.pop()
+                parts.append(f"{node['type']}:{node['content']}:{tuple(node['shape'])}")
+                if node['type'] == VAR:
+                    deps.append(node['content'])
+                elif node['type'] == FUNC:
+                    parts.append(str(len(node['args'])))
+                    stack.extend(reversed(node['args']))
+
+        m = hashlib.sha1('|'.join(parts).encode())
+        if variable['init_policy'] not in RESET_POLICIES:
+            _update_value_digest(m, variable['value'])
+        key = m.hexdigest()
+        if key not in self.entries:
+            self.entries[key] = variable
+            self.deps[key] = deps
+        return key
+
+    def choose(self, name, rng=random):
+        """
+        変数名 name の候補から1つ選び、内容のハッシュを返す。
+        """
+        return rng.choice(self.candidates[name])
+
+    def assemble(self, names, rng=random):
+        """
+        names の変数を候補からランダムに選び、それらが参照している変数も依存索引を辿って補う。
+
+        Returns:
+        --------
+        dict
+            変数名 -> 内容のハッシュ (names の順、続いて補った順)
+        """
+        chosen = {}
+        for name in names:
+            chosen[name] = self.choose(name, rng)
+
+        for name in names:
+            stack = [iter(self.deps[chosen[name]])]
+            while stack:
+                dep = next(stack[-1], None)
+                if dep is None:
+                    stack.pop()
+                elif dep not in chosen:
+                    chosen[dep] = self.choose(dep, rng)
+                    stack.append(iter(self.deps[chosen[dep]]))
+        return chosen
+
+    def make_variables(self, chosen):
+        """
+        assemble() の結果から子の variables を作る。
+        logic/value は実体と共有し、変数の辞書 (used などの管理用の値を書き込む) だけを複製する。
+        """
+        return {name: dict(self.entries[key]) for name, key in chosen.items()}
+
+
+def _update_value_digest(m, value):
+    # 値の dtype・shape・バイト列をハッシュに加える (疎行列なら非ゼロ要素とその位置)
+    if sparse.is_sparse(value):
+        arrays = [value.data, value.indices, value.indptr]
+    else:
+        arrays = [np.asarray(value)]
+    for array in arrays:
+        m.update(f"|{array.dtype.str}:{array.shape}|".encode())
+        m.update(np.ascontiguousarray(array).tobytes())
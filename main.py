@@ -7,9 +7,14 @@ from util.npjson import npobj2json
 from util.npjson import json2npobj  # 必要に応じて
 # ... 他、必要なところがあれば随時import
 
-if __name__ == '__main__':
-    INPUT_SIZE = 10
-    OUTPUT_SIZE = 3
+
+def make_default_obj(input_size, output_size, density=None):
+    """
+    初期個体のテンプレート (input/edge/output/sum_ratio/update) を作る。
+    density を指定すると edge をその密度の疎行列として扱う (入出力が大きいとき用)。
+    """
+    INPUT_SIZE = input_size
+    OUTPUT_SIZE = output_size
 
     default_obj = {
         'input': {
@@ -112,6 +117,16 @@ if __name__ == '__main__':
             'used': True,
         },
     }
+    if density is not None:
+        default_obj['edge']['density'] = density
+    return default_obj
+
+
+if __name__ == '__main__':
+    INPUT_SIZE = 10
+    OUTPUT_SIZE = 3
+
+    default_obj = make_default_obj(INPUT_SIZE, OUTPUT_SIZE)
 
     # ユーザ入力を受付
     counter = 0
@@ -21,13 +21,17 @@ class NeuralNetTest1(BaseEA):
     """
     def __init__(self, codelist=None, default_code="", diversity=5, attempts_count=10, 
                  workers_count=10, shuffle_interval=10, loops=10,
-                 input_size=3, output_size=2):
+                 input_size=3, output_size=2, dtype=np.float64):
         super().__init__(codelist=codelist, default_code=default_code,
                          diversity=diversity, attempts_count=attempts_count,
                          workers_count=workers_count, shuffle_interval=shuffle_interval,
                          loops=loops)
         self.input_size = input_size
         self.output_size = output_size
+        # 個体の計算とテストデータに使う型 (閾値0.5で離散化するのでfloat32でも十分)
+        self.dtype = np.dtype(dtype)
+        # 記録済みのテストデータ (ea.testdata.RecordedSequence)。指定するとランダム生成の代わりに使う
+        self.recorded = None
 
     def get_worker(self):
         # 文字列から8文字抜き出してMajorIDを作る
@@ -38,10 +42,17 @@ class NeuralNetTest1(BaseEA):
         return MatrixGP(
             majorid=majorid,
             gval_list=['reward'],
-            defined_shapes={'input_size': self.input_size, 'output_size': self.output_size},
-            use_gval=False
+            defined_shapes=self.get_defined_shapes(),
+            use_gval=False,
+            dtype=self.dtype
         )
 
+    def get_size_penalty(self, worker):
+        return worker.node_count
+
+    def get_defined_shapes(self):
+        return {'input_size': self.input_size, 'output_size': self.output_size}
+
     def descrete_output2(self, output):
         return_list = copy.deepcopy(output)
         return_list[return_list < 0.2] = 0
@@ -66,39 +77,61 @@ class NeuralNetTest1(BaseEA):
             return int((matching_count / total_elements) * 10)
 
     def count_output(self, output):
-        discrete_list = self.descrete_output(output)
-        total = int(np.sum(discrete_list))
-        return total
+        # 0.5以上の要素数 (descrete_outputの合計と同じ。NaNは数えない)
+        return int(np.count_nonzero(output >= 0.5))
 
     def get_testdata_list(self):
-        seeds = []
-        valid1 = {'content': np.random.randint(0, 2, size=(self.input_size, )).astype(np.float64), 'valid': True}
-        valid2 = {'content': np.random.randint(0, 2, size=(self.input_size, )).astype(np.float64), 'valid': True}
+        # ストリーミング評価ならジェネレータのまま返す (まとめて評価する場合と同じ順に乱数を使う)
+        if self.stream_chunk_size:
+            return self.iter_testdata()
+        return list(self.iter_testdata())
+
+    def iter_testdata(self):
+        if self.recorded is not None:
+            yield from self.recorded.iter_window(self.loops)
+            return
+
+        valid1 = {'content': np.random.randint(0, 2, size=(self.input_size, )).astype(self.dtype), 'valid': True}
+        valid2 = {'content': np.random.randint(0, 2, size=(self.input_size, )).astype(self.dtype), 'valid': True}
 
         for _ in range(self.loops):
             if random.random() < 0.2:
-                seeds.append(random.choice([valid1, valid2]))
+                yield random.choice([valid1, valid2])
             else:
-                seeds.append({'content': np.random.randint(0, 2, size=(self.input_size, )).astype(np.float64),
-                              'valid': False})
-        return seeds
-    
+                yield {'content': np.random.randint(0, 2, size=(self.input_size, )).astype(self.dtype),
+                       'valid': False}
+
     def evaluation(self, worker, input_list):
-        score = 0
-        test_count = int(len(input_list) * 0.2)
-        first_score = 0
-        last_score = 0
-        prev_content = np.zeros((self.input_size,))
-        prev_output = np.zeros((self.output_size,))
-
-        for index, data in enumerate(input_list):
-            worker.set_values({"input": data['content']})
+        state = self.begin_evaluation(worker, len(input_list))
+        self.evaluate_chunk(worker, state, input_list)
+        self.end_evaluation(worker, state)
+
+    def begin_evaluation(self, worker, length):
+        return {
+            'score': 0,
+            'index': 0,
+            'length': length,
+            'test_count': int(length * 0.2),
+            'first_score': 0,
+            'last_score': 0,
+            'prev_content': np.zeros((self.input_size,), dtype=self.dtype),
+            'prev_output': np.zeros((self.output_size,), dtype=self.dtype),
+        }
+
+    def evaluate_chunk(self, worker, state, chunk):
+        for data in chunk:
+            index = state['index']
+            worker.set_values(self.get_input_values(data))
             worker.exec_calc()
             out = worker.get_values()
 
-            output_array = out['output']
+            # 採点はfloat64で行う (float32でもスコアの積算で精度を落とさないように)
+            output_array = np.asarray(out['output'], dtype=np.float64)
             o_count = self.count_output(output_array)
             o_sum = sum(output_array)
+            # 途中のサンプルだけのNaN/infも合計に現れるので、出力を改めて走査せずにここで判定する
+            if not np.isfinite(o_sum):
+                worker.numeric_valid = False
 
             score_temp = 0
 
@@ -116,42 +149,44 @@ class NeuralNetTest1(BaseEA):
                     max_distance = distance_temp
             if max_distance is not None:
                 score_temp += max(0, 150 - max_distance * 10)
-                worker.progress[1] += max(0, 1 - max_distance)
+                worker.progress[0] += max(0, 1 - max_distance)
 
             # 評価2: validデータなら出力を大きく（o_sumで判定）
             if data['valid']:
                 score_temp += min(1, o_sum) * 40
-                worker.progress[2] += min(1, max(0, o_sum))
+                worker.progress[1] += min(1, max(0, o_sum))
             else:
-                worker.progress[2] += 1
+                worker.progress[1] += 1
 
             # 評価3: invalidデータなら出力は小さく（o_sumが大きいとペナルティ）
             if not data['valid']:
                 score_temp += max(0, o_sum) * -20
-                worker.progress[3] += max(0, 1 - max(0, o_sum))
+                worker.progress[2] += max(0, 1 - max(0, o_sum))
             else:
-                worker.progress[3] += 1
+                worker.progress[2] += 1
 
             # 評価4: 出力（1の数）が少ないほど良い (o_countが少ないほど加点)
             if o_count != 0:
                 score_temp += (self.output_size - o_count) * 10
                 if o_count != self.output_size:
-                    worker.progress[4] += (self.output_size - o_count) / 2
+                    worker.progress[3] += (self.output_size - o_count) / 2
             else:
-                worker.progress[4] += 1
+                worker.progress[3] += 1
 
             # 必要なら追加の評価5,6など
 
-            if index < test_count:
-                first_score += score_temp
-            elif index >= len(input_list) - test_count:
-                last_score += score_temp
-            score += score_temp
+            if index < state['test_count']:
+                state['first_score'] += score_temp
+            elif index >= state['length'] - state['test_count']:
+                state['last_score'] += score_temp
+            state['score'] += score_temp
+            state['index'] += 1
 
-            prev_content = data['content']
-            prev_output = output_array
+            state['prev_content'] = data['content']
+            state['prev_output'] = output_array
 
+    def end_evaluation(self, worker, state):
         # ノード数が多いほどペナルティ
-        score -= worker.node_count
+        score = state['score'] - self.get_size_penalty(worker)
 
-        worker.score_history.append(score)
+        worker.add_score(score)
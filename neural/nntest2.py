@@ -117,5 +117,5 @@ class NeuralNetTest2(BaseEA):
         # 最初より最後の方が改善してれば加算
         score += (last_score - first_score) * 10
 
-        worker.score_history.append(score)
+        worker.add_score(score)
 
@@ -0,0 +1,38 @@
+# tests/conftest.py
+import os
+import sys
+import random
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import make_default_obj
+from neural.nntest1 import NeuralNetTest1
+from util.npjson import npobj2json
+
+
+@pytest.fixture(autouse=True)
+def seed():
+    random.seed(0)
+    np.random.seed(0)
+
+
+@pytest.fixture
+def make_ea():
+    """
+    main.py の初期個体テンプレートで NeuralNetTest1 を作る。個体は init_workers() 済み。
+    """
+    def factory(input_size=10, output_size=3, density=None, workers_count=6, loops=20, attempts_count=2, **attrs):
+        code = npobj2json(make_default_obj(input_size, output_size, density=density))
+        ea = NeuralNetTest1(codelist=[code], default_code=code, diversity=2, attempts_count=attempts_count,
+                            workers_count=workers_count, shuffle_interval=5, loops=loops,
+                            input_size=input_size, output_size=output_size)
+        for name, value in attrs.items():
+            setattr(ea, name, value)
+        ea.init_workers()
+        for worker in ea.workers:
+            worker.post_action()
+        return ea
+    return factory
@@ -0,0 +1,34 @@
+# tests/test_bloat.py
+import random
+
+from gp.base import VAR
+
+
+def test_mutation2_fills_within_depth_room(make_ea, monkeypatch):
+    worker = make_ea().workers[0].clone()
+    # add での包み込みが必ず成功するように、引数のシェイプを結果と同じにする
+    entry = dict(worker.FUNC_MASTER['add'], shapeRef=lambda output_shape, input_lineups, pinned_shape=None:
+                 [output_shape, output_shape])
+    monkeypatch.setitem(worker.FUNC_MASTER, 'add', entry)
+
+    wrapped = 0
+    for _ in range(300):
+        node = {'id': 'x', 'type': VAR, 'content': 'edge', 'shape': worker.variables['edge']['shape']}
+        if worker.mutation2(node, max_depth=2):
+            wrapped += 1
+            assert worker.get_depth(node) <= 2
+    assert wrapped > 0
+
+
+def test_double_tournament_prefers_smaller_on_ties(make_ea):
+    ea = make_ea(selection='double_tournament', parsimony_pressure=1.0, tournament_size=2)
+    small = ea.workers[0].clone()
+    large = ea.workers[1].clone()
+    small.node_count, large.node_count = 5, 50
+    small.score = large.score = 10
+    small.majorid, large.majorid = 'small', 'large'
+    ea.workers = [small, large]
+    ea.rebuild_leaderboard()
+    random.seed(0)
+    winners = ea.get_winner_list()
+    assert winners[0] is small
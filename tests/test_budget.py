@@ -0,0 +1,31 @@
+# tests/test_budget.py
+import time
+
+
+def test_vectorized_group_time_is_charged_to_members(make_ea):
+    ea = make_ea(vectorize=True)
+    workers = [worker.clone() for worker in ea.workers]
+    for worker in workers:
+        worker.reset_score()
+        worker.init_value()
+    input_list = ea.get_testdata_list()
+
+    start = time.perf_counter()
+    ea.population_engine.prepare(workers, [ea.get_input_values(data) for data in input_list])
+    elapsed = time.perf_counter() - start
+
+    assert ea.population_engine.stats['grouped'] == len(workers)
+    charged = sum(worker.eval_time for worker in workers)
+    assert 0 < charged <= elapsed
+    assert all(worker.eval_time > 0 for worker in workers)
+
+
+def test_time_budget_applies_to_vectorized_workers(make_ea):
+    ea = make_ea(vectorize=True, eval_time_budget=1e-9, budget_penalty_score=-1)
+    children = [worker.clone() for worker in ea.workers]
+    ea.get_children = lambda: children
+    ea.exec_epoch(0)
+
+    assert all(worker.over_budget for worker in ea.workers)
+    assert all(worker.score == -1 for worker in ea.workers)
+    assert ea.budget_stats['aborted'] == len(ea.workers)
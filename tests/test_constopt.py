@@ -0,0 +1,77 @@
+# tests/test_constopt.py
+import numpy as np
+
+from gp.matrix import MatrixGP
+
+
+def snapshot(worker):
+    return {key: (repr(variable['logic']), np.array(variable['value'], copy=True))
+            for key, variable in worker.variables.items()}
+
+
+def assert_same(snapshot_a, snapshot_b):
+    assert snapshot_a.keys() == snapshot_b.keys()
+    for key in snapshot_a:
+        assert snapshot_a[key][0] == snapshot_b[key][0], key
+        np.testing.assert_array_equal(snapshot_a[key][1], snapshot_b[key][1])
+
+
+def test_constants_round_trip_in_const_node_order(make_ea):
+    worker = make_ea().workers[0].clone()
+    nodes = worker.get_const_nodes()
+    vector = worker.get_constants()
+    assert vector.tolist() == [node['content'] for node in nodes]
+
+    worker.set_constants(vector)
+    assert worker.get_constants().tolist() == vector.tolist()
+
+    new_vector = np.arange(len(vector)) + 0.5
+    worker.set_constants(new_vector)
+    assert [node['content'] for node in worker.get_const_nodes()] == new_vector.tolist()
+    assert worker.get_constants().tolist() == new_vector.tolist()
+
+
+def target_score(worker):
+    # 定数が 3 に近いほど高いスコア (テストデータには依存しない)
+    return -float(np.sum((worker.get_constants() - 3) ** 2))
+
+
+def test_optimize_constants_isolates_candidates_and_returns_best(make_ea, monkeypatch):
+    ea = make_ea(const_opt_population=6, const_opt_generations=3)
+    winner = ea.workers[0].clone()
+    winner.init_value()
+    winner_before = snapshot(winner)
+
+    evaluated = []
+    bases = []
+
+    real_evaluation = ea.evaluation
+
+    def evaluation(worker, input_list):
+        # 実際に評価して値を書き換えさせてから、スコアだけ定数で決まる値に置き換える
+        real_evaluation(worker, input_list)
+        history = worker.score_history.copy()
+        history[-1] = target_score(worker)
+        worker.score_history = history
+        evaluated.append(worker.get_constants())
+    ea.evaluation = evaluation
+
+    clone_for_evaluation = MatrixGP.clone_for_evaluation
+
+    def recording_clone_for_evaluation(self):
+        if not bases:
+            bases.append((self, snapshot(self)))
+        return clone_for_evaluation(self)
+    monkeypatch.setattr(MatrixGP, 'clone_for_evaluation', recording_clone_for_evaluation)
+
+    child = ea.optimize_constants(winner, ea.get_testdata_list())
+
+    assert len(evaluated) == 1 + 6 * 3
+    assert_same(snapshot(winner), winner_before)
+    base, base_before = bases[0]
+    assert_same(snapshot(base), base_before)
+
+    best = max(evaluated, key=lambda vector: -float(np.sum((vector - 3) ** 2)))
+    np.testing.assert_array_equal(child.get_constants(), best)
+    assert child.origin == 'tuning'
+    assert not np.array_equal(child.get_constants(), winner.get_constants())
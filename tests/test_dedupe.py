@@ -0,0 +1,57 @@
+# tests/test_dedupe.py
+import random
+
+import numpy as np
+
+from gp.base import CONST, FUNC
+
+
+def bloat_output(worker):
+    """
+    output のロジックを mul(元のロジック, 1) で包んだ、振る舞いが同じでノードが多い個体を返す。
+    """
+    child = worker.clone()
+    root = child.variables['output']['logic']
+    shape = root['shape']
+    root['args'][0] = {'id': 90, 'type': FUNC, 'content': 'mul', 'shape': shape, 'ref': None,
+                       'args': [root['args'][0], {'id': 91, 'type': CONST, 'content': 1, 'shape': shape}]}
+    assert child.post_action()
+    return child
+
+
+def test_bloated_twin_shares_behavior_hash(make_ea):
+    ea = make_ea()
+    source = ea.workers[0].clone()
+    twin = bloat_output(source)
+    assert twin.node_count > source.node_count
+    assert ea.get_behavior_hash(source) is not None
+    assert ea.get_behavior_hash(source) == ea.get_behavior_hash(twin)
+
+
+def test_size_penalty_is_the_only_score_difference(make_ea):
+    # 同じ乱数・同じテストデータで評価すると、スコアの差はノード数の差だけになる
+    ea = make_ea()
+    source = ea.workers[0].clone()
+    twin = bloat_output(source)
+    input_list = ea.get_testdata_list()
+    for worker in (source, twin):
+        random.seed(1)
+        np.random.seed(1)
+        worker.reset_score()
+        worker.init_value()
+        ea.evaluation(worker, input_list)
+    assert twin.score_history[0] == source.score_history[0] + source.node_count - twin.node_count
+
+
+def test_duplicate_inherits_score_with_its_own_size_penalty(make_ea):
+    ea = make_ea(semantic_dedupe=True)
+    source = ea.workers[0].clone()
+    twin = bloat_output(source)
+    ea.get_children = lambda: [source, twin]
+    ea.exec_epoch(0)
+
+    assert ea.dedupe_stats['inherited'] == 1
+    assert len(twin.score_history) == len(source.score_history) == ea.attempts_count
+    np.testing.assert_array_equal(twin.score_history,
+                                  source.score_history + source.node_count - twin.node_count)
+    assert twin.score < source.score
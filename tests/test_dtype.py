@@ -0,0 +1,83 @@
+# tests/test_dtype.py
+import numpy as np
+import pytest
+
+from gp import kernels
+from gp import sparse
+from gp.base import CONST, VAR, FUNC
+from gp.matrix import MatrixGP
+
+
+def func(content, shape, *args):
+    return {'id': content, 'type': FUNC, 'content': content, 'shape': shape, 'ref': None, 'args': list(args)}
+
+
+def projected():
+    # (10,) x (10, 3) -> (3,)
+    return func('dot', (3,), {'id': 'i', 'type': VAR, 'content': 'input', 'shape': (10,)},
+                {'id': 'e', 'type': VAR, 'content': 'edge', 'shape': (10, 3)})
+
+
+def output_logic(op):
+    if op in ('add', 'mul', 'dev'):
+        return func(op, (3,), projected(), projected())
+    if op in ('clm', 'clx'):
+        return func(op, (3,), projected(), {'id': 'c', 'type': CONST, 'content': 0.5, 'shape': ()})
+    if op == 'dot':
+        return projected()
+    if op == 'sm0':
+        return func(op, (3,), {'id': 'e', 'type': VAR, 'content': 'edge', 'shape': (10, 3)})
+    if op == 'sm1':
+        return func(op, (3,), {'id': 'c', 'type': CONST, 'content': 0.5, 'shape': (3, 4)})
+    return func(op, (3,), projected())
+
+
+def make_float32_ea(make_ea, **attrs):
+    return make_ea(dtype=np.dtype(np.float32), **attrs)
+
+
+def assert_float32(worker):
+    for key, variable in worker.variables.items():
+        assert np.asarray(sparse.to_dense(variable['value'])).dtype == np.float32, key
+
+
+@pytest.mark.parametrize('op', sorted(MatrixGP.FUNC_MASTER))
+def test_every_op_keeps_float32(make_ea, op):
+    ea = make_float32_ea(make_ea)
+    worker = ea.workers[0].clone()
+    worker.variables['output']['logic'] = output_logic(op)
+    assert worker.post_action()
+    assert worker.count_ops().get(op, 0) > 0
+    worker.init_value()
+    for data in ea.get_testdata_list()[:5]:
+        worker.set_values(ea.get_input_values(data))
+        worker.exec_calc()
+        assert_float32(worker)
+
+
+def test_mutated_genomes_keep_float32(make_ea):
+    ea = make_float32_ea(make_ea)
+    checked = 0
+    for _ in range(60):
+        worker = ea.workers[0].clone()
+        for _ in range(4):
+            worker.mutation()
+        if not worker.post_action():
+            continue
+        worker.init_value()
+        for data in ea.get_testdata_list()[:3]:
+            worker.set_values(ea.get_input_values(data))
+            worker.exec_calc()
+        assert_float32(worker)
+        checked += 1
+    assert checked > 0
+
+
+def test_binarize_keeps_dtype():
+    a = np.array([[0.0, 2.0], [-1.0, 0.0]], dtype=np.float32)
+    assert kernels.binarize(a).dtype == np.float32
+    np.testing.assert_array_equal(kernels.binarize(a), [[0, 1], [1, 0]])
+    if sparse.available():
+        result = sparse.binarize(sparse.sp.csr_matrix(a))
+        assert result.dtype == np.float32
+        np.testing.assert_array_equal(result.toarray(), [[0, 1], [1, 0]])
@@ -0,0 +1,87 @@
+# tests/test_fidelity.py
+import numpy as np
+
+from gp.base import VAR, FUNC
+
+
+def node_shapes(logic, result=None):
+    result = [] if result is None else result
+    result.append(tuple(logic['shape']))
+    if logic['type'] == FUNC:
+        for arg in logic['args']:
+            node_shapes(arg, result)
+    return result
+
+
+def shape_snapshot(worker):
+    return {key: (tuple(variable['shape']), np.shape(variable['value']),
+                  node_shapes(variable['logic']) if variable['logic'] else [])
+            for key, variable in worker.variables.items()}
+
+
+def with_dead_variable(worker):
+    """
+    output から辿れない変数 'dead' (edge をそのまま写すだけ) を持つ個体を返す。
+    """
+    child = worker.clone()
+    shape = child.variables['edge']['shape']
+    child.variables['dead'] = {
+        'name': 'dead', 'value': np.zeros(shape), 'shape': shape, 'init_policy': 'zero', 'fixed': False,
+        'used': True, 'var_score': 0,
+        'logic': {'id': 80, 'type': FUNC, 'content': 'root', 'shape': shape, 'ref': None,
+                  'args': [{'id': 81, 'type': VAR, 'content': 'edge', 'shape': shape}]},
+    }
+    assert child.post_action()
+    assert child.variables['dead']['used'] is False
+    return child
+
+
+def test_resize_does_not_touch_parent_shared_logic(make_ea):
+    ea = make_ea()
+    parent = with_dead_variable(ea.workers[0])
+    parent.PRUNE_DEAD_VARIABLES = True
+
+    copy_worker = parent.clone()
+    assert 'dead' in copy_worker.shared_variables
+    assert copy_worker.resize({'input_size': 4, 'output_size': 2})
+
+    assert set(node_shapes(copy_worker.variables['dead']['logic'])) == {(4, 2)}
+    assert set(node_shapes(parent.variables['dead']['logic'])) == {(10, 3)}
+    assert parent.variables['dead']['shape'] == (10, 3)
+    assert parent.variables['edge']['value'].shape == (10, 3)
+    assert parent.verify_shapes(parent.variables)
+
+
+def test_evaluate_fidelity_leaves_workers_unchanged(make_ea):
+    ea = make_ea(fidelity_levels=[{'settings': {'input_size': 4, 'output_size': 2, 'loops': 5},
+                                   'attempts': 1, 'promote_ratio': 0.5}])
+    workers = [with_dead_variable(worker) for worker in ea.workers[:3]]
+    for worker in workers:
+        worker.PRUNE_DEAD_VARIABLES = True
+    snapshots = [shape_snapshot(worker) for worker in workers]
+
+    scores = ea.evaluate_fidelity(workers, ea.fidelity_levels[0])
+
+    assert np.isfinite(scores).all()
+    assert (ea.input_size, ea.output_size, ea.loops) == (10, 3, 20)
+    assert [shape_snapshot(worker) for worker in workers] == snapshots
+
+
+def test_screening_is_not_counted_in_population_stats(make_ea):
+    level = {'settings': {'input_size': 4, 'output_size': 2, 'loops': 5}, 'attempts': 2, 'promote_ratio': 0.5}
+    ea = make_ea(vectorize=True, attempts_count=2, fidelity_levels=[level])
+    children = []
+    for _ in range(12):
+        worker = ea.workers[0].clone()
+        worker.tuning()
+        assert worker.post_action()
+        children.append(worker)
+    ea.get_children = lambda: children
+
+    ea.population_engine.stats = {'grouped': 3, 'total': 5, 'groups': 1}
+    ea.evaluate_fidelity(children, level)
+    assert ea.population_engine.stats == {'grouped': 3, 'total': 5, 'groups': 1}
+
+    ea.exec_epoch(0)
+    assert len(ea.workers) < len(children)
+    assert ea.population_engine.stats['total'] == ea.attempts_count * len(ea.workers)
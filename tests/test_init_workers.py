@@ -0,0 +1,59 @@
+# tests/test_init_workers.py
+from gp.matrix import MatrixGP
+from main import make_default_obj
+from neural.nntest1 import NeuralNetTest1
+from util.npjson import npobj2json
+
+
+def make_ea(codelist, default_code, workers_count=6):
+    return NeuralNetTest1(codelist=codelist, default_code=default_code, diversity=2, attempts_count=2,
+                          workers_count=workers_count, shuffle_interval=5, loops=20, input_size=10, output_size=3)
+
+
+def logic_snapshot(worker):
+    return {key: repr(variable['logic']) for key, variable in worker.variables.items()}
+
+
+def test_each_distinct_code_is_parsed_once(monkeypatch):
+    code_a = npobj2json(make_default_obj(10, 3))
+    code_b = npobj2json(make_default_obj(10, 3))
+    assert code_a != code_b
+    parsed = []
+    set_code = MatrixGP.set_code
+
+    def counting_set_code(self, json_str):
+        parsed.append(json_str)
+        return set_code(self, json_str)
+    monkeypatch.setattr(MatrixGP, 'set_code', counting_set_code)
+
+    ea = make_ea([code_a, code_b, code_a], code_a)
+    ea.init_workers()
+
+    assert sorted(parsed) == sorted([code_a, code_b])
+    assert len(ea.workers) == 6
+    assert [worker.score for worker in ea.workers] == [1, 1, 1, 0, 0, 0]
+    # 同じコードの個体はテンプレート (最初の個体) と logic を共有する
+    for worker in ea.workers[2:]:
+        assert worker.variables['edge']['logic'] is ea.workers[0].variables['edge']['logic']
+        assert worker.shared_variables == set(worker.variables)
+    assert ea.workers[1].variables['edge']['logic'] is not ea.workers[0].variables['edge']['logic']
+
+
+def test_copied_workers_are_copy_on_write():
+    code = npobj2json(make_default_obj(10, 3))
+    ea = make_ea([], code)
+    ea.init_workers()
+    template, copied, sibling = ea.workers[0], ea.workers[1], ea.workers[2]
+    before = [logic_snapshot(worker) for worker in (template, sibling)]
+
+    copied.own_variable('edge')
+    assert 'edge' not in copied.shared_variables
+    assert copied.variables['edge']['logic'] is not template.variables['edge']['logic']
+    copied.variables['edge']['logic']['args'][0]['content'] = 'add'
+    copied.variables['edge']['value'] = None
+    for _ in range(20):
+        copied.mutation()
+
+    assert [logic_snapshot(worker) for worker in (template, sibling)] == before
+    assert template.variables['edge']['value'] is not None
+    assert sibling.variables['edge']['value'] is not None
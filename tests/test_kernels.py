@@ -0,0 +1,133 @@
+# tests/test_kernels.py
+import numpy as np
+import pytest
+
+from gp import kernels
+from util import filter as ft
+
+
+# 以下、gp.kernels 以前の MatrixGP の演算 (比較用。浮動小数点エラー時の分岐は除く)
+def old_add(a, b):
+    return ft.threshold(ft.cap(a + b, 1000000, 1000000), -10000000, -10000000)
+
+
+def old_multiple(a, b):
+    return ft.threshold(ft.cap(a * b, 1000000, 1000000), -10000000, -10000000)
+
+
+def old_devide(a, b):
+    return a / ft.remove_zero(np.array(b, copy=True))
+
+
+def old_normalize(data):
+    mean = np.mean(data)
+    std = np.std(data)
+    # std == 0 のときは未初期化の値が返る (比較には std != 0 の入力だけを使う)
+    return np.divide(data - mean, std, out=None, where=std != 0)
+
+
+def old_sum_1(a):
+    result = np.sum(a, axis=1)
+    if np.shape(result) == (1,):
+        return result[0]
+    return result
+
+
+OLD_OPS = {
+    'add': old_add,
+    'multiple': old_multiple,
+    'devide': old_devide,
+    'dot': np.dot,
+    'normalize': old_normalize,
+    'clip_min': np.maximum,
+    'clip_max': np.minimum,
+    'binarize': lambda a: np.where(a == 0, 0, 1),
+    'sum_0': lambda a: np.sum(a, axis=0),
+    'sum_1': old_sum_1,
+}
+
+# 上限 (1e6) ・下限 (-1e7) ちょうどとその前後を含む入力
+EDGES = np.array([[999999.0, 1000000.0, 1000001.0], [-9999999.0, -10000000.0, -10000001.0],
+                  [0.0, -2.5, 3.0], [5e8, -5e8, 1.0]])
+ONES = np.array([1.0, 1.0, 1.0])
+MATRIX = np.array([[1.5, -2.0, 0.0], [4.0, 0.5, -3.0]])
+FACTOR = np.array([2.0, 0.0, -1.0])
+
+CASES = [
+    ('add', (EDGES, np.zeros(3))),
+    ('add', (EDGES, ONES)),
+    ('add', (EDGES, -ONES)),
+    ('add', (2.0, 3.0)),
+    ('add', (6e5, 6e5)),
+    ('multiple', (EDGES, ONES)),
+    ('multiple', (EDGES, FACTOR)),
+    ('multiple', (EDGES, 10.0)),
+    ('multiple', (2000.0, 600.0)),
+    ('devide', (MATRIX, FACTOR)),
+    ('devide', (MATRIX, 0.0)),
+    ('devide', (3.0, 0.0)),
+    ('dot', (np.array([1.0, -1.0]), MATRIX)),
+    ('dot', (MATRIX, np.array([1.0, 2.0, 3.0]))),
+    ('dot', (2.0, MATRIX)),
+    ('normalize', (MATRIX,)),
+    ('clip_min', (MATRIX, 0.0)),
+    ('clip_min', (MATRIX, 0.5)),
+    ('clip_max', (MATRIX, 0.0)),
+    ('clip_max', (MATRIX, -2.0)),
+    ('binarize', (MATRIX,)),
+    ('sum_0', (MATRIX,)),
+    ('sum_1', (MATRIX,)),
+    ('sum_1', (MATRIX[:1],)),
+]
+
+
+@pytest.mark.parametrize('name, args', CASES)
+def test_kernel_matches_previous_op(name, args):
+    expected = OLD_OPS[name](*args)
+    result = getattr(kernels, name)(*args)
+    assert np.shape(result) == np.shape(expected)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_values_are_clipped_at_cap_and_floor():
+    result = kernels.add(EDGES, np.zeros(3))
+    assert result.max() == kernels.VALUE_CAP
+    assert result.min() == kernels.VALUE_FLOOR
+    np.testing.assert_array_equal(result[0], [999999.0, 1000000.0, 1000000.0])
+    np.testing.assert_array_equal(result[1], [-9999999.0, -10000000.0, -10000000.0])
+    assert np.isnan(kernels.add(np.array([np.nan]), np.array([1.0])))[0]
+
+
+def test_devide_does_not_modify_divisor():
+    divisor = FACTOR.copy()
+    kernels.devide(MATRIX, divisor)
+    np.testing.assert_array_equal(divisor, FACTOR)
+
+
+def test_normalize_constant_input_is_centered():
+    # 以前は std == 0 のとき where= で書かれなかった要素が未初期化のまま返っていた
+    np.testing.assert_array_equal(kernels.normalize(np.full((2, 3), 4.0)), np.zeros((2, 3)))
+
+
+@pytest.mark.parametrize('name, batch_name, args', [
+    ('add', 'batch_add', (EDGES, ONES)),
+    ('multiple', 'batch_multiple', (EDGES, FACTOR)),
+    ('devide', 'batch_devide', (MATRIX, FACTOR)),
+    ('dot', 'batch_dot', (np.array([1.0, -1.0]), MATRIX)),
+    ('dot', 'batch_dot', (MATRIX, np.array([1.0, 2.0, 3.0]))),
+    ('dot', 'batch_dot', (2.0, MATRIX)),
+    ('normalize', 'batch_normalize', (MATRIX,)),
+    ('clip_min', 'batch_clip_min', (MATRIX, 0.5)),
+    ('clip_max', 'batch_clip_max', (MATRIX, -2.0)),
+    ('sum_0', 'batch_sum_0', (MATRIX,)),
+    ('sum_1', 'batch_sum_1', (MATRIX,)),
+    ('sum_1', 'batch_sum_1', (MATRIX[:1],)),
+])
+def test_batch_kernel_matches_per_worker_kernel(name, batch_name, args):
+    # 個体ごとに値を変えた3個体分を積み上げて計算し、1個体ずつの結果と比べる
+    scales = [1.0, -0.5, 3.0]
+    stacked = [np.stack([np.asarray(arg) * scale for scale in scales]) for arg in args]
+    result = getattr(kernels, batch_name)(*stacked)
+    for index, scale in enumerate(scales):
+        expected = getattr(kernels, name)(*[np.asarray(arg) * scale for arg in args])
+        np.testing.assert_allclose(result[index], expected, rtol=1e-12)
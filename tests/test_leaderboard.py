@@ -0,0 +1,50 @@
+# tests/test_leaderboard.py
+import random
+from types import SimpleNamespace
+
+from ea.leaderboard import Leaderboard
+
+
+def make_worker(majorid, score, node_count=10):
+    return SimpleNamespace(majorid=majorid, score=score, node_count=node_count)
+
+
+def test_keeps_best_worker_per_lineage_in_score_order():
+    board = Leaderboard()
+    a1, a2 = make_worker('a', 5), make_worker('a', 8)
+    b, c = make_worker('b', 7), make_worker('c', 9)
+    for worker in (a1, b, a2, c):
+        board.push(worker)
+
+    assert len(board) == 3
+    assert board.best() is c
+    assert board.top_k(3) == [c, a2, b]
+    assert not board.push(make_worker('a', 8))
+
+
+def test_ties_go_to_the_earlier_worker():
+    board = Leaderboard()
+    first, second = make_worker('a', 3), make_worker('b', 3)
+    board.push(first)
+    board.push(second)
+    assert board.top_k(2) == [first, second]
+
+
+def test_parsimony_resolution_prefers_smaller_within_resolution():
+    board = Leaderboard(parsimony_resolution=1.0)
+    large, small = make_worker('a', 3.9, node_count=50), make_worker('b', 3.1, node_count=5)
+    board.push(large)
+    board.push(small)
+    assert board.best() is small
+
+
+def test_tournament_returns_best_of_sample():
+    board = Leaderboard()
+    workers = [make_worker(str(index), index) for index in range(10)]
+    for worker in workers:
+        board.push(worker)
+    assert board.tournament(10, random.Random(0)) is workers[-1]
+    winner = board.tournament(3, random.Random(1))
+    assert winner in workers
+    board.clear()
+    assert board.tournament(3) is None and board.best() is None
@@ -0,0 +1,30 @@
+# tests/test_leaf.py
+import numpy as np
+import pytest
+
+from gp.base import broadcast_leaf
+
+
+def test_leaf_is_a_cached_read_only_view():
+    leaf = broadcast_leaf(0.5, (10, 3), np.float64)
+    assert leaf.shape == (10, 3) and leaf.dtype == np.float64
+    assert np.all(leaf == 0.5)
+    assert broadcast_leaf(0.5, (10, 3), np.float64) is leaf
+    assert broadcast_leaf(0.5, (10, 3), np.float32) is not leaf
+    assert leaf.base.nbytes <= leaf.itemsize
+    with pytest.raises(ValueError):
+        leaf[0, 0] = 1
+
+
+def test_unhashable_value_is_broadcast_without_cache():
+    value = np.arange(3.0)
+    leaf = broadcast_leaf(value, (10, 3), np.float64)
+    np.testing.assert_array_equal(leaf, np.tile(value, (10, 1)))
+    assert not leaf.flags.writeable
+
+
+def test_leaf_gives_the_same_result_as_a_full_array():
+    a = np.random.rand(10, 3)
+    np.testing.assert_array_equal(a * broadcast_leaf(2.0, (10, 3), np.float64), a * np.full((10, 3), 2.0))
+    x = np.random.rand(10)
+    np.testing.assert_allclose(x.dot(broadcast_leaf(1.0, (10, 3), np.float64)), x.dot(np.ones((10, 3))))
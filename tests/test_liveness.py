@@ -0,0 +1,54 @@
+# tests/test_liveness.py
+import numpy as np
+
+from gp.base import VAR, FUNC
+
+
+def add_variable(worker, name, ref):
+    shape = worker.variables[ref]['shape']
+    worker.variables[name] = {
+        'name': name, 'value': np.zeros(shape), 'shape': shape, 'init_policy': 'zero', 'fixed': False,
+        'used': True, 'var_score': 0,
+        'logic': {'id': name, 'type': FUNC, 'content': 'root', 'shape': shape, 'ref': None,
+                  'args': [{'id': name + '_arg', 'type': VAR, 'content': ref, 'shape': shape}]},
+    }
+
+
+def test_dead_cycle_is_not_kept_alive(make_ea):
+    worker = make_ea().workers[0].clone()
+    add_variable(worker, 'dead_a', 'edge')
+    add_variable(worker, 'dead_b', 'dead_a')
+    worker.variables['dead_a']['logic']['args'][0]['content'] = 'dead_b'
+    assert worker.post_action()
+
+    assert worker.variables['dead_a']['used'] is False
+    assert worker.variables['dead_b']['used'] is False
+    assert worker.dead_var_count == 2
+    assert all(worker.variables[key]['used'] for key in ('output', 'edge', 'input'))
+
+
+def test_dead_variables_are_deleted_after_ttl(make_ea):
+    worker = make_ea().workers[0].clone()
+    add_variable(worker, 'dead_a', 'edge')
+    add_variable(worker, 'dead_b', 'dead_a')
+    for _ in range(worker.UNUSED_VAR_TTL):
+        assert worker.post_action()
+        assert 'dead_a' in worker.variables
+    assert worker.post_action()
+
+    assert 'dead_a' not in worker.variables and 'dead_b' not in worker.variables
+    assert 'edge' in worker.variables
+    assert worker.dead_var_count == 2
+
+
+def test_dead_variable_is_revived_when_referenced(make_ea):
+    worker = make_ea().workers[0].clone()
+    add_variable(worker, 'dead_a', 'edge')
+    assert worker.post_action()
+    assert worker.variables['dead_a']['unused_count'] == 1
+
+    worker.variables['edge']['logic']['args'][0] = {'id': 'revive', 'type': VAR, 'content': 'dead_a',
+                                                     'shape': worker.variables['edge']['shape']}
+    assert worker.post_action()
+    assert worker.variables['dead_a']['used'] is True
+    assert worker.variables['dead_a']['unused_count'] == 0
@@ -0,0 +1,39 @@
+# tests/test_numeric.py
+import numpy as np
+import pytest
+
+
+def with_nan_sample(ea, index=3):
+    # 1サンプルだけ入力にNaNを入れる (edge は入力に依存しないので、NaNは出力のそのサンプルにしか出ない)
+    get_testdata_list = ea.get_testdata_list
+
+    def testdata():
+        data = list(get_testdata_list())
+        data[index] = dict(data[index], content=data[index]['content'].copy())
+        data[index]['content'][0] = np.nan
+        return data
+    ea.get_testdata_list = testdata
+
+
+@pytest.mark.parametrize('attrs', [{}, {'vectorize': True}, {'stream_chunk_size': 4}])
+def test_transient_nan_marks_worker_invalid(make_ea, attrs):
+    ea = make_ea(**attrs)
+    with_nan_sample(ea)
+    children = [worker.clone() for worker in ea.workers]
+    ea.get_children = lambda: children
+    ea.exec_epoch(0)
+
+    assert ea.invalid_count == len(ea.workers)
+    assert all(worker.score == ea.invalid_score for worker in ea.workers)
+
+
+def test_check_numeric_looks_at_sink_values(make_ea):
+    worker = make_ea().workers[0].clone()
+    worker.init_value()
+    worker.set_values({'input': np.ones(10)})
+    worker.exec_calc()
+    assert worker.check_numeric()
+
+    worker.variables['output']['value'] = np.array([0.0, np.inf, 0.0])
+    assert not worker.check_numeric()
+    assert not worker.numeric_valid
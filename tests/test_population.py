@@ -0,0 +1,70 @@
+# tests/test_population.py
+import copy
+import random
+
+import numpy as np
+
+from gp.population import PopulationEngine
+
+
+def tuned_workers(ea, count=8):
+    # 定数だけが違う (構造が同じ) 個体
+    workers = []
+    for _ in range(count):
+        worker = ea.workers[0].clone()
+        worker.tuning()
+        assert worker.post_action()
+        worker.reset_score()
+        worker.init_value()
+        workers.append(worker)
+    return workers
+
+
+def outputs(ea, worker, input_list):
+    result = []
+    for data in input_list:
+        worker.set_values(ea.get_input_values(data))
+        worker.exec_calc()
+        result.append({key: np.array(value) for key, value in worker.get_values().items()})
+    return result
+
+
+def test_batched_values_match_per_worker_values(make_ea):
+    ea = make_ea()
+    workers = tuned_workers(ea)
+    scalar = copy.deepcopy(workers)
+    input_list = ea.get_testdata_list()
+
+    engine = PopulationEngine()
+    engine.prepare(workers, [ea.get_input_values(data) for data in input_list])
+    assert engine.stats['grouped'] == len(workers)
+
+    for batched_worker, scalar_worker in zip(workers, scalar):
+        for batched, expected in zip(outputs(ea, batched_worker, input_list), outputs(ea, scalar_worker, input_list)):
+            for key in expected:
+                np.testing.assert_allclose(batched[key], expected[key], rtol=1e-12, atol=1e-12)
+
+
+def test_vectorized_epoch_scores_match_scalar_epoch(make_ea):
+    scores = {}
+    for vectorize in (False, True):
+        random.seed(3)
+        np.random.seed(3)
+        ea = make_ea(vectorize=vectorize)
+        children = tuned_workers(ea)
+        ea.get_children = lambda: children
+        ea.exec_epoch(0)
+        scores[vectorize] = [worker.score for worker in ea.workers]
+    np.testing.assert_allclose(scores[True], scores[False], rtol=1e-12)
+
+
+def test_stats_accumulate_over_the_epoch(make_ea):
+    ea = make_ea(vectorize=True, attempts_count=3)
+    children = tuned_workers(ea)
+    ea.get_children = lambda: children
+    ea.exec_epoch(0)
+    assert ea.population_engine.stats['total'] == 3 * len(children)
+    assert ea.population_engine.stats['grouped'] == 3 * len(children)
+
+    ea.exec_epoch(1)
+    assert ea.population_engine.stats['total'] == 3 * len(children)
@@ -0,0 +1,92 @@
+# tests/test_profiler.py
+from collections import Counter
+
+import numpy as np
+
+from gp.base import FUNC
+from gp.profiler import OpProfiler, ProfiledOp
+
+
+def refs(node, result):
+    if node['type'] == FUNC:
+        result.append(node)
+        for arg in node['args']:
+            refs(arg, result)
+    return result
+
+
+def func_nodes(worker):
+    return [node for variable in worker.variables.values() if variable['logic'] is not None
+            for node in refs(variable['logic'], [])]
+
+
+def expected_calls(ea, workers):
+    # exec_calc は1サンプルごとに exec_schedule の変数を1回ずつ計算する
+    calls = Counter()
+    for worker in workers:
+        for key in worker.exec_schedule:
+            for node in refs(worker.variables[key]['logic'], []):
+                calls[node['content']] += ea.attempts_count * ea.loops
+    return dict(calls)
+
+
+def fresh_children(ea):
+    children = [worker.clone() for worker in ea.workers]
+    for worker in children:
+        assert worker.post_action()
+    return children
+
+
+def test_plain_kernels_are_bound_without_profiling(make_ea):
+    ea = make_ea()
+    for worker in ea.workers:
+        assert worker.profiler is None
+        for node in func_nodes(worker):
+            assert node['ref'] is worker.FUNC_MASTER[node['content']]['func']
+            assert not isinstance(node['ref'], ProfiledOp)
+
+
+def test_profiled_epoch_counts_calls(make_ea):
+    ea = make_ea(profile_ops=True)
+    assert isinstance(ea.op_profiler, OpProfiler)
+    assert all(isinstance(node['ref'], ProfiledOp) for node in func_nodes(ea.workers[0]))
+
+    children = fresh_children(ea)
+    expected = expected_calls(ea, children)
+    ea.get_children = lambda: children
+    ea.exec_epoch(0)
+
+    epoch = ea.op_profiler.epoch
+    assert {name: stats['calls'] for name, stats in epoch.items()} == expected
+    assert all(stats['nonfinite'] == 0 and stats['errors'] == 0 for stats in epoch.values())
+    assert all(sum(stats['shapes'].values()) == stats['calls'] for stats in epoch.values())
+
+    second = fresh_children(ea)
+    second_expected = expected_calls(ea, second)
+    ea.get_children = lambda: second
+    ea.exec_epoch(1)
+
+    assert {name: stats['calls'] for name, stats in ea.op_profiler.epoch.items()} == second_expected
+    total = {name: stats['calls'] for name, stats in ea.op_profiler.total.items()}
+    assert total == dict(Counter(expected) + Counter(second_expected))
+    assert ea.op_profiler.report('total').startswith('[OP PROFILE total]')
+
+
+def test_nonfinite_results_are_counted(make_ea):
+    ea = make_ea(profile_ops=True)
+    get_testdata_list = ea.get_testdata_list
+
+    def testdata():
+        data = list(get_testdata_list())
+        data[3] = dict(data[3], content=data[3]['content'].copy())
+        data[3]['content'][0] = np.nan
+        return data
+    ea.get_testdata_list = testdata
+    children = fresh_children(ea)
+    ea.get_children = lambda: children
+    ea.exec_epoch(0)
+
+    epoch = ea.op_profiler.epoch
+    assert sum(stats['nonfinite'] for stats in epoch.values()) > 0
+    assert all(stats['nonfinite'] <= stats['calls'] for stats in epoch.values())
+    assert ea.op_profiler.total['dot']['nonfinite'] == epoch['dot']['nonfinite']
@@ -0,0 +1,49 @@
+# tests/test_racing.py
+from types import SimpleNamespace
+
+
+def make_worker(majorid, history):
+    return SimpleNamespace(majorid=majorid, score_history=history)
+
+
+def test_clearly_worse_lineages_are_raced_out(make_ea):
+    ea = make_ea(racing=True, diversity=2)
+    good = [make_worker('a', [100, 101]), make_worker('b', [90, 91])]
+    bad = make_worker('c', [10, 11])
+    assert ea.get_racing_losers(good + [bad]) == [bad]
+
+
+def test_overlapping_intervals_are_kept(make_ea):
+    ea = make_ea(racing=True, diversity=1)
+    workers = [make_worker('a', [100, 0]), make_worker('b', [90, 10])]
+    assert ea.get_racing_losers(workers) == []
+
+
+def test_worse_member_of_own_lineage_is_raced_out(make_ea):
+    ea = make_ea(racing=True, diversity=5)
+    best, worse = make_worker('a', [100, 101]), make_worker('a', [10, 11])
+    assert ea.get_racing_losers([best, worse]) == [worse]
+
+
+def test_no_racing_before_min_attempts(make_ea):
+    ea = make_ea(racing=True, diversity=1, racing_min_attempts=3)
+    workers = [make_worker('a', [100, 101]), make_worker('b', [10, 11])]
+    assert ea.get_racing_losers(workers) == []
+
+
+def test_racing_epoch_stops_losers_early(make_ea):
+    ea = make_ea(racing=True, racing_z=0.5, attempts_count=4, diversity=1, workers_count=8)
+    children = []
+    for index in range(8):
+        worker = ea.workers[0].clone()
+        worker.tuning()
+        assert worker.post_action()
+        worker.majorid = str(index)
+        children.append(worker)
+    ea.get_children = lambda: children
+    ea.exec_epoch(0)
+
+    lengths = [len(worker.score_history) for worker in ea.workers]
+    assert ea.racing_stats['aborted'] > 0
+    assert ea.racing_stats['saved_evals'] == sum(4 - length for length in lengths) * ea.loops
+    assert max(ea.workers, key=lambda worker: worker.score).score_history.size == 4
@@ -0,0 +1,93 @@
+# tests/test_schedule.py
+import numpy as np
+
+from gp.base import VAR, FUNC
+
+
+def refs(node, result):
+    if node['type'] == VAR:
+        result.append(node['content'])
+    elif node['type'] == FUNC:
+        for arg in node['args']:
+            refs(arg, result)
+    return result
+
+
+def test_dependencies_run_before_referrers(make_ea):
+    worker = make_ea().workers[0].clone()
+    assert worker.post_action()
+    schedule = worker.exec_schedule
+    position = {key: index for index, key in enumerate(schedule)}
+
+    assert schedule[-1] == 'output'
+    assert len(schedule) == len(set(schedule))
+    for key in schedule:
+        for dep in refs(worker.variables[key]['logic'], []):
+            if dep in position and (key, dep) not in worker.back_edges:
+                assert position[dep] < position[key]
+
+
+def test_cycles_read_previous_step_through_back_edges(make_ea):
+    worker = make_ea().workers[0].clone()
+    assert worker.post_action()
+    # edge は自分自身と sum_ratio を参照し、sum_ratio は edge を参照する
+    assert sorted(worker.back_edges) == [('edge', 'edge'), ('sum_ratio', 'edge')]
+    assert [sorted(component) for component in worker.variable_cycles] == [['edge', 'sum_ratio']]
+
+
+def test_unreachable_and_constant_variables_are_not_scheduled(make_ea):
+    worker = make_ea().workers[0].clone()
+    shape = worker.variables['edge']['shape']
+    worker.variables['dead'] = {
+        'name': 'dead', 'value': np.zeros(shape), 'shape': shape, 'init_policy': 'zero', 'fixed': False,
+        'used': True, 'var_score': 0,
+        'logic': {'id': 90, 'type': FUNC, 'content': 'root', 'shape': shape, 'ref': None,
+                  'args': [{'id': 91, 'type': VAR, 'content': 'edge', 'shape': shape}]},
+    }
+    assert worker.post_action()
+    assert 'dead' not in worker.exec_schedule
+    assert 'input' not in worker.exec_schedule
+
+
+def set_logic(worker, name, content, *refs):
+    shape = worker.variables['output']['shape']
+    args = [{'id': name + ref, 'type': VAR, 'content': ref, 'shape': shape} for ref in refs]
+    if name not in worker.variables:
+        worker.variables[name] = {'name': name, 'value': np.zeros(shape), 'shape': shape, 'init_policy': 'zero',
+                                  'fixed': False, 'used': True, 'var_score': 0}
+    worker.variables[name]['logic'] = {'id': name, 'type': FUNC, 'content': content, 'shape': shape,
+                                       'ref': None, 'args': args}
+
+
+def test_reads_of_finished_members_of_an_open_cycle_are_not_back_edges(make_ea):
+    worker = make_ea().workers[0].clone()
+    # output -> a -> (b, c), b -> a, c -> b : b は c より先に計算順に入るので c は今のステップの b を読む
+    set_logic(worker, 'output', 'root', 'a')
+    set_logic(worker, 'a', 'add', 'b', 'c')
+    set_logic(worker, 'b', 'root', 'a')
+    set_logic(worker, 'c', 'root', 'b')
+    assert worker.post_action()
+
+    assert worker.exec_schedule == ['b', 'c', 'a', 'output']
+    assert worker.back_edges == [('b', 'a')]
+    assert [sorted(component) for component in worker.variable_cycles] == [['a', 'b', 'c']]
+
+
+def test_every_sink_is_scheduled_and_computed(make_ea):
+    worker = make_ea().workers[0].clone()
+    shape = worker.variables['edge']['shape']
+    worker.variables['probe'] = {
+        'name': 'probe', 'value': np.zeros(shape), 'shape': shape, 'init_policy': 'zero', 'fixed': False,
+        'used': True, 'var_score': 0,
+        'logic': {'id': 92, 'type': FUNC, 'content': 'root', 'shape': shape, 'ref': None,
+                  'args': [{'id': 93, 'type': VAR, 'content': 'edge', 'shape': shape}]},
+    }
+    worker.SINK_VARIABLES = ['output', 'probe']
+    assert worker.post_action()
+    assert worker.variables['probe']['used']
+    assert worker.exec_schedule.index('probe') > worker.exec_schedule.index('edge')
+
+    worker.init_value()
+    worker.set_values({'input': np.ones(10)})
+    worker.exec_calc()
+    np.testing.assert_array_equal(worker.variables['probe']['value'], worker.variables['edge']['value'])
@@ -0,0 +1,45 @@
+# tests/test_scheduler.py
+import pytest
+
+from ea.scheduler import OperatorScheduler
+
+
+def test_untried_operators_share_evenly():
+    scheduler = OperatorScheduler(['crossover', 'mutation'])
+    assert scheduler.ratios() == {'crossover': 0.5, 'mutation': 0.5}
+
+
+def test_ratios_follow_gain_per_second_and_keep_minimum():
+    scheduler = OperatorScheduler(['crossover', 'tuning', 'mutation'], min_ratio=0.05)
+    scheduler.add_result('crossover', 9.0, 1.0)
+    scheduler.add_result('tuning', 1.0, 1.0)
+    scheduler.add_result('mutation', -5.0, 1.0)
+    ratios = scheduler.ratios()
+
+    assert sum(ratios.values()) == pytest.approx(1.0)
+    assert ratios['mutation'] == pytest.approx(0.05)
+    assert ratios['crossover'] == pytest.approx(0.05 + 0.85 * 0.9)
+    assert ratios['crossover'] > ratios['tuning'] > ratios['mutation']
+
+
+def test_cost_of_discarded_children_lowers_the_rate():
+    scheduler = OperatorScheduler(['crossover', 'mutation'])
+    scheduler.add_result('crossover', 1.0, 1.0)
+    scheduler.add_result('mutation', 1.0, 1.0)
+    scheduler.add_cost('mutation', 3.0)
+    assert scheduler.rates() == {'crossover': 1.0, 'mutation': 0.25}
+
+
+def test_untried_operator_counts_as_the_best():
+    scheduler = OperatorScheduler(['crossover', 'mutation'])
+    scheduler.add_result('crossover', 1.0, 1.0)
+    assert scheduler.ratios()['mutation'] == pytest.approx(0.5)
+
+
+def test_decay_keeps_rates_but_weights_new_results():
+    scheduler = OperatorScheduler(['crossover'], decay=0.5)
+    scheduler.add_result('crossover', 4.0, 2.0)
+    scheduler.next_epoch()
+    assert scheduler.rates()['crossover'] == pytest.approx(2.0)
+    scheduler.add_result('crossover', 0.0, 1.0)
+    assert scheduler.rates()['crossover'] == pytest.approx(1.0)
@@ -0,0 +1,32 @@
+# tests/test_scores.py
+import copy
+
+import numpy as np
+
+
+def test_add_score_grows_history(make_ea):
+    worker = make_ea().workers[0].clone()
+    worker.reset_score()
+    for score in range(10):
+        worker.add_score(score)
+    assert worker.score_history.tolist() == list(range(10))
+
+    worker.reset_score()
+    assert worker.score_history.size == 0
+
+
+def test_history_is_not_shared_between_copies(make_ea):
+    worker = make_ea().workers[0].clone()
+    worker.score_history = [1.0, 2.0]
+    for other in (worker.clone(), copy.deepcopy(worker)):
+        other.add_score(3.0)
+        other.score_history = other.score_history + 1
+        assert worker.score_history.tolist() == [1.0, 2.0]
+
+
+def test_history_setter_copies_the_source(make_ea):
+    worker = make_ea().workers[0].clone()
+    source = np.array([1.0, 2.0])
+    worker.score_history = source
+    source[0] = 100
+    assert worker.score_history.tolist() == [1.0, 2.0]
@@ -0,0 +1,58 @@
+# tests/test_shapes.py
+import numpy as np
+import pytest
+
+from gp import shapes
+from gp.base import FUNC
+
+
+@pytest.mark.parametrize('shape_a, shape_b', [
+    ((10,), (10, 3)), ((4, 10), (10, 3)), ((10, 3), (3,)), ((), (10, 3)), ((10, 3), ()), ((10,), (10,)),
+])
+def test_dot_shape_matches_numpy(shape_a, shape_b):
+    assert shapes.dot_shape(shape_a, shape_b) == np.dot(np.zeros(shape_a), np.zeros(shape_b)).shape
+
+
+@pytest.mark.parametrize('shape_a, shape_b', [((10,), (3, 10)), ((4, 10), (3,)), ((2, 2, 2), (2,))])
+def test_dot_shape_rejects_mismatch(shape_a, shape_b):
+    assert shapes.dot_shape(shape_a, shape_b) is None
+
+
+def test_infer_rules():
+    assert shapes.infer_broadcast((10, 3), (3,)) == (10, 3)
+    assert shapes.infer_broadcast((10, 3), (10,)) is None
+    assert shapes.infer_sum0((10, 3)) == (3,)
+    assert shapes.infer_sum0(()) is None
+    assert shapes.infer_sum1((10, 3)) == (10,)
+    assert shapes.infer_sum1((1, 3)) == ()
+    assert shapes.infer_sum1((3,)) is None
+
+
+def first_func_arg(logic):
+    for arg in logic['args']:
+        if arg['type'] == FUNC:
+            return arg
+    return None
+
+
+def test_verify_shapes_accepts_valid_worker(make_ea):
+    worker = make_ea().workers[0].clone()
+    assert worker.verify_shapes(worker.variables)
+    assert worker.shapes_verified
+
+
+def test_verify_shapes_rejects_wrong_node_shape(make_ea):
+    worker = make_ea().workers[0].clone()
+    node = first_func_arg(worker.variables['edge']['logic'])
+    node['shape'] = (3, 10)
+    assert not worker.verify_shapes(worker.variables)
+    assert not worker.post_action()
+
+
+def test_op_without_infer_falls_back_to_runtime_checks(make_ea, monkeypatch):
+    worker = make_ea().workers[0].clone()
+    node = first_func_arg(worker.variables['edge']['logic'])
+    entry = {key: value for key, value in worker.FUNC_MASTER[node['content']].items() if key != 'shapeInfer'}
+    monkeypatch.setitem(worker.FUNC_MASTER, node['content'], entry)
+    assert worker.verify_shapes(worker.variables)
+    assert not worker.shapes_verified
@@ -0,0 +1,64 @@
+# tests/test_sharedmem.py
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from ea import sharedmem
+
+
+def make_input_list(count=5):
+    return [{'content': np.random.rand(10), 'valid': bool(index % 2)} for index in range(count)]
+
+
+def test_attach_returns_the_same_values():
+    input_list = make_input_list()
+    with sharedmem.SharedTestData(input_list) as shared:
+        attached = sharedmem.attach(shared.handle)
+        assert len(attached) == len(input_list)
+        for data, expected in zip(attached, input_list):
+            np.testing.assert_array_equal(data['content'], expected['content'])
+            assert data['valid'] == expected['valid']
+        del attached, data
+        sharedmem._close_attached()
+
+
+def test_close_unlinks_the_block():
+    shared = sharedmem.SharedTestData(make_input_list())
+    name = shared.handle['name']
+    assert name in sharedmem._created
+    shared.close()
+    shared.close()
+
+    assert name not in sharedmem._created
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+@pytest.mark.parametrize('min_bytes, expected', [(0, 1), (1 << 30, 0)])
+def test_small_testdata_is_pickled(make_ea, monkeypatch, min_bytes, expected):
+    created = []
+
+    class RecordingSharedTestData(sharedmem.SharedTestData):
+        def __init__(self, input_list):
+            super().__init__(input_list)
+            created.append(self.handle['name'])
+
+    monkeypatch.setattr(sharedmem, 'SharedTestData', RecordingSharedTestData)
+    ea = make_ea(workers_count=2, loops=5, processes=2, share_testdata=True, share_testdata_min_bytes=min_bytes)
+    workers = [worker.clone() for worker in ea.workers]
+    for worker in workers:
+        worker.reset_score()
+        worker.init_value()
+    try:
+        assert ea.evaluate_parallel(workers, ea.get_testdata_list()) == []
+    finally:
+        ea.close_process_pool()
+
+    assert len(created) == expected
+    assert all(name not in sharedmem._created for name in created)
+    assert all(len(worker.score_history) == 1 for worker in workers)
+
+
+def test_shared_memory_is_off_by_default(make_ea):
+    assert make_ea().share_testdata is False
@@ -0,0 +1,75 @@
+# tests/test_sparse.py
+import numpy as np
+import pytest
+
+from gp import kernels
+from gp import sparse
+
+if not sparse.available():
+    pytest.skip('scipy.sparse がない', allow_module_level=True)
+
+
+@pytest.fixture
+def matrix():
+    value = sparse.random_matrix((40, 30), 0.1, np.float64)
+    value.data -= 0.5
+    return value
+
+
+def dense(value):
+    return np.asarray(sparse.to_dense(value))
+
+
+@pytest.mark.parametrize('name, make_args', [
+    ('dot', lambda m: (np.random.rand(40), m)),
+    ('dot', lambda m: (m, np.random.rand(30))),
+    ('multiple', lambda m: (m, np.random.rand(30))),
+    ('multiple', lambda m: (m, np.broadcast_to(np.ones(()), (40, 30)))),
+    ('multiple', lambda m: (m, m)),
+    ('devide', lambda m: (m, np.random.rand(30) + 0.5)),
+    ('add', lambda m: (m, m)),
+    ('add', lambda m: (m, np.random.rand(40, 30))),
+    ('clip_min', lambda m: (m, -0.1)),
+    ('clip_min', lambda m: (m, 0.1)),
+    ('clip_max', lambda m: (m, 0.1)),
+    ('clip_max', lambda m: (m, -0.1)),
+    ('binarize', lambda m: (m,)),
+    ('sum_0', lambda m: (m,)),
+    ('sum_1', lambda m: (m,)),
+    ('normalize', lambda m: (m,)),
+])
+def test_sparse_kernel_matches_dense_kernel(matrix, name, make_args):
+    args = make_args(matrix)
+    result = getattr(sparse, name)(*args)
+    expected = getattr(kernels, name)(*[dense(arg) for arg in args])
+    np.testing.assert_allclose(dense(result), expected, rtol=1e-12, atol=1e-12)
+
+
+def test_constant_init_is_not_allocated(make_ea):
+    worker = make_ea(input_size=300, output_size=200).workers[0].clone()
+    worker.init_value()
+    for variable in worker.variables.values():
+        if variable['init_policy'] in ('zero', 'one') and np.ndim(variable['value']) == 2:
+            value = variable['value']
+            assert not value.flags.writeable
+            assert value.base is not None and value.base.nbytes <= value.itemsize
+
+
+def test_sparse_worker_scores_like_dense_worker(make_ea):
+    dense_ea = make_ea(input_size=60, output_size=40)
+    sparse_ea = make_ea(input_size=60, output_size=40, density=0.05)
+    dense_worker = dense_ea.workers[0].clone()
+    sparse_worker = sparse_ea.workers[0].clone()
+    sparse_worker.init_value()
+    dense_worker.init_value()
+    edge = sparse_worker.variables['edge']['value']
+    assert sparse.is_sparse(edge)
+    dense_worker.variables['edge']['value'] = edge.toarray()
+    input_list = dense_ea.get_testdata_list()
+    for data in input_list:
+        for worker in (dense_worker, sparse_worker):
+            worker.set_values(dense_ea.get_input_values(data))
+            worker.exec_calc()
+        for key, expected in dense_worker.get_values().items():
+            np.testing.assert_allclose(dense(sparse_worker.get_values()[key]), dense(expected),
+                                       rtol=1e-12, atol=1e-12)
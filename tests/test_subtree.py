@@ -0,0 +1,79 @@
+# tests/test_subtree.py
+import random
+
+import pytest
+
+from gp.base import VAR, FUNC
+from gp.subtree import SubtreeIndex
+
+
+def make_winners(ea, count=4):
+    winners = []
+    while len(winners) < count:
+        worker = ea.workers[0].clone()
+        for _ in range(3):
+            worker.mutation()
+        if worker.post_action():
+            winners.append(worker)
+    return winners
+
+
+def var_refs(node, result=None):
+    result = {} if result is None else result
+    if node['type'] == VAR:
+        result[node['content']] = tuple(node['shape'])
+    elif node['type'] == FUNC:
+        for arg in node['args']:
+            var_refs(arg, result)
+    return result
+
+
+def logic_snapshot(workers):
+    return [{key: repr(variable['logic']) for key, variable in worker.variables.items()} for worker in workers]
+
+
+def test_index_buckets_match_shape_and_op(make_ea):
+    winners = make_winners(make_ea())
+    index = SubtreeIndex(winners)
+    roots = [id(variable['logic']) for worker in winners for variable in worker.variables.values()
+             if variable['logic'] is not None]
+
+    assert index.by_shape and index.by_op
+    for shape, bucket in index.by_shape.items():
+        for node, refs in bucket:
+            assert tuple(node['shape']) == shape
+            assert refs == var_refs(node)
+            assert id(node) not in roots
+    for (shape, op), bucket in index.by_op.items():
+        for node, refs in bucket:
+            assert node['type'] == FUNC and node['content'] == op and tuple(node['shape']) == shape
+
+    rng = random.Random(0)
+    for shape in index.by_shape:
+        node, _ = index.lookup(shape, rng=rng)
+        assert tuple(node['shape']) == shape
+    for shape, op in index.by_op:
+        node, _ = index.lookup(shape, op, rng=rng)
+        assert node['content'] == op
+    assert index.lookup((99, 99)) == (None, None)
+
+
+@pytest.mark.parametrize('match_op', [False, True])
+def test_crossover_children_verify_and_leave_winners_unchanged(make_ea, match_op):
+    winners = make_winners(make_ea())
+    for worker in winners:
+        worker.PRUNE_DEAD_VARIABLES = True
+        worker.SUBTREE_MATCH_OP = match_op
+    before = logic_snapshot(winners)
+    index = SubtreeIndex(winners)
+
+    crossed = 0
+    for _ in range(40):
+        for winner in winners:
+            child = winner.clone()
+            if not child.subtree_crossover(index):
+                continue
+            crossed += 1
+            assert child.verify_shapes([key for key, variable in child.variables.items() if variable['used']])
+    assert crossed > 0
+    assert logic_snapshot(winners) == before
@@ -0,0 +1,72 @@
+# tests/test_surrogate.py
+import random
+from types import SimpleNamespace
+
+import numpy as np
+
+from ea.surrogate import SurrogateModel
+
+
+def make_worker(node_count, score=0.0, ops=None, origin='mutation'):
+    ops = ops or {}
+    return SimpleNamespace(node_count=node_count, parent_score=0.0, origin=origin, score=score,
+                           count_ops=lambda: ops)
+
+
+def test_untrained_model_predicts_zero():
+    model = SurrogateModel(['root', 'add', 'mul'])
+    assert model.predict([make_worker(3), make_worker(5)]).tolist() == [0.0, 0.0]
+
+
+def test_features_count_ops_and_origin():
+    model = SurrogateModel(['root', 'add', 'mul'])
+    x = model.features(make_worker(7, ops={'mul': 2, 'root': 1}, origin='crossover'))
+    # node_count, parent_score, add, mul, origin one-hot
+    assert x.tolist() == [7, 0, 0, 2, 0, 1, 0, 0, 0]
+
+
+def test_fit_learns_a_linear_score():
+    model = SurrogateModel(['add', 'mul'], ridge=1e-6)
+    for node_count in range(1, 30):
+        model.add(make_worker(node_count, score=100 - 3 * node_count, ops={'add': node_count % 4}))
+    model.fit()
+    predicted = model.predict([make_worker(10, ops={'add': 2}), make_worker(40, ops={'add': 0})])
+    np.testing.assert_allclose(predicted, [70, -20], atol=1e-3)
+
+
+def test_old_samples_are_dropped():
+    model = SurrogateModel(['add'], max_samples=3)
+    for score in range(5):
+        model.add(make_worker(1, score=score))
+    assert len(model) == 3 and model.samples_y == [2, 3, 4]
+
+
+def test_screen_children_keeps_elites_and_best_predictions(make_ea):
+    ea = make_ea(workers_count=4, surrogate_explore_ratio=0.0)
+    ea.surrogate = SurrogateModel(['add'], ridge=1e-6)
+    for node_count in range(1, 20):
+        ea.surrogate.add(make_worker(node_count, score=-node_count))
+    ea.surrogate.fit()
+
+    elites = [make_worker(50), make_worker(60)]
+    candidates = [make_worker(node_count) for node_count in (9, 2, 7, 1, 5)]
+    random.seed(0)
+    selected = ea.screen_children(elites + candidates, elite_count=2)
+
+    assert selected[:2] == elites
+    assert [worker.node_count for worker in selected[2:]] == [2, 1]
+    assert ea.surrogate_stats['screened'] == 3
+
+
+def test_over_budget_workers_are_not_training_samples(make_ea):
+    ea = make_ea(use_surrogate=True, eval_time_budget=1e-9, budget_penalty_score=-1)
+    children = [worker.clone() for worker in ea.workers]
+    ea.get_children = lambda: children
+    ea.exec_epoch(0)
+    assert all(worker.over_budget and worker.numeric_valid for worker in ea.workers)
+    assert len(ea.surrogate) == 0
+
+    ea.workers[0].over_budget = False
+    ea.workers[0].score = 7.0
+    ea.train_surrogate()
+    assert ea.surrogate.samples_y == [7.0]
@@ -0,0 +1,66 @@
+# tests/test_varpool.py
+import random
+
+import numpy as np
+
+from gp.varpool import VariablePool
+
+
+def make_winners(ea, count=3):
+    winners = [worker.clone() for worker in ea.workers[:count]]
+    for index, worker in enumerate(winners):
+        worker.init_value()
+        # sum_ratio (init_policy '1') は試行をまたいで値を持ち越す
+        worker.variables['sum_ratio']['value'] = np.full(worker.variables['sum_ratio']['shape'], float(index))
+    return winners
+
+
+def test_carried_values_stay_per_winner(make_ea):
+    winners = make_winners(make_ea())
+    pool = VariablePool(winners)
+    assert len(set(pool.candidates['sum_ratio'])) == len(winners)
+    # 値を作り直す変数は、値が違っても内容が同じなら1つにまとめる
+    assert len(set(pool.candidates['edge'])) == 1
+
+    rng = random.Random(0)
+    seen = set()
+    for _ in range(50):
+        variables = pool.make_variables(pool.assemble(['sum_ratio'], rng))
+        seen.add(float(variables['sum_ratio']['value'][0]))
+    assert seen == {0.0, 1.0, 2.0}
+
+
+def test_assemble_closes_over_dependencies(make_ea):
+    pool = VariablePool(make_winners(make_ea()))
+    chosen = pool.assemble(['output'], random.Random(1))
+
+    assert list(chosen)[0] == 'output'
+    assert {'edge', 'update', 'sum_ratio'} <= set(chosen)
+    for name, key in chosen.items():
+        assert key in pool.candidates[name]
+        assert set(pool.deps[key]) <= set(chosen)
+
+
+def test_shared_variables_are_copied_on_write(make_ea):
+    winners = make_winners(make_ea())
+    pool = VariablePool(winners)
+    chosen = pool.assemble(['edge', 'output', 'input'], random.Random(2))
+    child = winners[0].clone(variables=pool.make_variables(chosen))
+    source = pool.entries[chosen['edge']]
+    logic_before = repr(source['logic'])
+    value_before = np.array(source['value'])
+
+    assert child.shared_variables == set(chosen)
+    assert child.variables['edge']['logic'] is source['logic']
+    assert child.variables['edge'] is not source
+
+    child.own_variable('edge')
+    assert 'edge' not in child.shared_variables
+    assert child.variables['edge']['logic'] is not source['logic']
+    child.variables['edge']['logic']['args'][0]['content'] = 'changed'
+    child.variables['edge']['value'] = np.zeros_like(value_before)
+    child.variables['edge']['used'] = False
+
+    assert repr(source['logic']) == logic_before
+    np.testing.assert_array_equal(source['value'], value_before)
+    assert source['used'] is True